@@ -1,21 +1,68 @@
+import logging
 from flask import Flask
 from app.blueprints.suspensions import suspend_unsuspend_blueprint
+from app.core.config import install_sighup_handler, get_config
+from app.core.metrics import render as render_metrics
+from app.services.worker import start_workers
+from app.services.notifications import start_dispatcher
+from app.services.warmup import get_warmup, start_warmup
 
 
 def create_app():
     """Factory method to create Flask app."""
     app = Flask(__name__)
 
+    # Reload the cached config snapshot on SIGHUP
+    install_sighup_handler()
+
+    # Drain jobs left in the queue by a previous run
+    try:
+        if get_config().job_queue_enabled:
+            start_workers()
+    except Exception as e:
+        logging.error(f"Job workers not started: {e}")
+
+    # Send queued client notifications (one dispatcher per host)
+    try:
+        if get_config().notify_outbox_enabled:
+            start_dispatcher()
+    except Exception as e:
+        logging.error(f"Notification dispatcher not started: {e}")
+
+    # Connect to routers and UISP before the first webhook needs them
+    try:
+        if get_config().warmup_enabled:
+            start_warmup()
+        else:
+            get_warmup().ready = True
+    except Exception as e:
+        logging.error(f"Warmup not started: {e}")
+        get_warmup().ready = True
+
     # Register blueprints
     app.register_blueprint(suspend_unsuspend_blueprint, url_prefix="/service_suspensions")
 
-    # Healthcheck endpoint
+    # Readiness: 503 until this worker has finished warming up
     @app.route("/healthz", methods=["GET"])
     def healthz():
-        return {"status": "ok"}, 200
+        warmup = get_warmup().status()
+        if not warmup["ready"]:
+            return {"status": "warming_up", "warmup": warmup}, 503
+        return {"status": "ok", "warmup": warmup}, 200
+
+    # Prometheus scrape endpoint (all workers when PROMETHEUS_MULTIPROC_DIR is set)
+    @app.route("/metrics", methods=["GET"])
+    def metrics():
+        body, content_type = render_metrics()
+        return body, 200, {"Content-Type": content_type}
 
     return app
 
 
-# Allow running via python -m flask or gunicorn
-app = create_app()
+def __getattr__(name):
+    # `flask --app app` looks up app.app; build it on first access only, so
+    # importing the package (as app.wsgi does) does not create a second app
+    if name == "app":
+        globals()["app"] = create_app()
+        return globals()["app"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -2,14 +2,31 @@ import logging
 import hmac
 import hashlib
 import json
+from datetime import datetime, timezone
 from flask import Blueprint, request, jsonify
-from app.services.suspensions import perform_action
-from app.core.config import load_config
-from app.models.idempotency import IdempotencyStore
+from app.services.suspensions import perform_action, perform_batch
+from app.services.async_suspensions import run_action
+from app.services.jobs import webhook_response, enqueue_webhook
+from app.services.worker import get_job_queue, start_workers
+from app.services.notifications import get_outbox
+from app.services.journal import get_journal
+from app.services.sharding import FORWARDED_HEADER, forward_webhook, node_stats, shard_key_for
+from app.core.config import get_config
+from app.core.metrics import WEBHOOKS, timed
+from app.core.resilience import resilience_stats
+from app.models.idempotency import get_idempotency_store
+from app.models.jobs import COALESCED
+from app.models.journal import cursor_of, parse_cursor
+from app.infra.lease_cache import lease_cache_stats
+from app.infra.notifier import invalidate_client
 
 suspend_unsuspend_blueprint = Blueprint("suspend_unsuspend", __name__)
 
 
+# UISP events that change a client's cached details or balance
+CLIENT_CACHE_EVENTS = ("client", "payment", "invoice", "credit_note", "refund")
+
+
 def verify_webhook_signature(payload_body: bytes, signature: str, secret: str) -> bool:
     """Verify UISP webhook signature using HMAC-SHA256."""
     if not signature or not secret:
@@ -25,21 +42,43 @@ def verify_webhook_signature(payload_body: bytes, signature: str, secret: str) -
     return hmac.compare_digest(signature, expected_signature)
 
 
+def read_signature_error(config):
+    """
+    401 response unless a read request carries X-UISP-Signature over its
+    path and query string (e.g. "/service_suspensions/journal?ip=..."),
+    or None. Unlike webhooks, reads fail closed without an app key.
+    """
+    signature = request.headers.get("X-UISP-Signature", "")
+    query = request.query_string.decode()
+    target = f"{request.path}?{query}" if query else request.path
+    if not (signature and config.uisp_app_key
+            and verify_webhook_signature(target.encode(), signature, config.uisp_app_key)):
+        logging.error(f"Signature verification failed for {request.path}")
+        return jsonify({"error": "Invalid signature"}), 401
+    return None
+
+
 @suspend_unsuspend_blueprint.route("/", methods=["POST"])
 def handle_suspend_unsuspend():
     """Main webhook endpoint for UISP service suspension/unsuspension."""
 
     # Verify webhook signature
-    config = load_config()
+    with timed("config_load"):
+        config = get_config()
     signature = request.headers.get("X-UISP-Signature", "")
     if not verify_webhook_signature(request.data, signature, config.uisp_app_key):
         logging.error("Webhook signature verification failed")
+        WEBHOOKS.labels("invalid").inc()
         return jsonify({"error": "Invalid webhook signature"}), 401
 
     data = request.get_json(force=True, silent=True)
     if not data:
+        WEBHOOKS.labels("invalid").inc()
         return jsonify({"error": "Invalid or missing JSON payload"}), 400
 
+    if data.get("entity") in CLIENT_CACHE_EVENTS:
+        return handle_client_event(data, config)
+
     try:
         change_type = data.get("changeType")
         webhook_uuid = data.get("uuid")
@@ -52,15 +91,26 @@ def handle_suspend_unsuspend():
         ip = ip_attr["value"] if ip_attr else None
 
         if not (change_type and client_id is not None and ip):
+            WEBHOOKS.labels("invalid").inc()
             return jsonify({"error": "Missing required fields (changeType, clientId, ipAddress)"}), 400
 
         logging.info(f"Webhook received: change={change_type} client={client_id} ip={ip} uuid={webhook_uuid}")
 
-        # Check for duplicate webhook using idempotency store
+        # Another node owns this router: let it claim, queue and apply the webhook
+        if config.shard_nodes and not request.headers.get(FORWARDED_HEADER):
+            site = shard_key_for(config, ip)
+            forwarded = forward_webhook(config, site, request.data, signature) if site else None
+            if forwarded is not None:
+                WEBHOOKS.labels("forwarded").inc()
+                headers = {k: forwarded.headers[k] for k in ("Content-Type", "Retry-After") if k in forwarded.headers}
+                return forwarded.content, forwarded.status_code, headers
+
+        # Claim the webhook uuid atomically; a concurrent or later retry loses the claim
+        idempotency_store = get_idempotency_store(config)
         if webhook_uuid:
-            idempotency_store = IdempotencyStore()
-            if idempotency_store.is_duplicate(webhook_uuid):
+            if not idempotency_store.claim(webhook_uuid, "service", str(entity_id), change_type):
                 logging.warning(f"Duplicate webhook detected: {webhook_uuid} - returning 200 OK without processing")
+                WEBHOOKS.labels("duplicate").inc()
                 return jsonify({
                     "ok": True,
                     "message": "Webhook already processed",
@@ -73,51 +123,269 @@ def handle_suspend_unsuspend():
         else:
             logging.warning("Webhook received without UUID - proceeding with caution (idempotency not guaranteed)")
 
+        if config.job_queue_enabled:
+            # Persist the job and answer before any router or notification I/O
+            try:
+                with timed("job_enqueue"):
+                    job, created = enqueue_webhook(config, {
+                        "changeType": change_type,
+                        "clientId": client_id,
+                        "ip": ip,
+                        "uuid": webhook_uuid,
+                        "entityId": entity_id,
+                    })
+            except Exception:
+                # Not queued, so let UISP's retry through
+                if webhook_uuid:
+                    idempotency_store.release(webhook_uuid)
+                raise
+            start_workers(config).wake()
+            WEBHOOKS.labels("queued" if created else "duplicate").inc()
+            if not created:
+                logging.warning(f"Duplicate webhook {webhook_uuid} already queued ({job['status']})")
+                message = "Webhook already queued"
+            elif job["status"] == COALESCED:
+                message = job["result"]["message"]
+            else:
+                message = "Queued for processing"
+            return jsonify({
+                "ok": True,
+                "message": message,
+                "uuid": job["uuid"],
+                "status": job["status"],
+                "duplicate": not created,
+                "action": change_type,
+                "clientId": str(client_id),
+                "ipAddress": ip,
+            }), 202
+
         # Perform the suspension/unsuspension action
-        result = perform_action(change_type, ip, client_id)
+        try:
+            with timed("perform_action"):
+                if config.async_pipeline:
+                    result = run_action(change_type, ip, client_id, config, webhook_uuid)
+                else:
+                    result = perform_action(change_type, ip, client_id, cfg=config, uuid=webhook_uuid)
+        except Exception:
+            if webhook_uuid:
+                idempotency_store.release(webhook_uuid)
+            raise
+        response = webhook_response(change_type, client_id, ip, result)
+
+        if result.get("retry_after") is not None:
+            # Router is shedding load: let UISP's retry bring the webhook back
+            if webhook_uuid:
+                idempotency_store.release(webhook_uuid)
+            WEBHOOKS.labels("deferred").inc()
+            return jsonify(response), 503, {"Retry-After": str(int(result["retry_after"]) + 1)}
 
         # Mark webhook as processed in idempotency store
         if webhook_uuid:
             try:
-                response_data = {
-                    "action": change_type,
-                    "clientId": str(client_id),
-                    "ipAddress": ip,
-                    "message": result.get("message"),
-                    "ok": result.get("ok", False),
-                }
-                if "notification_error" in result:
-                    response_data["notification_error"] = result["notification_error"]
-
                 idempotency_store.mark_processed(
                     webhook_uuid,
                     "service",
                     str(entity_id),
                     change_type,
-                    json.dumps(response_data)
+                    json.dumps(response)
                 )
             except Exception as e:
                 logging.error(f"Failed to mark webhook as processed: {e}")
                 # Continue processing even if idempotency tracking fails
 
-        response = {
-            "action": change_type,
-            "clientId": str(client_id),
-            "ipAddress": ip,
-            "message": result.get("message"),
-            "ok": result.get("ok", False),
-        }
-
-        if "notification_error" in result:
-            response["notification_error"] = result["notification_error"]
-
+        WEBHOOKS.labels("processed").inc()
         status_code = 200 if result.get("ok") else 202
         return jsonify(response), status_code
 
     except Exception as e:
         logging.exception("Error handling suspension webhook:")
+        WEBHOOKS.labels("error").inc()
         return jsonify({
             "detail": str(e),
             "note": "suspension service error",
             "status": "accepted"
         }), 202
+
+
+def handle_client_event(data: dict, config):
+    """Invalidate cached client details on UISP client/payment/invoice webhooks."""
+    entity = data.get("extraData", {}).get("entity") or {}
+    if data.get("entity") == "client":
+        client_id = data.get("entityId") or entity.get("id")
+    else:
+        client_id = entity.get("clientId")
+
+    if not client_id:
+        return jsonify({"ok": True, "message": "No client to invalidate"}), 200
+
+    try:
+        invalidate_client(config, int(client_id))
+    except Exception as e:
+        logging.error(f"Failed to invalidate client {client_id} cache: {e}")
+        return jsonify({"ok": False, "message": str(e)}), 202
+
+    logging.info(f"Client cache invalidated for {client_id} ({data.get('eventName')})")
+    return jsonify({"ok": True, "message": "Client cache invalidated", "clientId": str(client_id)}), 200
+
+
+@suspend_unsuspend_blueprint.route("/clients/prefetch", methods=["POST"])
+def prefetch_clients_endpoint():
+    """Queue a prefetch of all UISP clients into the client cache (run before billing)."""
+    config = get_config()
+    signature = request.headers.get("X-UISP-Signature", "")
+    if not verify_webhook_signature(request.data, signature, config.uisp_app_key):
+        return jsonify({"error": "Invalid webhook signature"}), 401
+
+    job, _ = get_job_queue(config).enqueue("prefetch_clients", {})
+    start_workers(config).wake()
+    return jsonify({"ok": True, "uuid": job["uuid"], "status": job["status"]}), 202
+
+
+@suspend_unsuspend_blueprint.route("/reconcile", methods=["POST"])
+def reconcile_endpoint():
+    """
+    Queue a reconciliation sweep between UISP and router block-access.
+    Body (optional): {"dryRun": false}. Always a full sweep; the report is the job result.
+    With SHARD_NODES only this node's routers are swept, so post it to every node.
+    """
+    config = get_config()
+    signature = request.headers.get("X-UISP-Signature", "")
+    if not verify_webhook_signature(request.data, signature, config.uisp_app_key):
+        return jsonify({"error": "Invalid webhook signature"}), 401
+
+    data = request.get_json(force=True, silent=True) or {}
+    job, _ = get_job_queue(config).enqueue(
+        "reconcile", {"dryRun": bool(data.get("dryRun"))}
+    )
+    start_workers(config).wake()
+    return jsonify({"ok": True, "uuid": job["uuid"], "status": job["status"]}), 202
+
+
+@suspend_unsuspend_blueprint.route("/batch", methods=["POST"])
+def handle_batch():
+    """
+    Bulk suspend/unsuspend.
+    Body: {"items": [{"changeType": "suspend", "clientId": 123, "ip": "100.64.0.10"}, ...]}
+    Returns one perform_action-style result per item, in order.
+    """
+    config = get_config()
+    signature = request.headers.get("X-UISP-Signature", "")
+    if not verify_webhook_signature(request.data, signature, config.uisp_app_key):
+        logging.error("Batch signature verification failed")
+        return jsonify({"error": "Invalid webhook signature"}), 401
+
+    data = request.get_json(force=True, silent=True)
+    items = data.get("items") if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "Expected a non-empty list of items"}), 400
+
+    for i, item in enumerate(items):
+        if not (isinstance(item, dict) and item.get("changeType") and item.get("ip") and "clientId" in item):
+            return jsonify({"error": f"Item {i}: missing required fields (changeType, clientId, ip)"}), 400
+        try:
+            item["clientId"] = int(item["clientId"])
+        except (TypeError, ValueError):
+            return jsonify({"error": f"Item {i}: clientId must be an integer"}), 400
+
+    logging.info(f"Batch received: {len(items)} items")
+    results = perform_batch(items, cfg=config)
+    return jsonify({"ok": all(r["ok"] for r in results), "results": results}), 200
+
+
+@suspend_unsuspend_blueprint.route("/jobs/<job_uuid>", methods=["GET"])
+def job_status(job_uuid: str):
+    """Outcome of a queued webhook, looked up by its UISP uuid. Signed like other reads."""
+    denied = read_signature_error(get_config())
+    if denied:
+        return denied
+    job = get_job_queue().get(job_uuid)
+    if not job:
+        return jsonify({"error": "Unknown job"}), 404
+
+    return jsonify({
+        "uuid": job["uuid"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "attempts": job["attempts"],
+        "result": job["result"],
+        "last_error": job["last_error"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+    }), 200
+
+
+@suspend_unsuspend_blueprint.route("/notifications/<int:client_id>", methods=["GET"])
+def notification_status(client_id: int):
+    """Delivery status of a client's recent notifications, newest first. Signed like other reads."""
+    denied = read_signature_error(get_config())
+    if denied:
+        return denied
+    return jsonify({"clientId": str(client_id), "notifications": get_outbox().history(client_id)}), 200
+
+
+JOURNAL_MAX_LIMIT = 1000
+
+
+def parse_time(value: str | None) -> float | None:
+    """Epoch seconds or ISO 8601 (UTC unless an offset is given)."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+@suspend_unsuspend_blueprint.route("/journal", methods=["GET"])
+def journal_query():
+    """
+    Suspend/unsuspend history from the action journal, newest first.
+    Query: clientId, ip, site, action, since, until (epoch seconds or ISO
+    8601; until is exclusive), limit. A full page carries next_cursor;
+    pass it back as cursor for the next one. Signed like other reads.
+    """
+    denied = read_signature_error(get_config())
+    if denied:
+        return denied
+    args = request.args
+    try:
+        client_id = int(args["clientId"]) if args.get("clientId") else None
+        since, until = parse_time(args.get("since")), parse_time(args.get("until"))
+        limit = min(max(int(args.get("limit", 100)), 1), JOURNAL_MAX_LIMIT)
+        cursor = args.get("cursor")
+        if cursor:
+            parse_cursor(cursor)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid query: {e}"}), 400
+
+    entries = get_journal().query(since=since, until=until, limit=limit, action=args.get("action"),
+                                  cursor=cursor, client_id=client_id, ip=args.get("ip"), site=args.get("site"))
+    response = {"entries": entries}
+    if len(entries) == limit:
+        response["next_cursor"] = cursor_of(entries[-1])
+    return jsonify(response), 200
+
+
+@suspend_unsuspend_blueprint.route("/lease_cache", methods=["GET"])
+def lease_cache_status():
+    """Per-router lease cache hit rate and staleness for this worker."""
+    return jsonify(lease_cache_stats()), 200
+
+
+@suspend_unsuspend_blueprint.route("/shards", methods=["GET"])
+def shard_status():
+    """Router ownership: this worker's share among the host's processes, and each site's node."""
+    config = get_config()
+    pool = start_workers(config) if config.job_queue_enabled else None
+    shard = pool.shard.stats() if pool is not None and pool.shard is not None else None
+    return jsonify({"processes": shard, **node_stats(config)}), 200
+
+
+@suspend_unsuspend_blueprint.route("/routers", methods=["GET"])
+def router_status():
+    """Per-router circuit breaker and bulkhead state for this worker."""
+    return jsonify(resilience_stats()), 200
@@ -1,20 +1,29 @@
 import os
 import json
-from dataclasses import dataclass
+import signal
+import logging
+import threading
+from dataclasses import dataclass, field
 from dotenv import load_dotenv
+from app.core.routing import RouterIndex
 
 # Load environment variables from centralized /etc/uisp path
 ENV_PATH = "/etc/uisp/uisp.env"
-if os.path.exists(ENV_PATH):
-    load_dotenv(ENV_PATH)
-else:
-    # Fallback to old path for backward compatibility
-    legacy_path = "/etc/uisp_suspend_unsuspend/uisp_suspend_unsuspend.env"
-    if os.path.exists(legacy_path):
-        load_dotenv(legacy_path)
+LEGACY_ENV_PATH = "/etc/uisp_suspend_unsuspend/uisp_suspend_unsuspend.env"
 
 
-@dataclass
+def _load_env_file(override: bool = False):
+    if os.path.exists(ENV_PATH):
+        load_dotenv(ENV_PATH, override=override)
+    elif os.path.exists(LEGACY_ENV_PATH):
+        # Fallback to old path for backward compatibility
+        load_dotenv(LEGACY_ENV_PATH, override=override)
+
+
+_load_env_file()
+
+
+@dataclass(frozen=True)
 class Router:
     site: str
     name: str
@@ -22,9 +31,21 @@ class Router:
     username: str
     password: str
     router_ip_range: str
+    # "rest" (default), or the native RouterOS API: "api" (8728) / "api-ssl" (8729)
+    transport: str = "rest"
+    api_port: int | None = None
+    # "lease" toggles DHCP lease block-access; "address_list" adds suspended IPs
+    # to a firewall address-list (works for static and PPPoE clients too)
+    suspend_mode: str = "lease"
+    address_list: str = "uisp-suspended"
+
+    @property
+    def ip_ranges(self) -> list[str]:
+        """CIDR ranges served by this router (comma-separated in router_ip_range)."""
+        return [r.strip() for r in self.router_ip_range.split(",") if r.strip()]
 
 
-@dataclass
+@dataclass(frozen=True)
 class AppConfig:
     env: str
     bind_ip: str
@@ -37,7 +58,60 @@ class AppConfig:
     whatsapp_phone_id: str
     whatsapp_token: str
     tls_verify: bool
-    routers: list[Router]
+    routers: tuple[Router, ...]
+    lease_cache_enabled: bool = True
+    lease_cache_refresh_seconds: float = 300
+    lease_cache_max_entries: int = 50000
+    state_dir: str = "/var/lib/uisp_suspend_unsuspend"
+    job_queue_enabled: bool = True
+    job_workers: int = 4
+    job_max_attempts: int = 5
+    job_retry_backoff_seconds: float = 10
+    job_retention_days: float = 7
+    coalesce_window_seconds: float = 5
+    warmup_enabled: bool = True
+    warmup_timeout_seconds: float = 20
+    warmup_lease_cache: bool = True
+    async_pipeline: bool = False
+    journal_enabled: bool = True
+    journal_batch_size: int = 500
+    journal_flush_seconds: float = 1
+    journal_retention_months: int = 12
+    shard_enabled: bool = False
+    shard_heartbeat_seconds: float = 5
+    shard_router_concurrency: int = 1
+    shard_nodes: tuple[str, ...] = ()
+    shard_self_url: str = ""
+    shard_node_retry_seconds: float = 30
+    batch_max_routers: int = 8
+    batch_router_concurrency: int = 4
+    notify_outbox_enabled: bool = True
+    notify_dispatch_threads: int = 4
+    notify_max_attempts: int = 6
+    notify_retry_backoff_seconds: float = 30
+    whatsapp_rate_per_second: float = 10
+    whatsapp_burst: int = 20
+    telegram_digest_seconds: float = 0
+    telegram_digest_max_messages: int = 50
+    client_cache_ttl_seconds: float = 3600
+    client_cache_max_entries: int = 20000
+    client_prefetch_page_size: int = 500
+    idempotency_ttl_days: float = 30
+    idempotency_front_size: int = 100000
+    idempotency_claim_timeout_seconds: float = 120
+    telegram_api_url: str = "https://api.telegram.org"
+    whatsapp_api_url: str = "https://graph.facebook.com"
+    webhook_deadline_seconds: float = 20
+    router_deadline_share: float = 0.6
+    router_max_concurrency: int = 4
+    router_bulkhead_wait_seconds: float = 2
+    router_breaker_failures: int = 5
+    router_breaker_reset_seconds: float = 30
+    router_index: RouterIndex = field(default=None, init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        # Built once per snapshot; invalid ranges are reported here, not per lookup
+        object.__setattr__(self, "router_index", RouterIndex(self.routers))
 
 
 def load_config() -> AppConfig:
@@ -54,8 +128,60 @@ def load_config() -> AppConfig:
     whatsapp_phone_id = os.getenv("WHATSAPP_PHONE_NUMBER_ID", "")
     whatsapp_token = os.getenv("WHATSAPP_TOKEN", "")
     tls_verify = os.getenv("TLS_VERIFY", "true").lower() == "true"
+    lease_cache_enabled = os.getenv("LEASE_CACHE_ENABLED", "true").lower() == "true"
+    lease_cache_refresh_seconds = float(os.getenv("LEASE_CACHE_REFRESH_SECONDS", "300"))
+    lease_cache_max_entries = int(os.getenv("LEASE_CACHE_MAX_ENTRIES", "50000"))
+    state_dir = os.getenv("STATE_DIR", "/var/lib/uisp_suspend_unsuspend")
+    job_queue_enabled = os.getenv("JOB_QUEUE_ENABLED", "true").lower() == "true"
+    job_workers = int(os.getenv("JOB_WORKERS", "4"))
+    job_max_attempts = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+    job_retry_backoff_seconds = float(os.getenv("JOB_RETRY_BACKOFF_SECONDS", "10"))
+    job_retention_days = float(os.getenv("JOB_RETENTION_DAYS", "7"))
+    coalesce_window_seconds = float(os.getenv("COALESCE_WINDOW_SECONDS", "5"))
+    warmup_enabled = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+    warmup_timeout_seconds = float(os.getenv("WARMUP_TIMEOUT_SECONDS", "20"))
+    warmup_lease_cache = os.getenv("WARMUP_LEASE_CACHE", "true").lower() == "true"
+    async_pipeline = os.getenv("ASYNC_PIPELINE", "false").lower() == "true"
+    journal_enabled = os.getenv("JOURNAL_ENABLED", "true").lower() == "true"
+    journal_batch_size = int(os.getenv("JOURNAL_BATCH_SIZE", "500"))
+    journal_flush_seconds = float(os.getenv("JOURNAL_FLUSH_SECONDS", "1"))
+    journal_retention_months = int(os.getenv("JOURNAL_RETENTION_MONTHS", "12"))
+    shard_enabled = os.getenv("SHARD_ENABLED", "false").lower() == "true"
+    shard_heartbeat_seconds = float(os.getenv("SHARD_HEARTBEAT_SECONDS", "5"))
+    shard_router_concurrency = int(os.getenv("SHARD_ROUTER_CONCURRENCY", "1"))
+    shard_nodes = tuple(n.strip().rstrip("/") for n in os.getenv("SHARD_NODES", "").split(",") if n.strip())
+    shard_self_url = os.getenv("SHARD_SELF_URL", "").strip().rstrip("/")
+    shard_node_retry_seconds = float(os.getenv("SHARD_NODE_RETRY_SECONDS", "30"))
+    batch_max_routers = int(os.getenv("BATCH_MAX_ROUTERS", "8"))
+    batch_router_concurrency = int(os.getenv("BATCH_ROUTER_CONCURRENCY", "4"))
+    notify_outbox_enabled = os.getenv("NOTIFY_OUTBOX_ENABLED", "true").lower() == "true"
+    notify_dispatch_threads = int(os.getenv("NOTIFY_DISPATCH_THREADS", "4"))
+    notify_max_attempts = int(os.getenv("NOTIFY_MAX_ATTEMPTS", "6"))
+    notify_retry_backoff_seconds = float(os.getenv("NOTIFY_RETRY_BACKOFF_SECONDS", "30"))
+    whatsapp_rate_per_second = float(os.getenv("WHATSAPP_RATE_PER_SECOND", "10"))
+    whatsapp_burst = int(os.getenv("WHATSAPP_BURST", "20"))
+    telegram_digest_seconds = float(os.getenv("TELEGRAM_DIGEST_SECONDS", "0"))
+    telegram_digest_max_messages = int(os.getenv("TELEGRAM_DIGEST_MAX_MESSAGES", "50"))
+    client_cache_ttl_seconds = float(os.getenv("CLIENT_CACHE_TTL_SECONDS", "3600"))
+    client_cache_max_entries = int(os.getenv("CLIENT_CACHE_MAX_ENTRIES", "20000"))
+    client_prefetch_page_size = int(os.getenv("CLIENT_PREFETCH_PAGE_SIZE", "500"))
+    idempotency_ttl_days = float(os.getenv("IDEMPOTENCY_TTL_DAYS", "30"))
+    idempotency_front_size = int(os.getenv("IDEMPOTENCY_FRONT_SIZE", "100000"))
+    idempotency_claim_timeout_seconds = float(os.getenv("IDEMPOTENCY_CLAIM_TIMEOUT_SECONDS", "120"))
+    telegram_api_url = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+    whatsapp_api_url = os.getenv("WHATSAPP_API_URL", "https://graph.facebook.com")
+    webhook_deadline_seconds = float(os.getenv("WEBHOOK_DEADLINE_SECONDS", "20"))
+    router_deadline_share = float(os.getenv("ROUTER_DEADLINE_SHARE", "0.6"))
+    router_max_concurrency = int(os.getenv("ROUTER_MAX_CONCURRENCY", "4"))
+    router_bulkhead_wait_seconds = float(os.getenv("ROUTER_BULKHEAD_WAIT_SECONDS", "2"))
+    router_breaker_failures = int(os.getenv("ROUTER_BREAKER_FAILURES", "5"))
+    router_breaker_reset_seconds = float(os.getenv("ROUTER_BREAKER_RESET_SECONDS", "30"))
 
-    nas_config_path = os.getenv("NAS_CONFIG_PATH", "/etc/uisp/nas_config.json")
+    router_transport = os.getenv("ROUTER_TRANSPORT", "rest")
+    suspend_mode = os.getenv("SUSPEND_MODE", "lease")
+    suspend_address_list = os.getenv("SUSPEND_ADDRESS_LIST", "uisp-suspended")
+
+    nas_config_path = _nas_config_path()
 
     routers = []
     if os.path.exists(nas_config_path):
@@ -66,6 +192,9 @@ def load_config() -> AppConfig:
         for site_name, site_config in data.items():
             if isinstance(site_config, dict) and "api_url" in site_config:
                 router_ip_range = site_config.get("router_ip_range", "")
+                if isinstance(router_ip_range, list):
+                    # Several ranges per site: ["100.64.0.0/23", "100.64.8.0/24"]
+                    router_ip_range = ", ".join(router_ip_range)
 
                 routers.append(
                     Router(
@@ -75,6 +204,10 @@ def load_config() -> AppConfig:
                         username=site_config.get("username", ""),
                         password=site_config.get("password", ""),
                         router_ip_range=router_ip_range,
+                        transport=site_config.get("transport", router_transport),
+                        api_port=int(site_config["api_port"]) if site_config.get("api_port") else None,
+                        suspend_mode=site_config.get("suspend_mode", suspend_mode),
+                        address_list=site_config.get("address_list", suspend_address_list),
                     )
                 )
 
@@ -90,24 +223,142 @@ def load_config() -> AppConfig:
         whatsapp_phone_id=whatsapp_phone_id,
         whatsapp_token=whatsapp_token,
         tls_verify=tls_verify,
-        routers=routers,
+        routers=tuple(routers),
+        lease_cache_enabled=lease_cache_enabled,
+        lease_cache_refresh_seconds=lease_cache_refresh_seconds,
+        lease_cache_max_entries=lease_cache_max_entries,
+        state_dir=state_dir,
+        job_queue_enabled=job_queue_enabled,
+        job_workers=job_workers,
+        job_max_attempts=job_max_attempts,
+        job_retry_backoff_seconds=job_retry_backoff_seconds,
+        job_retention_days=job_retention_days,
+        coalesce_window_seconds=coalesce_window_seconds,
+        warmup_enabled=warmup_enabled,
+        warmup_timeout_seconds=warmup_timeout_seconds,
+        warmup_lease_cache=warmup_lease_cache,
+        async_pipeline=async_pipeline,
+        journal_enabled=journal_enabled,
+        journal_batch_size=journal_batch_size,
+        journal_flush_seconds=journal_flush_seconds,
+        journal_retention_months=journal_retention_months,
+        shard_enabled=shard_enabled,
+        shard_heartbeat_seconds=shard_heartbeat_seconds,
+        shard_router_concurrency=shard_router_concurrency,
+        shard_nodes=shard_nodes,
+        shard_self_url=shard_self_url,
+        shard_node_retry_seconds=shard_node_retry_seconds,
+        batch_max_routers=batch_max_routers,
+        batch_router_concurrency=batch_router_concurrency,
+        notify_outbox_enabled=notify_outbox_enabled,
+        notify_dispatch_threads=notify_dispatch_threads,
+        notify_max_attempts=notify_max_attempts,
+        notify_retry_backoff_seconds=notify_retry_backoff_seconds,
+        whatsapp_rate_per_second=whatsapp_rate_per_second,
+        whatsapp_burst=whatsapp_burst,
+        telegram_digest_seconds=telegram_digest_seconds,
+        telegram_digest_max_messages=telegram_digest_max_messages,
+        client_cache_ttl_seconds=client_cache_ttl_seconds,
+        client_cache_max_entries=client_cache_max_entries,
+        client_prefetch_page_size=client_prefetch_page_size,
+        idempotency_ttl_days=idempotency_ttl_days,
+        idempotency_front_size=idempotency_front_size,
+        idempotency_claim_timeout_seconds=idempotency_claim_timeout_seconds,
+        telegram_api_url=telegram_api_url,
+        whatsapp_api_url=whatsapp_api_url,
+        webhook_deadline_seconds=webhook_deadline_seconds,
+        router_deadline_share=router_deadline_share,
+        router_max_concurrency=router_max_concurrency,
+        router_bulkhead_wait_seconds=router_bulkhead_wait_seconds,
+        router_breaker_failures=router_breaker_failures,
+        router_breaker_reset_seconds=router_breaker_reset_seconds,
     )
 
 
+def _nas_config_path() -> str:
+    return os.getenv("NAS_CONFIG_PATH", "/etc/uisp/nas_config.json")
+
+
+def _nas_config_stamp(path: str):
+    """Identity of the NAS file on disk; changes on edit or atomic replace."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+# Process-wide config snapshot, reloaded on NAS file change or SIGHUP
+_config_lock = threading.Lock()
+_config: AppConfig | None = None
+_config_stamp = None
+_config_stale = False
+_sighup_installed = False
+
+
+def get_config() -> AppConfig:
+    """
+    Return the cached config snapshot.
+    Reloads only when nas_config.json changes on disk or after SIGHUP.
+    """
+    global _config, _config_stamp, _config_stale
+
+    path = _nas_config_path()
+    stamp = _nas_config_stamp(path)
+    cfg = _config
+    if cfg is not None and not _config_stale and stamp == _config_stamp:
+        return cfg
+
+    with _config_lock:
+        stamp = _nas_config_stamp(path)
+        if _config is None or _config_stale or stamp != _config_stamp:
+            if _config_stale:
+                # SIGHUP also picks up edits to the env file
+                _load_env_file(override=True)
+            try:
+                _config = load_config()
+            except (OSError, ValueError) as e:
+                if _config is None:
+                    raise
+                # Keep serving the last good snapshot while the file is mid-edit
+                logging.error(f"Config reload failed, keeping previous snapshot: {e}")
+                return _config
+            _config_stamp = stamp
+            _config_stale = False
+            logging.info(f"Configuration loaded ({len(_config.routers)} routers)")
+        return _config
+
+
+def invalidate_config():
+    """Force the next get_config() call to reload env and NAS config."""
+    global _config_stale
+    _config_stale = True
+
+
+def install_sighup_handler():
+    """Reload config on SIGHUP. Only possible from the main thread."""
+    global _sighup_installed
+    if _sighup_installed:
+        return
+    previous = signal.getsignal(signal.SIGHUP)
+
+    def _on_sighup(signum, frame):
+        logging.info("SIGHUP received; configuration will be reloaded")
+        invalidate_config()
+        if callable(previous):
+            previous(signum, frame)
+
+    try:
+        signal.signal(signal.SIGHUP, _on_sighup)
+        _sighup_installed = True
+    except ValueError:
+        logging.debug("SIGHUP handler not installed (not in main thread)")
+
+
 def find_router_by_ip(cfg: AppConfig, ip: str) -> tuple[str, Router | None]:
-    """Find router responsible for a given IP based on /23 router_ip_range."""
-    import ipaddress
-
-    target_ip = ipaddress.IPv4Address(ip)
-
-    for router in cfg.routers:
-        if not router.router_ip_range:
-            continue
-        try:
-            network = ipaddress.ip_network(router.router_ip_range)
-            if target_ip in network:
-                return router.site, router
-        except ValueError:
-            continue
+    """Find router responsible for a given IP using the snapshot's router index."""
+    router = cfg.router_index.lookup(ip)
+    if router:
+        return router.site, router
 
     return "Unknown", None
@@ -0,0 +1,103 @@
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    REGISTRY,
+    generate_latest,
+    multiprocess,
+)
+
+# With several gunicorn workers set PROMETHEUS_MULTIPROC_DIR (an empty, writable
+# directory) so every process writes its samples there and /metrics aggregates them.
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 15, 30)
+
+STAGE_SECONDS = Histogram(
+    "suspension_stage_seconds",
+    "Time spent in each stage of the suspension pipeline",
+    ["stage", "site"],
+    buckets=STAGE_BUCKETS,
+)
+STAGE_IN_FLIGHT = Gauge(
+    "suspension_stage_in_flight",
+    "Calls currently inside each pipeline stage",
+    ["stage"],
+    multiprocess_mode="livesum",
+)
+ACTIONS = Counter(
+    "suspension_actions_total",
+    "Suspend/unsuspend outcomes",
+    ["action", "outcome", "site"],
+)
+WEBHOOKS = Counter(
+    "suspension_webhooks_total",
+    "Webhooks received by outcome (queued, duplicate, invalid, processed, deferred, coalesced, forwarded, error)",
+    ["outcome"],
+)
+NOTIFICATIONS = Counter(
+    "suspension_notifications_total",
+    "Client and operator notifications by channel and outcome",
+    ["channel", "outcome"],
+)
+LEASE_CACHE_LOOKUPS = Counter(
+    "suspension_lease_cache_lookups_total",
+    "Lease cache lookups by result",
+    ["site", "result"],
+)
+
+
+# (stage, seconds) of each timed() stage inside the current traced() block
+_trace: ContextVar[list | None] = ContextVar("stage_trace", default=None)
+
+
+@contextmanager
+def timed(stage: str, site: str = ""):
+    """Observe the duration of a pipeline stage and track it as in flight."""
+    in_flight = STAGE_IN_FLIGHT.labels(stage)
+    in_flight.inc()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.labels(stage, site).observe(elapsed)
+        in_flight.dec()
+        trace = _trace.get()
+        if trace is not None:
+            trace.append((stage, elapsed))
+
+
+@contextmanager
+def traced():
+    """
+    Collect the stages timed inside the block, including those run on other
+    threads with a copy of this context. Yields the list being filled.
+    """
+    trace = []
+    token = _trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _trace.reset(token)
+
+
+def render() -> tuple[bytes, str]:
+    """Prometheus exposition for this process, or all workers in multiprocess mode."""
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid: int):
+    """Drop a dead worker's live gauges (gunicorn child_exit hook)."""
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,46 @@
+import time
+import threading
+
+# Seconds between checks while the rate is 0 (sending paused)
+PAUSED_RETRY = 5.0
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens per second, up to `burst` saved.
+    A rate of 0 or less hands out no tokens at all (paused).
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self) -> float:
+        """Take a token if available; otherwise return seconds until one is."""
+        if self.rate <= 0:
+            return PAUSED_RETRY
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self, stop: threading.Event | None = None) -> bool:
+        """Block until a token is taken. Returns False if stop was set first."""
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return True
+            if stop is not None:
+                if stop.wait(wait):
+                    return False
+            else:
+                time.sleep(wait)
@@ -0,0 +1,235 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class Unavailable(RuntimeError):
+    """A dependency is shedding load; retry after retry_after seconds."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpen(Unavailable):
+    pass
+
+
+class BulkheadFull(Unavailable):
+    pass
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request's time budget ran out before the next call."""
+
+
+class CircuitBreaker:
+    """
+    Thread-safe breaker: opens after failure_threshold consecutive failures,
+    fails fast for reset_timeout seconds, then lets a single probe through
+    (half-open) whose outcome closes or re-opens it.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Raise CircuitOpen unless a call may go through now."""
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            wait = self.opened_at + self.reset_timeout - time.monotonic()
+            if self.state == OPEN and wait <= 0:
+                self.state = HALF_OPEN
+                self._probing = False
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            self.rejected += 1
+        raise CircuitOpen(f"Circuit open for {self.name}", max(wait, 1.0))
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            opened = self.state != OPEN and (self.state == HALF_OPEN or self.failures >= self.failure_threshold)
+            if opened:
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+            self._probing = False
+        if opened:
+            logging.warning(f"Circuit for {self.name} opened after {self.failures} failures; "
+                            f"failing fast for {self.reset_timeout:.0f}s")
+
+    def release_probe(self):
+        """Give back a half-open probe that was never made."""
+        with self._lock:
+            self._probing = False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"state": self.state, "failures": self.failures, "rejected": self.rejected}
+
+
+class Bulkhead:
+    """Caps concurrent calls to one dependency so it cannot hold every worker."""
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = max(1, limit)
+        self.active = 0
+        self.rejected = 0
+        self._slots = threading.BoundedSemaphore(self.limit)
+        self._lock = threading.Lock()
+
+    def acquire(self, wait: float):
+        if not self._slots.acquire(timeout=max(wait, 0)):
+            with self._lock:
+                self.rejected += 1
+            raise BulkheadFull(f"Too many concurrent calls to {self.name}", max(wait, 1.0))
+        with self._lock:
+            self.active += 1
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+        self._slots.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"limit": self.limit, "active": self.active, "rejected": self.rejected}
+
+
+# Per-process registries; breaker state is not shared between gunicorn workers
+_breakers: dict[str, CircuitBreaker] = {}
+_bulkheads: dict[str, Bulkhead] = {}
+_registry_lock = threading.Lock()
+_registry_pid = os.getpid()
+
+
+def _check_fork():
+    global _registry_pid
+    if _registry_pid != os.getpid():
+        _breakers.clear()
+        _bulkheads.clear()
+        _registry_pid = os.getpid()
+
+
+def get_breaker(name: str, failure_threshold: int = 5, reset_timeout: float = 30) -> CircuitBreaker:
+    with _registry_lock:
+        _check_fork()
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name, failure_threshold, reset_timeout)
+        breaker.failure_threshold = max(1, failure_threshold)
+        breaker.reset_timeout = reset_timeout
+        return breaker
+
+
+def get_bulkhead(name: str, limit: int) -> Bulkhead:
+    with _registry_lock:
+        _check_fork()
+        bulkhead = _bulkheads.get(name)
+        if bulkhead is None or bulkhead.limit != max(1, limit):
+            # A resized bulkhead starts fresh; callers holding the old one release into it
+            bulkhead = _bulkheads[name] = Bulkhead(name, limit)
+        return bulkhead
+
+
+def resilience_stats() -> dict:
+    """Breaker and bulkhead state in this process, keyed by name."""
+    with _registry_lock:
+        names = sorted(_breakers.keys() | _bulkheads.keys())
+        return {
+            name: {
+                "breaker": _breakers[name].stats() if name in _breakers else None,
+                "bulkhead": _bulkheads[name].stats() if name in _bulkheads else None,
+            }
+            for name in names
+        }
+
+
+@contextmanager
+def guarded(breaker: CircuitBreaker, bulkhead: Bulkhead, wait: float, is_failure=lambda e: True):
+    """
+    Run a block behind a breaker and a bulkhead. Waits at most `wait` seconds
+    (never past the current deadline) for a slot. Exceptions for which
+    is_failure() is true count against the breaker; everything else closes it.
+    """
+    breaker.before_call()
+    try:
+        bulkhead.acquire(min(wait, remaining()))
+    except BulkheadFull:
+        breaker.release_probe()
+        raise
+    try:
+        yield
+    except DeadlineExceeded:
+        # Our budget ran out, which says nothing about the dependency
+        breaker.release_probe()
+        raise
+    except Exception as e:
+        if is_failure(e):
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        raise
+    else:
+        breaker.record_success()
+    finally:
+        bulkhead.release()
+
+
+# Absolute monotonic deadline of the work in progress (None = unbounded)
+_deadline: ContextVar[float | None] = ContextVar("deadline", default=None)
+
+
+@contextmanager
+def deadline(seconds: float | None):
+    """
+    Bound the enclosed calls to `seconds` from now. Nested deadlines can
+    only shorten the enclosing one; None or 0 leaves it unchanged.
+    """
+    current = _deadline.get()
+    if seconds:
+        limit = time.monotonic() + seconds
+        current = min(current, limit) if current is not None else limit
+    token = _deadline.set(current)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> float:
+    """Seconds left on the current deadline (infinity when there is none)."""
+    current = _deadline.get()
+    return float("inf") if current is None else current - time.monotonic()
+
+
+def call_timeout(default: float) -> float:
+    """Timeout for the next outbound call: the default, cut to the time left."""
+    left = remaining()
+    if left <= 0:
+        raise DeadlineExceeded("Deadline exceeded before the call was made")
+    return min(default, left)
@@ -0,0 +1,71 @@
+import logging
+import ipaddress
+from bisect import bisect_right
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from app.core.config import Router
+
+
+class RouterIndex:
+    """
+    Longest-prefix-match table from IPv4 address to router.
+
+    Built once per config snapshot. Every configured range is flattened into
+    sorted, non-overlapping integer intervals, so a lookup is one bisect.
+    Overlapping ranges resolve to the most specific prefix; equal prefixes
+    resolve to the router listed first in nas_config.json.
+    """
+
+    def __init__(self, routers: tuple["Router", ...]):
+        self.errors: list[str] = []
+        self._starts: list[int] = []
+        self._ends: list[int] = []
+        self._owners: list["Router"] = []
+
+        ranges = []
+        for order, router in enumerate(routers):
+            for cidr in router.ip_ranges:
+                try:
+                    network = ipaddress.ip_network(cidr)
+                except ValueError as e:
+                    self.errors.append(f"{router.site}: invalid router_ip_range '{cidr}': {e}")
+                    continue
+                if network.version != 4:
+                    self.errors.append(f"{router.site}: router_ip_range '{cidr}' is not IPv4")
+                    continue
+                start = int(network.network_address)
+                end = int(network.broadcast_address)
+                ranges.append((start, end, network.prefixlen, order, router))
+
+        for error in self.errors:
+            logging.error(f"Router index: {error}")
+
+        self._build(ranges)
+
+    def _build(self, ranges):
+        boundaries = sorted({r[0] for r in ranges} | {r[1] + 1 for r in ranges})
+        for lo, next_lo in zip(boundaries, boundaries[1:]):
+            covering = [r for r in ranges if r[0] <= lo <= r[1]]
+            if not covering:
+                continue
+            # Most specific prefix wins, then config order
+            owner = min(covering, key=lambda r: (-r[2], r[3]))[4]
+            hi = next_lo - 1
+            if self._owners and self._owners[-1] is owner and self._ends[-1] + 1 == lo:
+                self._ends[-1] = hi
+                continue
+            self._starts.append(lo)
+            self._ends.append(hi)
+            self._owners.append(owner)
+
+    def __len__(self):
+        return len(self._starts)
+
+    def lookup(self, ip: str) -> "Router | None":
+        """Return the router owning an IPv4 address, or None."""
+        target = int(ipaddress.IPv4Address(ip))
+        i = bisect_right(self._starts, target) - 1
+        if i >= 0 and target <= self._ends[i]:
+            return self._owners[i]
+        return None
@@ -0,0 +1,38 @@
+import os
+import asyncio
+import threading
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+# Blocking client calls in flight across all event loops of one process
+AIO_THREADS = int(os.getenv("ASYNC_PIPELINE_THREADS", "32"))
+
+_executor: ThreadPoolExecutor | None = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """
+    The process-wide pool the async pipeline runs client calls on. Shared
+    between event loops so a per-request asyncio.run() does not start and
+    join its own threads.
+    """
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=AIO_THREADS, thread_name_prefix="aio")
+            _executor_pid = os.getpid()
+        return _executor
+
+
+async def in_thread(fn, *args, **kwargs):
+    """
+    Await a blocking call (router, UISP, Telegram, WhatsApp client) on the
+    shared pool. The caller's contextvars, including the webhook deadline,
+    are carried into the thread.
+    """
+    ctx = contextvars.copy_context()
+    call = functools.partial(ctx.run, fn, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(get_executor(), call)
@@ -0,0 +1,69 @@
+import os
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+# Connections kept alive per host; size this to the worker's thread count
+POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "4"))
+POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "10"))
+# Wait for a pooled connection instead of opening throwaway ones beyond
+# POOL_MAXSIZE. Off by default: requests gives urllib3 no pool timeout, so
+# the wait is unbounded and ignores the caller's deadline
+POOL_BLOCK = os.getenv("HTTP_POOL_BLOCK", "false").lower() == "true"
+
+
+def build_session(pool_maxsize: int = POOL_MAXSIZE) -> requests.Session:
+    """
+    Create a keep-alive session with a tuned connection pool.
+    Sessions are shared between threads (and greenlets): never set cookies,
+    headers or auth on them after creation, pass those per request.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=pool_maxsize, pool_block=POOL_BLOCK)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# Shared sessions for UISP, Telegram and WhatsApp, one per service name
+_sessions: dict[str, requests.Session] = {}
+_sessions_lock = threading.Lock()
+_sessions_pid = os.getpid()
+
+
+def get_session(name: str) -> requests.Session:
+    """Return the process-wide pooled session for an external service."""
+    global _sessions_pid
+    session = _sessions.get(name)
+    if session is not None and _sessions_pid == os.getpid():
+        return session
+
+    with _sessions_lock:
+        if _sessions_pid != os.getpid():
+            # Never share sockets with the parent after fork
+            _sessions.clear()
+            _sessions_pid = os.getpid()
+        session = _sessions.get(name)
+        if session is None:
+            session = build_session()
+            _sessions[name] = session
+        return session
+
+
+def reset_session(name: str):
+    """Drop a session after a connection error so the next call reconnects."""
+    with _sessions_lock:
+        session = _sessions.pop(name, None)
+    if session is not None:
+        logging.info(f"Recycling HTTP session for {name}")
+        session.close()
+
+
+def close_sessions():
+    """Close every shared session (worker shutdown)."""
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        session.close()
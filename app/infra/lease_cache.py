@@ -0,0 +1,241 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from app.core.config import get_config
+from app.core.metrics import LEASE_CACHE_LOOKUPS
+from app.infra.mikrotik import LEASE_PROPLIST, get_router_client
+
+
+class SiteRemoved(RuntimeError):
+    """The cache's router is no longer in the config."""
+
+
+@dataclass
+class CachedLease:
+    lease_id: str
+    blocked: bool
+    fetched_at: float
+
+
+class LeaseCache:
+    """
+    Bounded LRU map of address -> lease .id / block-access for one router.
+    A daemon thread reloads the whole table every refresh_interval seconds;
+    callers invalidate single entries when the router answers 404.
+    """
+
+    def __init__(self, name: str, client_factory, refresh_interval: float = 300, max_entries: int = 50000):
+        self.name = name
+        self.client_factory = client_factory
+        self.refresh_interval = refresh_interval
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, CachedLease] = OrderedDict()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._loaded = threading.Event()
+        self._thread = None
+        # address -> version of its last local change (put/set_blocked/invalidate),
+        # so a refresh that started earlier does not overwrite it
+        self._version = 0
+        self._changed: dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self.last_refresh = None
+
+    def get(self, address: str) -> CachedLease | None:
+        with self._lock:
+            entry = self._entries.get(address)
+            if entry is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(address)
+                self.hits += 1
+        LEASE_CACHE_LOOKUPS.labels(self.name, "hit" if entry else "miss").inc()
+        return entry
+
+    def put(self, address: str, lease: dict):
+        """Store a lease as returned by the router."""
+        self._store(address, CachedLease(lease.get(".id"), lease.get("block-access") == "yes", time.time()))
+
+    def set_blocked(self, address: str, blocked: bool):
+        with self._lock:
+            entry = self._entries.get(address)
+            if entry:
+                entry.blocked = blocked
+                self._touch(address)
+
+    def invalidate(self, address: str):
+        with self._lock:
+            if self._entries.pop(address, None):
+                self.invalidations += 1
+            self._touch(address)
+
+    def _touch(self, address: str):
+        self._version += 1
+        self._changed[address] = self._version
+
+    def _store(self, address: str, entry: CachedLease):
+        with self._lock:
+            self._entries[address] = entry
+            self._entries.move_to_end(address)
+            self._touch(address)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def refresh(self):
+        """Reload the full lease table from the router."""
+        with self._lock:
+            begin = self._version
+        leases = self.client_factory().list_leases(proplist=LEASE_PROPLIST)
+        now = time.time()
+        fresh = {
+            l["address"]: CachedLease(l.get(".id"), l.get("block-access") == "yes", now)
+            for l in leases if l.get("address")
+        }
+
+        with self._lock:
+            # Local changes made while the table was being fetched are newer than it
+            for address, version in self._changed.items():
+                if version > begin:
+                    fresh.pop(address, None)
+                    if address in self._entries:
+                        fresh[address] = self._entries[address]
+            self._changed = {a: v for a, v in self._changed.items() if v > begin}
+            # Keep recently used addresses when the table is larger than the cache
+            entries = OrderedDict()
+            for address in self._entries:
+                if address in fresh:
+                    entries[address] = fresh.pop(address)
+            for address, entry in fresh.items():
+                entries[address] = entry
+                entries.move_to_end(address, last=False)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+                self.evictions += 1
+            self._entries = entries
+            self.refreshes += 1
+            self.last_refresh = now
+        logging.debug(f"Lease cache {self.name}: refreshed {len(entries)} leases")
+
+    def start(self):
+        """Start the background refresh thread (idempotent)."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f"lease-cache-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def wait_loaded(self, timeout: float) -> bool:
+        """Wait for the first full load. False if it failed or took too long."""
+        return self._loaded.wait(timeout) and self.last_refresh is not None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except SiteRemoved:
+                logging.info(f"Lease cache {self.name}: router removed from config, stopping")
+                _forget(self)
+                self._loaded.set()
+                return
+            except Exception as e:
+                with self._lock:
+                    self.refresh_errors += 1
+                logging.warning(f"Lease cache {self.name}: refresh failed: {e}")
+            self._loaded.set()
+            self._stop.wait(self.refresh_interval)
+
+    def stats(self) -> dict:
+        now = time.time()
+        with self._lock:
+            oldest = min((e.fetched_at for e in self._entries.values()), default=None)
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "refreshes": self.refreshes,
+                "refresh_errors": self.refresh_errors,
+                "refresh_interval": self.refresh_interval,
+                "seconds_since_refresh": round(now - self.last_refresh, 1) if self.last_refresh else None,
+                "oldest_entry_age": round(now - oldest, 1) if oldest else None,
+            }
+
+
+# Process-wide caches, one per router site, with the Router entry each was built for
+_caches: dict[str, tuple[object, LeaseCache]] = {}
+_caches_lock = threading.Lock()
+_caches_pid = os.getpid()
+
+
+def current_router_client(site: str):
+    """The shared client for a site as the current config snapshot defines it."""
+    cfg = get_config()
+    router = next((r for r in cfg.routers if r.site == site), None)
+    if router is None:
+        raise SiteRemoved(f"Router {site} is no longer configured")
+    return get_router_client(router, cfg.tls_verify)
+
+
+def get_lease_cache(router, cfg) -> LeaseCache:
+    """
+    Return the lease cache for a router, starting its refresh thread on
+    first use. The refresh resolves its client through the current config,
+    so it never holds on to old credentials; a changed Router entry starts
+    a fresh cache, and the interval and size follow cfg.
+    """
+    global _caches_pid
+    with _caches_lock:
+        if _caches_pid != os.getpid():
+            # Refresh threads do not survive fork; start over in the child
+            _caches.clear()
+            _caches_pid = os.getpid()
+        built_for, cache = _caches.get(router.site, (None, None))
+        if cache is not None and built_for != router:
+            logging.info(f"Lease cache {router.site}: router settings changed, reloading")
+            cache.stop()
+            cache = None
+        if cache is None:
+            cache = LeaseCache(router.site, lambda: current_router_client(router.site))
+            _caches[router.site] = (router, cache)
+            cache.start()
+        cache.refresh_interval = cfg.lease_cache_refresh_seconds
+        cache.max_entries = cfg.lease_cache_max_entries
+        return cache
+
+
+def drop_lease_cache(site: str):
+    """Stop and forget a site's cache, if this process has one."""
+    with _caches_lock:
+        _, cache = _caches.pop(site, (None, None))
+    if cache is not None:
+        cache.stop()
+
+
+def _forget(cache: LeaseCache):
+    """Stop a cache and drop it from the registry, unless it was already replaced."""
+    cache.stop()
+    with _caches_lock:
+        if _caches.get(cache.name, (None, None))[1] is cache:
+            del _caches[cache.name]
+
+
+def lease_cache_stats() -> dict:
+    """Stats for every router cache in this process, keyed by site."""
+    with _caches_lock:
+        return {cache.name: cache.stats() for _, cache in _caches.values()}
@@ -1,34 +1,360 @@
+import os
 import requests
 import logging
+import threading
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+from app.core.resilience import call_timeout
+from app.infra.http import build_session
+from app.infra.routeros_api import ApiError, ApiTransport
+
+# Per-call cap; the caller's deadline can cut it shorter
+ROUTER_TIMEOUT = 15
+
+# Only the lease fields the suspension flow reads
+LEASE_PROPLIST = ".id,address,block-access"
+LEASE_MENU = "ip/dhcp-server/lease"
+ADDRESS_LIST_MENU = "ip/firewall/address-list"
+# Script lines per /rest/execute call
+SCRIPT_CHUNK = 200
+
+
+class RouterError(RuntimeError):
+    """
+    Router API call failed; status_code is set for HTTP error responses
+    (native API traps map to 404 for a missing item, 400 otherwise).
+    """
+
+    def __init__(self, message: str, status_code: int | None = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class RestTransport:
+    """RouterOS REST (JSON over HTTP/S) with a pooled keep-alive session."""
+
+    pipelined = False
 
-class MikroTikClient:
-    """Simple REST API client for MikroTik routers."""
-    
     def __init__(self, api_url: str, username: str, password: str, verify: bool = True):
         self.api_url = api_url.rstrip("/")
         self.auth = (username, password)
         self.verify = verify
-        self.session = requests.Session()
-        self.session.auth = self.auth
-        self.session.verify = verify
-        logging.debug(f"Initialized MikroTikClient for {self.api_url}")
+        self._session_lock = threading.Lock()
+        self.session = build_session()
+
+    @property
+    def label(self) -> str:
+        return self.api_url
+
+    def _recycle_session(self, broken: requests.Session):
+        """Replace the session after a connection-level failure."""
+        with self._session_lock:
+            if self.session is not broken:
+                return
+            self.session = build_session()
+        logging.info(f"Recycling connections to {self.api_url}")
+        broken.close()
+
+    def close(self):
+        self.session.close()
 
     def _req(self, method: str, path: str, **kwargs):
         url = f"{self.api_url}/{path.lstrip('/')}"
         logging.debug(f"Requesting MikroTik {method} {url}")
+        session = self.session
+        timeout = call_timeout(ROUTER_TIMEOUT)
         try:
-            response = self.session.request(method, url, timeout=15, **kwargs)
+            response = session.request(method, url, auth=self.auth, verify=self.verify, timeout=timeout, **kwargs)
             response.raise_for_status()
             return response.json() if response.text else {}
+        except requests.HTTPError as e:
+            detail = _error_detail(e.response)
+            logging.error(f"MikroTik API error ({url}): {e}{f' ({detail})' if detail else ''}")
+            raise RouterError(f"Router operation failed: {detail or e}", e.response.status_code)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            logging.error(f"MikroTik API error ({url}): {e}")
+            self._recycle_session(session)
+            raise RouterError(f"Router operation failed: {e}")
         except Exception as e:
             logging.error(f"MikroTik API error ({url}): {e}")
-            raise RuntimeError(f"Router operation failed: {e}")
+            raise RouterError(f"Router operation failed: {e}")
+
+    def print(self, menu: str, query: dict | None = None, proplist: str | None = None) -> list[dict]:
+        params = dict(query or {})
+        if proplist:
+            params[".proplist"] = proplist
+        return self._req("GET", menu, params=params or None)
+
+    def set(self, menu: str, item_id: str, props: dict):
+        return self._req("PATCH", f"{menu}/{item_id}", json=props)
+
+    def set_many(self, menu: str, items: list[tuple[str, dict]], concurrency: int = 4) -> list[str | None]:
+        """One PATCH per item, `concurrency` at a time; an error message or None per item."""
+        def apply(item):
+            try:
+                self.set(menu, *item)
+                return None
+            except RouterError as e:
+                return str(e)
+
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+            return list(pool.map(apply, items))
+
+    def execute(self, lines: list[str]):
+        """
+        Run RouterOS script lines through /rest/execute, SCRIPT_CHUNK lines
+        per call. as-string makes the router run the script before it
+        answers; without it the script becomes a background job.
+        """
+        for i in range(0, len(lines), SCRIPT_CHUNK):
+            self._req("POST", "execute", json={"script": "\n".join(lines[i:i + SCRIPT_CHUNK]), "as-string": ""})
+
+    def add(self, menu: str, props: dict) -> dict:
+        return self._req("PUT", menu, json=props)
+
+    def add_many(self, menu: str, items: list[dict]) -> list[str | None]:
+        """
+        Add items; an error message or None per item, as on the native API.
+        A single item is one PUT. More run as scripts of SCRIPT_CHUNK items
+        in which a rejected add does not stop the rest, then the menu is
+        read back and items that did not land are reported as failed.
+        """
+        if len(items) == 1:
+            try:
+                self.add(menu, items[0])
+                return [None]
+            except RouterError as e:
+                return [str(e)]
+        command = "/" + menu.replace("/", " ")
+        self.execute([
+            f":do {{ {command} add {' '.join(f'{k}={_script_value(v)}' for k, v in props.items())} }} on-error={{}}"
+            for props in items
+        ])
+        lists = {props.get("list") for props in items}
+        query = {"list": lists.pop()} if len(lists) == 1 and None not in lists else None
+        landed = {(r.get("list"), r.get("address")) for r in self.print(menu, query, "list,address")}
+        return [None if (props.get("list"), props.get("address")) in landed else "failure: rejected by router"
+                for props in items]
+
+    def remove(self, menu: str, ids: list[str]):
+        """Remove items by .id, many per script line."""
+        command = "/" + menu.replace("/", " ")
+        self.execute([f"{command} remove numbers={','.join(ids[i:i + 500])}" for i in range(0, len(ids), 500)])
+
+
+def _error_detail(response) -> str | None:
+    """The router's reason for a REST error, e.g. "failure: already have such entry"."""
+    try:
+        body = response.json()
+    except ValueError:
+        return None
+    return body.get("detail") or body.get("message") if isinstance(body, dict) else None
+
+
+def _script_value(value) -> str:
+    """Quote a value for a RouterOS script."""
+    text = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("$", "\\$")
+    return f'"{text}"'
+
+
+class NativeApiTransport:
+    """Adapts ApiTransport to RouterError and the caller's deadline."""
+
+    pipelined = True
+
+    def __init__(self, api: ApiTransport):
+        self.api = api
+
+    @property
+    def label(self) -> str:
+        return self.api.label
+
+    def close(self):
+        self.api.close()
 
-    def list_leases(self):
-        """List all DHCP leases."""
-        return self._req("GET", "ip/dhcp-server/lease")
+    def _call(self, fn, *args):
+        timeout = call_timeout(ROUTER_TIMEOUT)
+        try:
+            return fn(*args, timeout=timeout)
+        except ApiError as e:
+            logging.error(f"MikroTik API error ({self.label}): {e}")
+            if not e.trap:
+                raise RouterError(f"Router operation failed: {e}")
+            # Match the REST status codes callers already act on
+            status = 404 if "no such item" in str(e) else 400
+            raise RouterError(f"Router operation failed: {e}", status)
+
+    def print(self, menu: str, query: dict | None = None, proplist: str | None = None) -> list[dict]:
+        return self._call(self.api.print, menu, query, proplist)
+
+    def set(self, menu: str, item_id: str, props: dict):
+        return self._call(self.api.set, menu, item_id, props)
+
+    def set_many(self, menu: str, items: list[tuple[str, dict]], concurrency: int = 4) -> list[str | None]:
+        """All sets pipelined on the router's API connection."""
+        return self._call(self.api.set_many, menu, items)
+
+    def add_many(self, menu: str, items: list[dict]) -> list[str | None]:
+        return self._call(self.api.add_many, menu, items)
+
+    def remove(self, menu: str, ids: list[str]):
+        return self._call(self.api.remove, menu, ids)
+
+
+def build_transport(api_url: str, username: str, password: str, verify: bool = True,
+                    transport: str = "rest", api_port: int | None = None):
+    """
+    REST by default; "api" / "api-ssl" use the native RouterOS API on the
+    api_url host (port 8728 / 8729 unless api_port is set).
+    """
+    if transport in ("api", "api-ssl"):
+        host = urlsplit(api_url).hostname or api_url
+        return NativeApiTransport(ApiTransport(
+            host, username, password, port=api_port, use_tls=transport == "api-ssl", verify=verify,
+        ))
+    if transport != "rest":
+        raise ValueError(f"Unknown router transport '{transport}'")
+    return RestTransport(api_url, username, password, verify)
+
+
+class MikroTikClient:
+    """MikroTik DHCP lease client over a pluggable transport (REST or native API)."""
+
+    def __init__(self, api_url: str, username: str, password: str, verify: bool = True, site: str = "",
+                 transport: str = "rest", api_port: int | None = None):
+        self.api_url = api_url.rstrip("/")
+        self.site = site
+        self.transport = build_transport(api_url, username, password, verify, transport, api_port)
+        # Flipped off the first time the router ignores or rejects query filters
+        self.filter_supported = True
+        logging.debug(f"Initialized MikroTikClient for {self.transport.label}")
+
+    def close(self):
+        self.transport.close()
+
+    def warm(self):
+        """Connect (and log in) ahead of the first real request."""
+        self.transport.print("system/identity")
+
+    def list_leases(self, proplist: str | None = None):
+        """List all DHCP leases, optionally limited to the given fields."""
+        return self.transport.print(LEASE_MENU, proplist=proplist)
+
+    def find_lease(self, address: str) -> dict | None:
+        """
+        Find the DHCP lease for one address.
+        Filters on the router (?address=&.proplist=) and falls back to the
+        full lease list when the router does not support query filtering.
+        """
+        if self.filter_supported:
+            try:
+                leases = self.transport.print(LEASE_MENU, {"address": address}, LEASE_PROPLIST)
+            except RouterError as e:
+                if e.status_code != 400:
+                    raise
+                leases = None
+
+            # Older RouterOS builds ignore unknown query params and return everything
+            if isinstance(leases, list) and all(l.get("address") == address for l in leases):
+                return leases[0] if leases else None
+
+            logging.warning(f"Lease query filtering unsupported on {self.transport.label}; using full lease list")
+            self.filter_supported = False
+
+        leases = self.list_leases()
+        return next((l for l in leases if l.get("address") == address), None)
 
     def toggle_block_access(self, lease_id: str, block: bool):
         """Block or unblock access to a DHCP lease."""
-        data = {"block-access": "yes" if block else "no"}
-        return self._req("PATCH", f"ip/dhcp-server/lease/{lease_id}", json=data)
+        return self.transport.set(LEASE_MENU, lease_id, {"block-access": "yes" if block else "no"})
+
+    def set_block_access_many(self, changes: list[tuple[str, bool]], concurrency: int = 4) -> list[str | None]:
+        """
+        Block/unblock many leases: pipelined on the native API, concurrent
+        PATCHes over REST. Returns an error message or None per change.
+        """
+        items = [(lease_id, {"block-access": "yes" if block else "no"}) for lease_id, block in changes]
+        return self.transport.set_many(LEASE_MENU, items, concurrency)
+
+    def address_list(self, name: str, address: str | None = None) -> dict[str, str]:
+        """Entries of a firewall address-list as {address: .id}."""
+        query = {"list": name, "address": address} if address else {"list": name}
+        rows = self.transport.print(ADDRESS_LIST_MENU, query, ".id,address,list")
+        # Same guard as find_lease: drop rows from routers that ignore the filter
+        return {r["address"]: r[".id"] for r in rows if r.get("list") == name and r.get("address")}
+
+    def add_addresses(self, name: str, addresses: list[str], comment: str = "uisp suspended"):
+        """Add addresses to a firewall address-list in bulk; existing entries are left alone."""
+        if not addresses:
+            return
+        errors = self.transport.add_many(
+            ADDRESS_LIST_MENU, [{"list": name, "address": a, "comment": comment} for a in addresses],
+        )
+        failed = [e for e in errors if e and "already have" not in e]
+        if failed:
+            raise RouterError(f"Router operation failed: {len(failed)} address-list adds failed: {failed[0]}", 400)
+
+    def remove_addresses(self, name: str, addresses: list[str]) -> int:
+        """Remove addresses from a firewall address-list in bulk; returns how many were listed."""
+        if not addresses:
+            return 0
+        entries = self.address_list(name, addresses[0] if len(addresses) == 1 else None)
+        ids = [entries[a] for a in addresses if a in entries]
+        if ids:
+            self.transport.remove(ADDRESS_LIST_MENU, ids)
+        return len(ids)
+
+    def sync_address_list(self, name: str, addresses: set[str], dry_run: bool = False,
+                          entries: dict[str, str] | None = None) -> dict:
+        """
+        Make a firewall address-list hold exactly `addresses`: one read of the
+        list (skipped when the caller passes `entries`), then one bulk add and
+        one bulk remove for the difference.
+        """
+        if entries is None:
+            entries = self.address_list(name)
+        to_add = sorted(addresses - entries.keys())
+        to_remove = sorted(entries.keys() - addresses)
+        if not dry_run:
+            self.add_addresses(name, to_add)
+            if to_remove:
+                self.transport.remove(ADDRESS_LIST_MENU, [entries[a] for a in to_remove])
+        return {"listed": len(entries), "to_add": to_add, "to_remove": to_remove}
+
+
+# Long-lived clients, one per router site
+_clients: dict[str, tuple] = {}
+_clients_lock = threading.Lock()
+_clients_pid = os.getpid()
+
+
+def get_router_client(router, verify: bool = True) -> MikroTikClient:
+    """
+    Return the shared client for a router, keeping its keep-alive pool
+    across requests. A changed Router entry (new URL or credentials)
+    replaces the old client; it is not closed, since other threads may be
+    mid-call on it, and its connections go away once it is garbage-collected.
+    """
+    global _clients_pid
+    with _clients_lock:
+        if _clients_pid != os.getpid():
+            _clients.clear()
+            _clients_pid = os.getpid()
+        key, client = _clients.get(router.site, (None, None))
+        if key == (router, verify):
+            return client
+        client = MikroTikClient(
+            router.api_url, router.username, router.password, verify=verify, site=router.site,
+            transport=router.transport, api_port=router.api_port,
+        )
+        _clients[router.site] = ((router, verify), client)
+        return client
+
+
+def close_router_clients():
+    """Close every pooled router client (worker shutdown)."""
+    with _clients_lock:
+        clients = [client for _, client in _clients.values()]
+        _clients.clear()
+    for client in clients:
+        client.close()
@@ -1,41 +1,165 @@
 import logging
+import threading
 import requests
+from app.core.metrics import timed
+from app.core.resilience import call_timeout
+from app.infra.http import get_session, reset_session
 from app.infra.telegram import TelegramNotifier
 from app.infra.whatsapp import send_whatsapp_notification
+from app.models.client_cache import ClientCache, client_cache_path
 
 
-def get_client_details(uisp_base_url: str, uisp_app_key: str, client_id: int):
-    """Fetch client data from UISP."""
-    url = f"{uisp_base_url.rstrip('/')}/crm/api/v1.0/clients/{client_id}"
-    headers = {
+def _uisp_headers(uisp_app_key: str) -> dict:
+    return {
         "X-Auth-App-Key": uisp_app_key,
         "Content-Type": "application/json",
     }
 
+
+def get_client_details(uisp_base_url: str, uisp_app_key: str, client_id: int):
+    """Fetch client data from UISP."""
+    url = f"{uisp_base_url.rstrip('/')}/crm/api/v1.0/clients/{client_id}"
+    headers = _uisp_headers(uisp_app_key)
+
     try:
-        r = requests.get(url, headers=headers, timeout=15)
+        with timed("uisp_fetch"):
+            r = get_session("uisp").get(url, headers=headers, timeout=call_timeout(15))
         r.raise_for_status()
-        return r.json()
+        return index_attributes(r.json())
+    except requests.ConnectionError as e:
+        reset_session("uisp")
+        logging.error(f"Failed to fetch client {client_id} details: {e}")
+        return None
     except Exception as e:
         logging.error(f"Failed to fetch client {client_id} details: {e}")
         return None
 
 
+def ping_uisp(cfg):
+    """Open the pooled UISP connection (TLS included) ahead of the first lookup."""
+    url = f"{cfg.uisp_base_url.rstrip('/')}/crm/api/v1.0/version"
+    try:
+        r = get_session("uisp").get(url, headers=_uisp_headers(cfg.uisp_app_key), timeout=call_timeout(5))
+    except requests.ConnectionError:
+        reset_session("uisp")
+        raise
+    r.raise_for_status()
+
+
+def index_attributes(client_data: dict) -> dict:
+    """Add attributeIndex ({key: value}) so lookups don't rescan the attributes list."""
+    client_data["attributeIndex"] = {
+        a.get("key"): a.get("value") for a in client_data.get("attributes", []) if a.get("key")
+    }
+    return client_data
+
+
+_client_cache: ClientCache | None = None
+_client_cache_lock = threading.Lock()
+
+
+def get_client_cache(cfg) -> ClientCache:
+    """Process-wide client cache backed by the shared STATE_DIR store."""
+    global _client_cache
+    path = client_cache_path(cfg)
+    with _client_cache_lock:
+        if _client_cache is None or _client_cache.path != path:
+            _client_cache = ClientCache(path, ttl=cfg.client_cache_ttl_seconds,
+                                        max_entries=cfg.client_cache_max_entries)
+        return _client_cache
+
+
+def get_client(cfg, client_id: int):
+    """Client details from the cache, fetching from UISP on a miss."""
+    cache = get_client_cache(cfg)
+    try:
+        client_data = cache.get(client_id)
+    except Exception as e:
+        logging.warning(f"Client cache unavailable: {e}")
+        cache, client_data = None, None
+    if client_data:
+        return client_data
+
+    client_data = get_client_details(cfg.uisp_base_url, cfg.uisp_app_key, client_id)
+    if client_data and cache:
+        cache.put(client_data)
+    return client_data
+
+
+def prefetch_clients(cfg, page_size: int | None = None) -> int:
+    """
+    Page through UISP's client list and warm the client cache,
+    so a billing-run burst needs no per-client CRM calls.
+    Returns the number of clients cached.
+    """
+    cache = get_client_cache(cfg)
+    page_size = page_size or cfg.client_prefetch_page_size
+    url = f"{cfg.uisp_base_url.rstrip('/')}/crm/api/v1.0/clients"
+    headers = _uisp_headers(cfg.uisp_app_key)
+    total = 0
+    offset = 0
+
+    while True:
+        r = get_session("uisp").get(
+            url, headers=headers, timeout=60,
+            params={"limit": page_size, "offset": offset, "isArchived": 0},
+        )
+        r.raise_for_status()
+        page = r.json()
+        if not page:
+            break
+        cache.put_many([index_attributes(c) for c in page if c.get("id") is not None])
+        total += len(page)
+        offset += len(page)
+        if len(page) < page_size:
+            break
+
+    cache.purge_expired()
+    logging.info(f"Prefetched {total} UISP clients")
+    return total
+
+
+def list_services(cfg, statuses: list[int], page_size: int | None = None) -> list[dict]:
+    """Page through UISP services with the given statuses (1 = active, 3 = suspended)."""
+    page_size = page_size or cfg.client_prefetch_page_size
+    url = f"{cfg.uisp_base_url.rstrip('/')}/crm/api/v1.0/clients/services"
+    headers = _uisp_headers(cfg.uisp_app_key)
+    services = []
+    offset = 0
+
+    while True:
+        r = get_session("uisp").get(
+            url, headers=headers, timeout=60,
+            params={"statuses[]": statuses, "limit": page_size, "offset": offset},
+        )
+        r.raise_for_status()
+        page = r.json()
+        services.extend(page)
+        offset += len(page)
+        if len(page) < page_size:
+            break
+
+    return services
+
+
+def invalidate_client(cfg, client_id: int):
+    """Drop a client's cached details (after a UISP edit/payment webhook)."""
+    get_client_cache(cfg).invalidate(client_id)
+
+
 def extract_whatsapp_number(client_data: dict) -> str | None:
     """Extract correct WhatsApp number from client attributes."""
-    dont_send = next((a for a in client_data.get("attributes", [])
-                      if a.get("key") == "dontSendWhatsapp"), None)
-    if dont_send and dont_send.get("value") == "1":
+    attributes = client_data.get("attributeIndex")
+    if attributes is None:
+        attributes = index_attributes(client_data)["attributeIndex"]
+
+    if attributes.get("dontSendWhatsapp") == "1":
         logging.info("Client opted out of WhatsApp notifications.")
         return None
 
-    notify_service = next((a for a in client_data.get("attributes", [])
-                           if a.get("key") == "notificationService"), None)
-    msg_number = next((a for a in client_data.get("attributes", [])
-                       if a.get("key") == "messagingNumber"), None)
-
-    if notify_service and notify_service.get("value", "").lower() == "whatsapp" and msg_number:
-        return msg_number.get("value")
+    notify_service = attributes.get("notificationService") or ""
+    if notify_service.lower() == "whatsapp" and "messagingNumber" in attributes:
+        return attributes["messagingNumber"]
 
     # fallback: try contacts
     for contact in client_data.get("contacts", []):
@@ -60,12 +184,14 @@ def build_message_text(client_data: dict) -> str:
     )
 
 
-def notify_client_suspension(cfg, client_id: int):
+def notify_client_suspension(cfg, client_id: int, client_data: dict | None = None):
     """
     Sends WhatsApp + Telegram notification to client.
+    Pass client_data when the caller has already fetched it.
     """
-    tg = TelegramNotifier(cfg.telegram_token, cfg.telegram_chat_id)
-    client_data = get_client_details(cfg.uisp_base_url, cfg.uisp_app_key, client_id)
+    tg = TelegramNotifier.from_config(cfg)
+    if client_data is None:
+        client_data = get_client(cfg, client_id)
     if not client_data:
         tg.send(f"❌ Failed to fetch client details for {client_id}", level="error")
         return False, "Failed to fetch client data"
@@ -82,7 +208,8 @@ def notify_client_suspension(cfg, client_id: int):
     amount = round(client_data.get("accountOutstanding", 0.0) + 50)
 
     ok, detail = send_whatsapp_notification(
-        cfg.whatsapp_phone_id, cfg.whatsapp_token, phone_number, message_text, amount, client_id
+        cfg.whatsapp_phone_id, cfg.whatsapp_token, phone_number, message_text, amount, client_id,
+        cfg.whatsapp_api_url,
     )
 
     if ok:
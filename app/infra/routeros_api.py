@@ -0,0 +1,265 @@
+import ssl
+import socket
+import hashlib
+import logging
+import binascii
+import threading
+
+API_PORT = 8728
+API_SSL_PORT = 8729
+# Commands in flight per pipelined batch
+PIPELINE_WINDOW = 100
+# Item ids per remove command
+REMOVE_CHUNK = 500
+
+
+class ApiError(Exception):
+    """
+    A command failed. category/message come from the router's !trap;
+    connection-level failures have category None.
+    """
+
+    def __init__(self, message: str, category: str | None = None, trap: bool = False):
+        super().__init__(message)
+        self.category = category
+        self.trap = trap
+
+
+def encode_length(n: int) -> bytes:
+    if n < 0x80:
+        return bytes([n])
+    if n < 0x4000:
+        return (n | 0x8000).to_bytes(2, "big")
+    if n < 0x200000:
+        return (n | 0xC00000).to_bytes(3, "big")
+    if n < 0x10000000:
+        return (n | 0xE0000000).to_bytes(4, "big")
+    return b"\xf0" + n.to_bytes(4, "big")
+
+
+def encode_sentence(words: list[str]) -> bytes:
+    out = bytearray()
+    for word in words:
+        data = word.encode()
+        out += encode_length(len(data)) + data
+    return bytes(out + b"\x00")
+
+
+class ApiConnection:
+    """
+    One authenticated RouterOS API socket (8728, or 8729 with TLS).
+    Not thread-safe on its own; ApiTransport serializes access.
+    """
+
+    def __init__(self, host: str, port: int, username: str, password: str,
+                 use_tls: bool = False, verify: bool = True, timeout: float = 15):
+        sock = socket.create_connection((host, port), timeout=timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if use_tls:
+            context = ssl.create_default_context()
+            if not verify:
+                context.check_hostname = False
+                context.verify_mode = ssl.CERT_NONE
+            sock = context.wrap_socket(sock, server_hostname=host)
+        self.sock = sock
+        self._reader = sock.makefile("rb")
+        self._tag = 0
+        try:
+            self._login(username, password)
+        except Exception:
+            self.close()
+            raise
+
+    def close(self):
+        try:
+            self._reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+    def _read_exact(self, n: int) -> bytes:
+        data = self._reader.read(n)
+        if len(data) != n:
+            raise ApiError("Connection closed by router")
+        return data
+
+    def _read_length(self) -> int:
+        first = self._read_exact(1)[0]
+        if first < 0x80:
+            return first
+        if first < 0xC0:
+            return ((first & 0x3F) << 8) | self._read_exact(1)[0]
+        if first < 0xE0:
+            return ((first & 0x1F) << 16) | int.from_bytes(self._read_exact(2), "big")
+        if first < 0xF0:
+            return ((first & 0x0F) << 24) | int.from_bytes(self._read_exact(3), "big")
+        return int.from_bytes(self._read_exact(4), "big")
+
+    def read_sentence(self) -> list[str]:
+        words = []
+        while True:
+            n = self._read_length()
+            if n == 0:
+                return words
+            words.append(self._read_exact(n).decode(errors="replace"))
+
+    def next_tag(self) -> str:
+        self._tag += 1
+        return str(self._tag)
+
+    def _login(self, username: str, password: str):
+        # RouterOS >= 6.43 accepts plain credentials; older builds answer
+        # with a challenge (=ret=) for the MD5 login
+        reply = self.call("/login", {"name": username, "password": password})
+        challenge = reply["done"].get("ret")
+        if challenge:
+            digest = hashlib.md5(b"\x00" + password.encode() + binascii.unhexlify(challenge)).hexdigest()
+            self.call("/login", {"name": username, "response": f"00{digest}"})
+
+    def call(self, command: str, attrs: dict | None = None, queries: list[str] | None = None) -> dict:
+        """Run one command; returns {"rows": [...], "done": {...}}."""
+        result = self.pipeline([(command, attrs, queries)])[0]
+        if isinstance(result, ApiError):
+            raise result
+        return result
+
+    def pipeline(self, commands: list[tuple]) -> list:
+        """
+        Send several tagged commands before reading any reply, then collect
+        the replies. Each result is {"rows", "done"} or an ApiError for a !trap.
+        """
+        tags = {}
+        payload = bytearray()
+        for i, (command, attrs, queries) in enumerate(commands):
+            tag = self.next_tag()
+            tags[tag] = i
+            words = [command]
+            words += [f"={k}={v}" for k, v in (attrs or {}).items()]
+            words += [f"?{q}" for q in (queries or [])]
+            words.append(f".tag={tag}")
+            payload += encode_sentence(words)
+        self.sock.sendall(bytes(payload))
+
+        results: list = [None] * len(commands)
+        rows: dict[str, list] = {tag: [] for tag in tags}
+        traps: dict[str, ApiError] = {}
+        pending = set(tags)
+        while pending:
+            words = self.read_sentence()
+            if not words:
+                continue
+            reply, attrs = words[0], _attributes(words[1:])
+            tag = attrs.pop(".tag", None)
+            if reply == "!fatal":
+                raise ApiError(f"Router closed the session: {' '.join(words[1:])}")
+            if tag not in pending:
+                continue
+            if reply == "!re":
+                rows[tag].append(attrs)
+            elif reply == "!trap":
+                traps[tag] = ApiError(attrs.get("message", "command failed"), attrs.get("category"), trap=True)
+            elif reply == "!done":
+                pending.discard(tag)
+                results[tags[tag]] = traps.get(tag) or {"rows": rows[tag], "done": attrs}
+        return results
+
+
+def _attributes(words: list[str]) -> dict:
+    attrs = {}
+    for word in words:
+        if word.startswith("="):
+            key, _, value = word[1:].partition("=")
+            attrs[key] = value
+        elif word.startswith(".tag="):
+            attrs[".tag"] = word[5:]
+    return attrs
+
+
+class ApiTransport:
+    """
+    RouterOS native API transport: one persistent authenticated connection
+    per router, reopened after any socket error. Commands from concurrent
+    threads are serialized on the connection; set_many() pipelines.
+    """
+
+    pipelined = True
+
+    def __init__(self, host: str, username: str, password: str, port: int | None = None,
+                 use_tls: bool = False, verify: bool = True):
+        self.host = host
+        self.port = port or (API_SSL_PORT if use_tls else API_PORT)
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.verify = verify
+        self._conn: ApiConnection | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def label(self) -> str:
+        return f"api{'-ssl' if self.use_tls else ''}://{self.host}:{self.port}"
+
+    def close(self):
+        with self._lock:
+            self._drop()
+
+    def _drop(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _run(self, commands: list[tuple], timeout: float) -> list:
+        with self._lock:
+            try:
+                if self._conn is None:
+                    self._conn = ApiConnection(self.host, self.port, self.username, self.password,
+                                               self.use_tls, self.verify, timeout)
+                    logging.debug(f"Opened RouterOS API session to {self.label}")
+                self._conn.sock.settimeout(timeout)
+                return self._conn.pipeline(commands)
+            except (OSError, ApiError) as e:
+                # A broken or half-read stream cannot be reused
+                self._drop()
+                if isinstance(e, ApiError) and e.trap:
+                    raise
+                raise ApiError(str(e)) from e
+
+    def print(self, menu: str, query: dict | None = None, proplist: str | None = None, timeout: float = 15) -> list[dict]:
+        attrs = {".proplist": proplist} if proplist else None
+        queries = [f"{k}={v}" for k, v in (query or {}).items()]
+        result = self._run([(f"/{menu}/print", attrs, queries)], timeout)[0]
+        if isinstance(result, ApiError):
+            raise result
+        return result["rows"]
+
+    def set(self, menu: str, item_id: str, props: dict, timeout: float = 15):
+        result = self._run([(f"/{menu}/set", {".id": item_id, **props}, None)], timeout)[0]
+        if isinstance(result, ApiError):
+            raise result
+
+    def set_many(self, menu: str, items: list[tuple[str, dict]], timeout: float = 15) -> list[str | None]:
+        """Pipeline one set per (id, props); returns an error message or None per item."""
+        if not items:
+            return []
+        commands = [(f"/{menu}/set", {".id": item_id, **props}, None) for item_id, props in items]
+        results = self._pipelined(commands, timeout)
+        return [str(r) if isinstance(r, ApiError) else None for r in results]
+
+    def _pipelined(self, commands: list[tuple], timeout: float) -> list:
+        results = []
+        # Bounded windows so neither side blocks on a full socket buffer
+        for i in range(0, len(commands), PIPELINE_WINDOW):
+            results += self._run(commands[i:i + PIPELINE_WINDOW], timeout)
+        return results
+
+    def add_many(self, menu: str, items: list[dict], timeout: float = 15) -> list[str | None]:
+        """Pipeline one add per item; returns an error message or None per item."""
+        results = self._pipelined([(f"/{menu}/add", props, None) for props in items], timeout)
+        return [str(r) if isinstance(r, ApiError) else None for r in results]
+
+    def remove(self, menu: str, ids: list[str], timeout: float = 15):
+        """Remove items by .id, many ids per command."""
+        chunks = [ids[i:i + REMOVE_CHUNK] for i in range(0, len(ids), REMOVE_CHUNK)]
+        for result in self._pipelined([(f"/{menu}/remove", {"numbers": ",".join(c)}, None) for c in chunks], timeout):
+            if isinstance(result, ApiError):
+                raise result
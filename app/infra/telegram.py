@@ -1,14 +1,37 @@
+import os
+import atexit
 import requests
 import logging
+import threading
+from app.core.metrics import NOTIFICATIONS, timed
+from app.core.resilience import call_timeout
+from app.infra.http import get_session, reset_session
+
+# Telegram rejects sendMessage text longer than this
+TELEGRAM_MAX_LENGTH = 4096
 
 
 class TelegramNotifier:
     """Telegram notification sender."""
 
-    def __init__(self, bot_token: str, chat_id: str):
+    def __init__(self, bot_token: str, chat_id: str, digest_window: float = 0, digest_max_messages: int = 50,
+                 api_url: str = "https://api.telegram.org"):
         self.bot_token = bot_token
         self.chat_id = chat_id
-        self.base_url = f"https://api.telegram.org/bot{self.bot_token}/sendMessage"
+        self.base_url = f"{api_url.rstrip('/')}/bot{self.bot_token}/sendMessage"
+        # With a digest window, non-error messages are batched into periodic digests
+        self.digest_window = digest_window
+        self.digest_max_messages = digest_max_messages
+
+    @classmethod
+    def from_config(cls, cfg) -> "TelegramNotifier":
+        return cls(
+            cfg.telegram_token,
+            cfg.telegram_chat_id,
+            digest_window=cfg.telegram_digest_seconds,
+            digest_max_messages=cfg.telegram_digest_max_messages,
+            api_url=cfg.telegram_api_url,
+        )
 
     def send(self, message: str, level: str = "info"):
         """Send a formatted message to Telegram."""
@@ -16,20 +39,150 @@ class TelegramNotifier:
             logging.warning("Telegram credentials missing; skipping notification.")
             return False
 
+        if self.digest_window > 0 and level != "error":
+            _get_digest(self).add(level, message)
+            return True
+
         prefix = "✅" if level == "info" else "❌"
+        return self._post(f"{prefix} {message}")
+
+    def _post(self, text: str, markdown: bool = True) -> bool:
+        """Send one message. Digests go as plain text: one stray * or _ would get all of them rejected."""
         payload = {
             "chat_id": self.chat_id,
-            "text": f"{prefix} {message}",
-            "parse_mode": "Markdown"
+            "text": text,
         }
+        if markdown:
+            payload["parse_mode"] = "Markdown"
         try:
-            r = requests.post(self.base_url, json=payload, timeout=10)
+            with timed("telegram_send"):
+                r = get_session("telegram").post(self.base_url, json=payload, timeout=call_timeout(10))
             if r.status_code == 200:
-                logging.info(f"Telegram message sent: {message}")
+                NOTIFICATIONS.labels("telegram", "sent").inc()
+                logging.info(f"Telegram message sent: {text}")
                 return True
             else:
+                NOTIFICATIONS.labels("telegram", "error").inc()
                 logging.error(f"Telegram API error {r.status_code}: {r.text}")
                 return False
         except Exception as e:
+            NOTIFICATIONS.labels("telegram", "error").inc()
+            if isinstance(e, requests.ConnectionError):
+                reset_session("telegram")
             logging.error(f"Telegram send failed: {e}")
             return False
+
+
+def telegram_length(text: str) -> int:
+    """Length as Telegram counts it: UTF-16 code units (most emoji take two)."""
+    return len(text.encode("utf-16-le")) // 2
+
+
+def _fit(line: str, limit: int) -> int:
+    """How many leading characters of line fit in limit UTF-16 units."""
+    units = 0
+    for i, ch in enumerate(line):
+        units += 2 if ord(ch) > 0xFFFF else 1
+        if units > limit:
+            return i
+    return len(line)
+
+
+def split_message(lines: list[str], limit: int = TELEGRAM_MAX_LENGTH) -> list[str]:
+    """Pack lines into as few messages as possible, each at most limit UTF-16 units."""
+    chunks = []
+    current = ""
+    for line in lines:
+        while telegram_length(line) > limit:
+            if current:
+                chunks.append(current)
+                current = ""
+            cut = _fit(line, limit)
+            chunks.append(line[:cut])
+            line = line[cut:]
+        if not line:
+            continue
+        candidate = f"{current}\n{line}" if current else line
+        if telegram_length(candidate) > limit:
+            chunks.append(current)
+            current = line
+        else:
+            current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class TelegramDigest:
+    """
+    Per-chat buffer that turns bursts of messages into digest posts.
+    Flushed when the window elapses, when max_messages are buffered, and at exit.
+    """
+
+    def __init__(self, notifier: TelegramNotifier):
+        self.notifier = notifier
+        self._buffer: dict[str, list[str]] = {}
+        self._count = 0
+        self._lock = threading.Lock()
+        self._flush_now = threading.Event()
+        self._thread = None
+
+    def add(self, level: str, message: str):
+        with self._lock:
+            self._buffer.setdefault(level, []).append(message)
+            self._count += 1
+            if self._count >= self.notifier.digest_max_messages:
+                self._flush_now.set()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="telegram-digest", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._flush_now.wait(self.notifier.digest_window)
+            self._flush_now.clear()
+            self.flush()
+            with self._lock:
+                # Idle: exit, and let the next message start a fresh window
+                if not self._buffer:
+                    self._thread = None
+                    return
+
+    def flush(self) -> int:
+        """Post everything buffered, one digest per level. Returns messages flushed."""
+        with self._lock:
+            buffer, self._buffer = self._buffer, {}
+            count, self._count = self._count, 0
+        for level, messages in buffer.items():
+            prefix = "✅" if level == "info" else "❌"
+            header = f"{prefix} {len(messages)} {level} message{'s' if len(messages) != 1 else ''}:"
+            for chunk in split_message([header] + [f"• {m}" for m in messages]):
+                self.notifier._post(chunk, markdown=False)
+        return count
+
+
+_digests: dict[tuple[int, str, str], TelegramDigest] = {}
+_digests_lock = threading.Lock()
+
+
+def _get_digest(notifier: TelegramNotifier) -> TelegramDigest:
+    # Keyed by pid too: a digest thread inherited through fork is not running
+    key = (os.getpid(), notifier.base_url, notifier.chat_id)
+    with _digests_lock:
+        digest = _digests.get(key)
+        if digest is None:
+            digest = _digests[key] = TelegramDigest(notifier)
+        return digest
+
+
+@atexit.register
+def flush_digests():
+    """Send any buffered digest messages (worker shutdown)."""
+    with _digests_lock:
+        digests = [d for (pid, _, _), d in _digests.items() if pid == os.getpid()]
+    if digests:
+        # urllib3's exit finalizers may already have drained the pool; with
+        # HTTP_POOL_BLOCK a drained pool would block forever, so start afresh
+        reset_session("telegram")
+    for digest in digests:
+        digest.flush()
@@ -2,6 +2,9 @@ import os
 import json
 import logging
 import requests
+from app.core.metrics import NOTIFICATIONS, timed
+from app.core.resilience import DeadlineExceeded, call_timeout
+from app.infra.http import get_session, reset_session
 
 log = logging.getLogger(__name__)
 
@@ -10,11 +13,25 @@ WHATSAPP_API_VERSION = "v24.0"
 WHATSAPP_TEMPLATE = "suspension_notice"
 WHATSAPP_LANG = "en_GB"
 WHATSAPP_IMAGE_URL = "https://uisp-ros1.afrieta.com/crm/suspension_notice.png"
+WHATSAPP_API_URL = "https://graph.facebook.com"
 
-def send_whatsapp_notification(phone_id: str, token: str, phone_number: str, message_text: str, amount: float, client_id: int) -> tuple[bool, str]:
+def send_whatsapp_notification(phone_id: str, token: str, phone_number: str, message_text: str, amount: float, client_id: int,
+                               api_url: str = WHATSAPP_API_URL) -> tuple[bool, str]:
     """
     Send a suspension WhatsApp notification to a customer.
     Returns (ok, detail_message).
+    """
+    status_code, detail = send_whatsapp_template(phone_id, token, phone_number, message_text, amount, client_id, api_url)
+    return status_code == 200, detail
+
+
+def send_whatsapp_template(phone_id: str, token: str, phone_number: str, message_text: str, amount: float, client_id: int,
+                           api_url: str = WHATSAPP_API_URL) -> tuple[int | None, str]:
+    """
+    Send the suspension template and return (http_status, detail_message).
+    http_status is None when the request never got a response and 0 when
+    credentials are missing, so callers can tell retryable failures
+    (None, 429, 5xx) from permanent ones.
 
     Args:
         phone_id: WhatsApp phone number ID
@@ -23,15 +40,16 @@ def send_whatsapp_notification(phone_id: str, token: str, phone_number: str, mes
         message_text: The message text to send
         amount: Reconnection fee amount
         client_id: Customer ID for payment reference
+        api_url: Graph API base URL (overridden for load tests)
     """
 
     if not phone_id or not token:
         msg = "Missing WhatsApp credentials (phone_id or token)"
         log.error(msg)
-        return False, msg
+        return 0, msg
 
     # --- Build URL & headers ---
-    url = f"https://graph.facebook.com/{WHATSAPP_API_VERSION}/{phone_id}/messages"
+    url = f"{api_url.rstrip('/')}/{WHATSAPP_API_VERSION}/{phone_id}/messages"
     headers = {
         "Authorization": f"Bearer {token}",
         "Content-Type": "application/json",
@@ -78,14 +96,25 @@ def send_whatsapp_notification(phone_id: str, token: str, phone_number: str, mes
     log.info("[WhatsApp] Sending payload:\n%s", json.dumps(payload, indent=2))
 
     try:
-        response = requests.post(url, headers=headers, json=payload, timeout=15)
+        timeout = call_timeout(15)
+    except DeadlineExceeded as e:
+        log.warning("[WhatsApp] Not sent: %s", e)
+        return None, str(e)
+
+    try:
+        with timed("whatsapp_send"):
+            response = get_session("whatsapp").post(url, headers=headers, json=payload, timeout=timeout)
         log.info("[WhatsApp] Response: %s %s", response.status_code, response.text)
+        NOTIFICATIONS.labels("whatsapp", str(response.status_code)).inc()
 
         if response.status_code == 200:
-            return True, "WhatsApp notification sent successfully."
+            return 200, "WhatsApp notification sent successfully."
         else:
-            return False, f"WhatsApp API error {response.status_code}: {response.text}"
+            return response.status_code, f"WhatsApp API error {response.status_code}: {response.text}"
 
     except requests.exceptions.RequestException as e:
+        if isinstance(e, requests.exceptions.ConnectionError):
+            reset_session("whatsapp")
+        NOTIFICATIONS.labels("whatsapp", "error").inc()
         log.error("[WhatsApp] Exception: %s", e)
-        return False, str(e)
+        return None, str(e)
@@ -0,0 +1 @@
+"""Persistent state (SQLite) shared by all workers on a host."""
@@ -0,0 +1,112 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from app.models.db import get_connection
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS clients (
+    id INTEGER PRIMARY KEY,
+    data TEXT NOT NULL,
+    fetched_at REAL NOT NULL
+);
+"""
+
+class ClientCache:
+    """
+    UISP client details with a TTL.
+    An in-process LRU sits in front of a SQLite table shared by every worker
+    on the host, so a prefetch run in one process warms all of them. A front
+    copy is used only while the table row has the same fetched_at, so an
+    invalidation in any worker takes effect everywhere at once; the front
+    saves decoding the JSON, not the primary key read.
+    """
+
+    _initialized: set[str] = set()
+
+    def __init__(self, path: str, ttl: float = 3600, max_entries: int = 20000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # client id -> (fetched_at of the row it was read from, data)
+        self._front: OrderedDict[int, tuple[float, dict]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if path not in ClientCache._initialized:
+            self._conn.executescript(SCHEMA)
+            ClientCache._initialized.add(path)
+
+    @property
+    def _conn(self):
+        return get_connection(self.path)
+
+    def get(self, client_id: int) -> dict | None:
+        with self._lock:
+            cached = self._front.get(client_id)
+        # The data column is only read when the front copy is missing or stale
+        row = self._conn.execute(
+            "SELECT fetched_at, CASE WHEN fetched_at = ? THEN NULL ELSE data END AS data "
+            "FROM clients WHERE id = ? AND fetched_at >= ?",
+            (cached[0] if cached else None, client_id, time.time() - self.ttl),
+        ).fetchone()
+        if row is None:
+            with self._lock:
+                self._front.pop(client_id, None)
+                self.misses += 1
+            return None
+
+        if row["data"] is None:
+            data = cached[1]
+            with self._lock:
+                if client_id in self._front:
+                    self._front.move_to_end(client_id)
+        else:
+            data = json.loads(row["data"])
+            self._remember(client_id, row["fetched_at"], data)
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put_many(self, clients: list[dict]):
+        now = time.time()
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO clients (id, data, fetched_at) VALUES (?, ?, ?)",
+            [(c["id"], json.dumps(c), now) for c in clients],
+        )
+        for client in clients:
+            self._remember(client["id"], now, client)
+
+    def put(self, client: dict):
+        self.put_many([client])
+
+    def invalidate(self, client_id: int):
+        self._conn.execute("DELETE FROM clients WHERE id = ?", (client_id,))
+        with self._lock:
+            self._front.pop(client_id, None)
+
+    def purge_expired(self) -> int:
+        cur = self._conn.execute("DELETE FROM clients WHERE fetched_at < ?", (time.time() - self.ttl,))
+        return cur.rowcount
+
+    def _remember(self, client_id: int, fetched_at: float, data: dict):
+        with self._lock:
+            self._front[client_id] = (fetched_at, data)
+            self._front.move_to_end(client_id)
+            while len(self._front) > self.max_entries:
+                self._front.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "front_entries": len(self._front),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+def client_cache_path(cfg) -> str:
+    return os.path.join(cfg.state_dir, "clients.db")
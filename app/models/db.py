@@ -0,0 +1,47 @@
+import os
+import sqlite3
+import threading
+
+
+def _os_thread_local():
+    """
+    threading.local, or under gevent the unpatched one: a patched local is
+    per greenlet, which would open a connection per request. SQLite calls
+    never yield to the hub, so greenlets cannot interleave on a shared
+    connection inside a statement or transaction.
+    """
+    try:
+        from gevent import monkey
+    except ImportError:
+        return threading.local()
+    if monkey.is_module_patched("threading"):
+        return monkey.get_original("threading", "local")()
+    return threading.local()
+
+
+_local = _os_thread_local()
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """Open a SQLite database in WAL mode so several workers can share it."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    return conn
+
+
+def get_connection(path: str) -> sqlite3.Connection:
+    """Per-thread (and per-process) connection to a database file."""
+    conns = getattr(_local, "conns", None)
+    if conns is None or _local.pid != os.getpid():
+        conns = _local.conns = {}
+        _local.pid = os.getpid()
+    conn = conns.get(path)
+    if conn is None:
+        conn = conns[path] = connect(path)
+    return conn
@@ -0,0 +1,194 @@
+import os
+import time
+import fcntl
+import atexit
+import logging
+import threading
+from collections import OrderedDict
+from app.core.config import get_config
+from app.models.db import get_connection
+
+CLAIMED = "claimed"
+PROCESSED = "processed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS webhooks (
+    uuid TEXT PRIMARY KEY,
+    entity_type TEXT,
+    entity_id TEXT,
+    change_type TEXT,
+    status TEXT NOT NULL,
+    response TEXT,
+    created_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS webhooks_created ON webhooks (created_at);
+"""
+
+COMPACT_INTERVAL = 3600
+COMPACT_BATCH = 5000
+
+
+class IdempotencyStore:
+    """
+    Record of UISP webhook uuids already seen.
+    Backed by a SQLite WAL table shared by every gunicorn worker on the host,
+    with an in-process LRU of recently processed uuids in front so repeats
+    skip the database. claim() is a single INSERT OR IGNORE, so two
+    concurrent retries of the same webhook cannot both win. Claims stay
+    out of the LRU: another process may release them. A claim older than
+    claim_timeout (its worker died) is taken over by the next retry.
+    """
+
+    _initialized: set[str] = set()
+
+    def __init__(self, path: str | None = None, ttl: float | None = None, front_size: int | None = None,
+                 claim_timeout: float = 120):
+        if path is None or ttl is None or front_size is None:
+            cfg = get_config()
+            path = path or idempotency_path(cfg)
+            ttl = ttl if ttl is not None else cfg.idempotency_ttl_days * 86400
+            front_size = front_size if front_size is not None else cfg.idempotency_front_size
+        self.path = path
+        self.ttl = ttl
+        self.front_size = front_size
+        self.claim_timeout = claim_timeout
+        self._front: OrderedDict[str, None] = OrderedDict()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        if path not in IdempotencyStore._initialized:
+            self._conn.executescript(SCHEMA)
+            IdempotencyStore._initialized.add(path)
+
+    @property
+    def _conn(self):
+        return get_connection(self.path)
+
+    def _remember(self, webhook_uuid: str):
+        with self._lock:
+            self._front[webhook_uuid] = None
+            self._front.move_to_end(webhook_uuid)
+            if len(self._front) > self.front_size:
+                self._front.popitem(last=False)
+
+    def _seen_locally(self, webhook_uuid: str) -> bool:
+        with self._lock:
+            if webhook_uuid in self._front:
+                self._front.move_to_end(webhook_uuid)
+                return True
+            return False
+
+    def claim(self, webhook_uuid: str, entity_type: str = "", entity_id: str = "", change_type: str = "") -> bool:
+        """
+        Record a webhook as in progress. Returns False if it was already
+        processed or another claim on it is younger than claim_timeout.
+        """
+        if self._seen_locally(webhook_uuid):
+            return False
+        now = time.time()
+        cur = self._conn.execute(
+            "INSERT INTO webhooks (uuid, entity_type, entity_id, change_type, status, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (uuid) DO UPDATE SET created_at = excluded.created_at "
+            "WHERE webhooks.status = ? AND webhooks.created_at < ?",
+            (webhook_uuid, entity_type, entity_id, change_type, CLAIMED, now, CLAIMED, now - self.claim_timeout),
+        )
+        return cur.rowcount == 1
+
+    def release(self, webhook_uuid: str):
+        """Forget an unfinished claim so a UISP retry is processed again."""
+        self._conn.execute("DELETE FROM webhooks WHERE uuid = ? AND status = ?", (webhook_uuid, CLAIMED))
+        with self._lock:
+            self._front.pop(webhook_uuid, None)
+
+    def is_duplicate(self, webhook_uuid: str) -> bool:
+        if self._seen_locally(webhook_uuid):
+            return True
+        row = self._conn.execute("SELECT status FROM webhooks WHERE uuid = ?", (webhook_uuid,)).fetchone()
+        if row and row["status"] == PROCESSED:
+            self._remember(webhook_uuid)
+        return row is not None
+
+    def mark_processed(self, webhook_uuid: str, entity_type: str, entity_id: str, change_type: str, response: str):
+        """Store the final response for a webhook (claims it if not already claimed)."""
+        self._conn.execute(
+            "INSERT INTO webhooks (uuid, entity_type, entity_id, change_type, status, response, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (uuid) DO UPDATE SET status = excluded.status, response = excluded.response",
+            (webhook_uuid, entity_type, entity_id, change_type, PROCESSED, response, time.time()),
+        )
+        self._remember(webhook_uuid)
+
+    def get(self, webhook_uuid: str) -> dict | None:
+        row = self._conn.execute("SELECT * FROM webhooks WHERE uuid = ?", (webhook_uuid,)).fetchone()
+        return dict(row) if row else None
+
+    def compact(self) -> int:
+        """Delete records older than the TTL in small batches. Returns rows removed."""
+        cutoff = time.time() - self.ttl
+        removed = 0
+        while True:
+            cur = self._conn.execute(
+                "DELETE FROM webhooks WHERE uuid IN "
+                "(SELECT uuid FROM webhooks WHERE created_at < ? ORDER BY created_at LIMIT ?)",
+                (cutoff, COMPACT_BATCH),
+            )
+            removed += cur.rowcount
+            if cur.rowcount < COMPACT_BATCH:
+                break
+        if removed:
+            logging.info(f"Idempotency store compacted: {removed} expired webhooks removed")
+        return removed
+
+    def start_compaction(self, interval: float = COMPACT_INTERVAL):
+        """
+        Compact every interval until stop_compaction(). Only the process
+        holding an flock next to the database compacts, so the workers of
+        one host do not all delete from the same file.
+        """
+        def run():
+            lock_file = None
+            while not self._stop.is_set():
+                if lock_file is None:
+                    lock_file = _try_lock(f"{self.path}.compact.lock")
+                if lock_file is not None:
+                    try:
+                        self.compact()
+                    except Exception as e:
+                        logging.warning(f"Idempotency compaction failed: {e}")
+                self._stop.wait(interval)
+            if lock_file is not None:
+                lock_file.close()
+
+        threading.Thread(target=run, name="idempotency-compact", daemon=True).start()
+
+    def stop_compaction(self):
+        self._stop.set()
+
+
+def _try_lock(path: str):
+    """An open file holding an exclusive flock on path, or None if another process has it."""
+    f = open(path, "a")
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+
+def get_idempotency_store(cfg=None) -> IdempotencyStore:
+    """Process-wide store; starts TTL compaction on first use in each process."""
+    global _store, _store_pid
+    with _store_lock:
+        if _store is None or _store_pid != os.getpid():
+            cfg = cfg or get_config()
+            _store = IdempotencyStore(idempotency_path(cfg), cfg.idempotency_ttl_days * 86400,
+                                      cfg.idempotency_front_size, cfg.idempotency_claim_timeout_seconds)
+            _store_pid = os.getpid()
+            _store.start_compaction()
+            atexit.register(_store.stop_compaction)
+        return _store
+
+
+def idempotency_path(cfg) -> str:
+    return os.path.join(cfg.state_dir, "idempotency.db")
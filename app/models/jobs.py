@@ -0,0 +1,253 @@
+import os
+import json
+import time
+import uuid as uuidlib
+from app.models.db import get_connection
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+DEAD = "dead"
+# Superseded or cancelled out by a later webhook for the same address
+COALESCED = "coalesced"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    uuid TEXT NOT NULL UNIQUE,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    run_at REAL NOT NULL,
+    locked_at REAL,
+    locked_by TEXT,
+    result TEXT,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, run_at);
+CREATE TABLE IF NOT EXISTS shard_members (
+    member_id TEXT PRIMARY KEY,
+    started_at REAL NOT NULL,
+    heartbeat_at REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+# Added after the first release; databases created before them are migrated
+MIGRATIONS = {
+    "coalesce_key": "CREATE INDEX IF NOT EXISTS jobs_coalesce ON jobs (coalesce_key, status)",
+    "shard_key": "CREATE INDEX IF NOT EXISTS jobs_shard ON jobs (shard_key, status)",
+}
+
+
+class JobQueue:
+    """
+    Durable job queue in a SQLite WAL database.
+    Jobs are keyed by a unique uuid (the UISP webhook uuid when present), so
+    enqueuing a retried webhook returns the existing job instead of a new one.
+    """
+
+    _initialized: set[str] = set()
+
+    def __init__(self, path: str):
+        self.path = path
+        if path not in JobQueue._initialized:
+            self._conn.executescript(SCHEMA)
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            for column, index in MIGRATIONS.items():
+                if column not in columns:
+                    self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} TEXT")
+                self._conn.execute(index)
+            JobQueue._initialized.add(path)
+
+    @property
+    def _conn(self):
+        return get_connection(self.path)
+
+    def enqueue(self, kind: str, payload: dict, uuid: str | None = None, delay: float = 0,
+                shard_key: str | None = None) -> tuple[dict, bool]:
+        """
+        Persist a job. Returns (job, created); created is False for a known uuid.
+        shard_key (a router site) routes the job to the member owning it.
+        """
+        now = time.time()
+        job_uuid = uuid or str(uuidlib.uuid4())
+        cur = self._conn.execute(
+            "INSERT OR IGNORE INTO jobs (uuid, kind, payload, status, run_at, shard_key, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_uuid, kind, json.dumps(payload), QUEUED, now + delay, shard_key, now, now),
+        )
+        return self.get(job_uuid), cur.rowcount == 1
+
+    def enqueue_coalesced(self, kind: str, payload: dict, key: str, merge, uuid: str | None = None,
+                          delay: float = 0, shard_key: str | None = None) -> tuple[dict, bool, list[dict]]:
+        """
+        Enqueue a job that absorbs the still-queued jobs with the same key.
+        merge(pending_payloads, payload) returns the payload to run, or None
+        when the commands cancel out. The job runs when the oldest pending
+        one would have (or after delay), so a flapping key cannot starve.
+        Returns (job, created, superseded jobs).
+        """
+        now = time.time()
+        job_uuid = uuid or str(uuidlib.uuid4())
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            existing = self.get(job_uuid)
+            if existing:
+                conn.execute("COMMIT")
+                return existing, False, []
+            rows = conn.execute(
+                "SELECT * FROM jobs WHERE coalesce_key = ? AND kind = ? AND status = ? ORDER BY id",
+                (key, kind, QUEUED),
+            ).fetchall()
+            pending = [_to_dict(row) for row in rows]
+            merged = merge([job["payload"] for job in pending], payload) if pending else payload
+            run_at = min([job["run_at"] for job in pending] + [now + delay])
+
+            for job in pending:
+                job["status"] = COALESCED
+                job["result"] = {"ok": True, "coalesced": True, "message": f"Superseded by {job_uuid}"}
+                conn.execute(
+                    "UPDATE jobs SET status = ?, result = ?, updated_at = ? WHERE id = ?",
+                    (COALESCED, json.dumps(job["result"]), now, job["id"]),
+                )
+            if merged is None:
+                result = {"ok": True, "coalesced": True, "message": "Cancelled out by an opposing command"}
+                conn.execute(
+                    "INSERT INTO jobs (uuid, kind, payload, status, run_at, result, coalesce_key, shard_key, "
+                    "created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (job_uuid, kind, json.dumps(payload), COALESCED, now, json.dumps(result), key, shard_key,
+                     now, now),
+                )
+            else:
+                conn.execute(
+                    "INSERT INTO jobs (uuid, kind, payload, status, run_at, coalesce_key, shard_key, created_at, "
+                    "updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (job_uuid, kind, json.dumps(merged), QUEUED, run_at, key, shard_key, now, now),
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return self.get(job_uuid), True, pending
+
+    def get(self, job_uuid: str) -> dict | None:
+        row = self._conn.execute("SELECT * FROM jobs WHERE uuid = ?", (job_uuid,)).fetchone()
+        return _to_dict(row) if row else None
+
+    def claim(self, worker_id: str) -> dict | None:
+        """Atomically take the next due job and mark it running."""
+        now = time.time()
+        row = self._conn.execute(
+            "UPDATE jobs SET status = ?, attempts = attempts + 1, locked_at = ?, locked_by = ?, updated_at = ? "
+            "WHERE id = (SELECT id FROM jobs WHERE status = ? AND run_at <= ? ORDER BY run_at, id LIMIT 1) "
+            "RETURNING *",
+            (RUNNING, now, worker_id, now, QUEUED, now),
+        ).fetchone()
+        return _to_dict(row) if row else None
+
+    def claim_sharded(self, worker_id: str, owned: list[str], known: list[str], per_shard: int = 1) -> dict | None:
+        """
+        Like claim(), but only jobs whose shard_key is in owned, and never
+        more than per_shard running jobs per shard_key across all members.
+        Jobs without a shard_key, or with one not in known (a router removed
+        from the config), are taken by any member.
+        """
+        now = time.time()
+        row = self._conn.execute(
+            "UPDATE jobs SET status = ?, attempts = attempts + 1, locked_at = ?, locked_by = ?, updated_at = ? "
+            "WHERE id = (SELECT id FROM jobs AS j WHERE status = ? AND run_at <= ? AND (shard_key IS NULL "
+            "OR shard_key NOT IN (SELECT value FROM json_each(?)) "
+            "OR (shard_key IN (SELECT value FROM json_each(?)) AND (SELECT COUNT(*) FROM jobs AS r "
+            "WHERE r.shard_key = j.shard_key AND r.status = ?) < ?)) ORDER BY run_at, id LIMIT 1) "
+            "RETURNING *",
+            (RUNNING, now, worker_id, now, QUEUED, now, json.dumps(known), json.dumps(owned), RUNNING, per_shard),
+        ).fetchone()
+        return _to_dict(row) if row else None
+
+    def heartbeat(self, member_id: str):
+        """Record that a worker process is alive and taking sharded jobs."""
+        now = time.time()
+        self._conn.execute(
+            "INSERT INTO shard_members (member_id, started_at, heartbeat_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (member_id) DO UPDATE SET heartbeat_at = excluded.heartbeat_at",
+            (member_id, now, now),
+        )
+
+    def live_members(self, ttl: float) -> list[str]:
+        """Members that have sent a heartbeat within ttl seconds; older rows are removed."""
+        now = time.time()
+        self._conn.execute("DELETE FROM shard_members WHERE heartbeat_at < ?", (now - ttl * 10,))
+        rows = self._conn.execute(
+            "SELECT member_id FROM shard_members WHERE heartbeat_at >= ? ORDER BY member_id", (now - ttl,),
+        ).fetchall()
+        return [row["member_id"] for row in rows]
+
+    def leave(self, member_id: str):
+        self._conn.execute("DELETE FROM shard_members WHERE member_id = ?", (member_id,))
+
+    def release_member(self, member_id: str) -> int:
+        """Requeue the running jobs of a member that has exited."""
+        cur = self._conn.execute(
+            "UPDATE jobs SET status = ?, locked_at = NULL, locked_by = NULL, updated_at = ? "
+            "WHERE status = ? AND locked_by = ?",
+            (QUEUED, time.time(), RUNNING, member_id),
+        )
+        return cur.rowcount
+
+    def complete(self, job_id: int, status: str, result: dict | None = None, error: str | None = None):
+        self._conn.execute(
+            "UPDATE jobs SET status = ?, result = ?, last_error = ?, locked_at = NULL, locked_by = NULL, "
+            "updated_at = ? WHERE id = ?",
+            (status, json.dumps(result) if result is not None else None, error, time.time(), job_id),
+        )
+
+    def retry(self, job_id: int, delay: float, error: str, result: dict | None = None, count_attempt: bool = True):
+        """
+        Put a running job back in the queue after delay seconds.
+        With count_attempt=False the claim does not use up one of its attempts.
+        """
+        now = time.time()
+        self._conn.execute(
+            "UPDATE jobs SET status = ?, run_at = ?, result = ?, last_error = ?, locked_at = NULL, "
+            "locked_by = NULL, attempts = attempts - ?, updated_at = ? WHERE id = ?",
+            (QUEUED, now + delay, json.dumps(result) if result is not None else None, error,
+             0 if count_attempt else 1, now, job_id),
+        )
+
+    def requeue_stale(self, visibility_timeout: float) -> int:
+        """Return jobs held by a crashed worker to the queue."""
+        now = time.time()
+        cur = self._conn.execute(
+            "UPDATE jobs SET status = ?, locked_at = NULL, locked_by = NULL, updated_at = ? "
+            "WHERE status = ? AND locked_at < ?",
+            (QUEUED, now, RUNNING, now - visibility_timeout),
+        )
+        return cur.rowcount
+
+    def purge(self, older_than: float) -> int:
+        """Delete finished jobs last updated before the given timestamp."""
+        cur = self._conn.execute(
+            "DELETE FROM jobs WHERE status IN (?, ?, ?, ?) AND updated_at < ?",
+            (SUCCEEDED, FAILED, DEAD, COALESCED, older_than),
+        )
+        return cur.rowcount
+
+    def counts(self) -> dict:
+        rows = self._conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+
+def _to_dict(row) -> dict:
+    job = dict(row)
+    job["payload"] = json.loads(job["payload"])
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+
+def job_queue_path(cfg) -> str:
+    return os.path.join(cfg.state_dir, "jobs.db")
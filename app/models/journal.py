@@ -0,0 +1,208 @@
+import os
+import re
+import json
+import time
+import fcntl
+from datetime import datetime, timezone
+from app.models.db import get_connection
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS actions (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    uuid TEXT,
+    client_id INTEGER,
+    ip TEXT,
+    site TEXT,
+    action TEXT NOT NULL,
+    outcome TEXT NOT NULL,
+    duration_ms REAL,
+    stages TEXT,
+    message TEXT
+);
+CREATE INDEX IF NOT EXISTS actions_ts ON actions (ts);
+CREATE INDEX IF NOT EXISTS actions_client ON actions (client_id, ts);
+CREATE INDEX IF NOT EXISTS actions_ip ON actions (ip, ts);
+CREATE INDEX IF NOT EXISTS actions_site ON actions (site, ts);
+"""
+
+COLUMNS = ("ts", "uuid", "client_id", "ip", "site", "action", "outcome", "duration_ms", "stages", "message")
+# Filters accepted by query(), each backed by an index ending in ts
+FILTERS = ("client_id", "ip", "site")
+# PRAGMA user_version of a month file once compact() has rebuilt it
+COMPACTED = 1
+MONTH_FILE = re.compile(r"^actions-(\d{4})-(\d{2})\.db$")
+MONTH = re.compile(r"^\d{4}-\d{2}$")
+
+
+def month_of(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m")
+
+
+def add_months(month: str, n: int) -> str:
+    year, mon = map(int, month.split("-"))
+    index = year * 12 + mon - 1 + n
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+class ActionJournal:
+    """
+    Append-only record of every suspend/unsuspend outcome, one SQLite file
+    per UTC month (actions-YYYY-MM.db), so retention drops whole files and
+    a query only opens the months its time range covers.
+    """
+
+    _initialized: set[str] = set()
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def path(self, month: str) -> str:
+        return os.path.join(self.directory, f"actions-{month}.db")
+
+    def _conn(self, month: str):
+        path = self.path(month)
+        conn = get_connection(path)
+        if path not in ActionJournal._initialized:
+            conn.executescript(SCHEMA)
+            ActionJournal._initialized.add(path)
+        return conn
+
+    def months(self) -> list[str]:
+        """Months with a journal file, newest first."""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        found = (MONTH_FILE.match(name) for name in names)
+        return sorted((f"{m.group(1)}-{m.group(2)}" for m in found if m), reverse=True)
+
+    def append(self, rows: list[dict]) -> int:
+        """Write rows in one transaction per month file."""
+        by_month: dict[str, list[tuple]] = {}
+        for row in rows:
+            stages = json.dumps(row["stages"], separators=(",", ":")) if row.get("stages") else None
+            values = tuple(stages if c == "stages" else row.get(c) for c in COLUMNS)
+            by_month.setdefault(month_of(row["ts"]), []).append(values)
+        for month, values in by_month.items():
+            conn = self._conn(month)
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    f"INSERT INTO actions ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})", values)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return len(rows)
+
+    def query(self, since: float | None = None, until: float | None = None, limit: int = 100,
+              action: str | None = None, cursor: str | None = None, **filters) -> list[dict]:
+        """
+        Newest first, at most limit rows with since <= ts < until. filters
+        are column=value pairs from FILTERS. Page back by passing the last
+        row's cursor_of() as cursor: rows are ordered by (ts, id), so rows
+        sharing a timestamp are not skipped.
+        """
+        clauses, params = [], []
+        for column, value in filters.items():
+            if column not in FILTERS:
+                raise ValueError(f"Unknown filter '{column}'")
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if action:
+            clauses.append("action = ?")
+            params.append(action)
+        if since is not None:
+            clauses.append("ts >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("ts < ?")
+            params.append(until)
+        after = parse_cursor(cursor) if cursor else None
+
+        first = month_of(since) if since is not None else None
+        last = month_of(until) if until is not None else None
+        if after and (last is None or after[1] < last):
+            last = after[1]
+        rows = []
+        for month in self.months():
+            if len(rows) >= limit or (first and month < first):
+                break
+            if last and month > last:
+                continue
+            month_clauses, month_params = list(clauses), list(params)
+            if after and month == after[1]:
+                # Older months hold only earlier timestamps
+                month_clauses.append("(ts < ? OR (ts = ? AND id < ?))")
+                month_params += [after[0], after[0], after[2]]
+            where = f"WHERE {' AND '.join(month_clauses)}" if month_clauses else ""
+            found = self._conn(month).execute(
+                f"SELECT * FROM actions {where} ORDER BY ts DESC, id DESC LIMIT ?",
+                (*month_params, limit - len(rows)),
+            ).fetchall()
+            rows += [_entry(row, month) for row in found]
+        return rows
+
+    def purge(self, keep_months: int, now: float | None = None) -> list[str]:
+        """Delete the files of months older than the last keep_months."""
+        oldest = add_months(month_of(now or time.time()), -(keep_months - 1))
+        removed = []
+        for month in self.months():
+            if month >= oldest:
+                continue
+            for suffix in ("", "-wal", "-shm"):
+                try:
+                    os.remove(self.path(month) + suffix)
+                except FileNotFoundError:
+                    pass
+            ActionJournal._initialized.discard(self.path(month))
+            removed.append(month)
+        return removed
+
+    def compact(self, month: str) -> bool:
+        """
+        Rebuild a closed month's file: rows arrive in ts order but the
+        client/IP/site indexes fill in random order and end up with half
+        empty pages. Returns False if another process holds the lock or
+        the month is already compacted.
+        """
+        with open(os.path.join(self.directory, "maintenance.lock"), "a") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return False
+            conn = self._conn(month)
+            if conn.execute("PRAGMA user_version").fetchone()[0] == COMPACTED:
+                return False
+            conn.execute("VACUUM")
+            conn.execute(f"PRAGMA user_version = {COMPACTED}")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            conn.execute("PRAGMA optimize")
+        return True
+
+
+def _entry(row, month: str) -> dict:
+    entry = dict(row)
+    entry["stages"] = json.loads(entry["stages"]) if entry["stages"] else {}
+    entry["id"] = f"{month}/{entry['id']}"
+    return entry
+
+
+def cursor_of(entry: dict) -> str:
+    """Paging cursor for a query() row: its ts and id, e.g. "1760000000.5:2025-10/42"."""
+    return f"{entry['ts']!r}:{entry['id']}"
+
+
+def parse_cursor(cursor: str) -> tuple[float, str, int]:
+    """(ts, month, id) from cursor_of(); ValueError if malformed."""
+    ts, _, entry_id = cursor.partition(":")
+    month, _, row_id = entry_id.partition("/")
+    if not MONTH.match(month):
+        raise ValueError(f"Invalid cursor '{cursor}'")
+    return float(ts), month, int(row_id)
+
+
+def journal_dir(cfg) -> str:
+    return os.path.join(cfg.state_dir, "journal")
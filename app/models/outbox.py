@@ -0,0 +1,122 @@
+import os
+import time
+from app.models.db import get_connection
+
+PENDING = "pending"
+SENDING = "sending"
+DELIVERED = "delivered"
+FAILED = "failed"
+SKIPPED = "skipped"
+CANCELLED = "cancelled"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS notifications (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    client_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    locked_at REAL,
+    last_error TEXT,
+    detail TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS notifications_due ON notifications (status, next_attempt_at);
+CREATE INDEX IF NOT EXISTS notifications_client ON notifications (client_id, id);
+"""
+
+
+class NotificationOutbox:
+    """
+    Client notifications waiting to be sent, with per-client delivery status.
+    Rows are written when a suspension succeeds and drained by the dispatcher.
+    """
+
+    _initialized: set[str] = set()
+
+    def __init__(self, path: str):
+        self.path = path
+        if path not in NotificationOutbox._initialized:
+            self._conn.executescript(SCHEMA)
+            NotificationOutbox._initialized.add(path)
+
+    @property
+    def _conn(self):
+        return get_connection(self.path)
+
+    def enqueue(self, client_id: int, kind: str = "suspension", delay: float = 0) -> bool:
+        """
+        Add a notification unless one is already waiting for this client.
+        It becomes due after delay seconds, leaving time to cancel it.
+        """
+        now = time.time()
+        cur = self._conn.execute(
+            "INSERT INTO notifications (client_id, kind, status, next_attempt_at, created_at, updated_at) "
+            "SELECT ?, ?, ?, ?, ?, ? WHERE NOT EXISTS "
+            "(SELECT 1 FROM notifications WHERE client_id = ? AND kind = ? AND status IN (?, ?))",
+            (client_id, kind, PENDING, now + delay, now, now, client_id, kind, PENDING, SENDING),
+        )
+        return cur.rowcount == 1
+
+    def claim(self) -> dict | None:
+        """Atomically take the next due notification."""
+        now = time.time()
+        row = self._conn.execute(
+            "UPDATE notifications SET status = ?, attempts = attempts + 1, locked_at = ?, updated_at = ? "
+            "WHERE id = (SELECT id FROM notifications WHERE status = ? AND next_attempt_at <= ? "
+            "ORDER BY next_attempt_at, id LIMIT 1) RETURNING *",
+            (SENDING, now, now, PENDING, now),
+        ).fetchone()
+        return dict(row) if row else None
+
+    def finish(self, notification_id: int, status: str, detail: str | None = None, error: str | None = None):
+        self._conn.execute(
+            "UPDATE notifications SET status = ?, detail = ?, last_error = ?, locked_at = NULL, updated_at = ? "
+            "WHERE id = ?",
+            (status, detail, error, time.time(), notification_id),
+        )
+
+    def retry(self, notification_id: int, delay: float, error: str):
+        now = time.time()
+        self._conn.execute(
+            "UPDATE notifications SET status = ?, next_attempt_at = ?, last_error = ?, locked_at = NULL, "
+            "updated_at = ? WHERE id = ?",
+            (PENDING, now + delay, error, now, notification_id),
+        )
+
+    def cancel_pending(self, client_id: int, kind: str = "suspension") -> int:
+        """Drop notifications that have not been sent yet (e.g. client already paid)."""
+        cur = self._conn.execute(
+            "UPDATE notifications SET status = ?, updated_at = ? WHERE client_id = ? AND kind = ? AND status = ?",
+            (CANCELLED, time.time(), client_id, kind, PENDING),
+        )
+        return cur.rowcount
+
+    def requeue_stale(self, timeout: float) -> int:
+        now = time.time()
+        cur = self._conn.execute(
+            "UPDATE notifications SET status = ?, locked_at = NULL, updated_at = ? "
+            "WHERE status = ? AND locked_at < ?",
+            (PENDING, now, SENDING, now - timeout),
+        )
+        return cur.rowcount
+
+    def purge(self, older_than: float) -> int:
+        cur = self._conn.execute(
+            "DELETE FROM notifications WHERE status IN (?, ?, ?, ?) AND updated_at < ?",
+            (DELIVERED, FAILED, SKIPPED, CANCELLED, older_than),
+        )
+        return cur.rowcount
+
+    def history(self, client_id: int, limit: int = 20) -> list[dict]:
+        rows = self._conn.execute(
+            "SELECT * FROM notifications WHERE client_id = ? ORDER BY id DESC LIMIT ?",
+            (client_id, limit),
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+
+def outbox_path(cfg) -> str:
+    return os.path.join(cfg.state_dir, "outbox.db")
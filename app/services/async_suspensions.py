@@ -0,0 +1,120 @@
+import time
+import asyncio
+import logging
+from app.core.config import AppConfig, get_config, find_router_by_ip
+from app.core.metrics import ACTIONS, timed, traced
+from app.core.resilience import Unavailable, deadline
+from app.infra.aio import in_thread
+from app.infra.notifier import get_client
+from app.infra.telegram import TelegramNotifier
+from app.services.notifications import withdraw_suspension_notice
+from app.services.journal import record_action
+from app.services.suspensions import apply_on_router, deferred, notify_suspension, parse_change_type
+
+
+def run_action(change_type: str, ip: str, client_id: int, cfg: AppConfig, uuid: str | None = None) -> dict:
+    """perform_action() for sync callers (Flask views, job workers), via the async pipeline."""
+    return asyncio.run(perform_action_async(change_type, ip, client_id, cfg, uuid))
+
+
+async def perform_action_async(change_type: str, ip: str, client_id: int, cfg: AppConfig | None = None,
+                               uuid: str | None = None) -> dict:
+    """
+    perform_action() with independent calls overlapped: the UISP client
+    fetch runs alongside the router toggle, and the Telegram status message
+    alongside the client's WhatsApp notice. Same result dicts, metrics and
+    deadline as the synchronous path.
+    """
+    cfg = cfg or get_config()
+    started, start = time.time(), time.perf_counter()
+    result = None
+    with traced() as stages:
+        try:
+            with deadline(cfg.webhook_deadline_seconds):
+                result = await _perform_action(change_type, ip, client_id, cfg)
+        finally:
+            record_action(cfg, change_type, ip, client_id, result, started, time.perf_counter() - start,
+                          stages, uuid)
+    return result
+
+
+async def _perform_action(change_type: str, ip: str, client_id: int, cfg: AppConfig) -> dict:
+    tg = TelegramNotifier.from_config(cfg)
+
+    with timed("router_lookup"):
+        site, router = find_router_by_ip(cfg, ip)
+    if not router:
+        msg = f"Router not found for IP {ip}"
+        logging.error(msg)
+        ACTIONS.labels(change_type, "router_not_found", "").inc()
+        await in_thread(tg.send, f"❌ {msg}", level="error")
+        return {"ok": False, "message": msg}
+
+    block = parse_change_type(change_type)
+    if block is None:
+        msg = f"Unknown changeType '{change_type}'"
+        ACTIONS.labels(change_type, "unknown_type", site).inc()
+        logging.warning(msg)
+        await in_thread(tg.send, f"⚠️ {msg}", level="warn")
+        return {"ok": False, "message": msg}
+
+    # The WhatsApp notice needs the client's details; fetch them while the router works
+    client_fetch = None
+    if block and not cfg.notify_outbox_enabled:
+        client_fetch = asyncio.ensure_future(in_thread(get_client, cfg, client_id))
+
+    try:
+        try:
+            found = await in_thread(apply_on_router, cfg, router, ip, block)
+        except Exception:
+            if client_fetch is not None:
+                client_fetch.cancel()
+            raise
+        if not found:
+            if client_fetch is not None:
+                client_fetch.cancel()
+            msg = f"No DHCP lease found for IP {ip} on {router.name}"
+            ACTIONS.labels(change_type, "no_lease", site).inc()
+            logging.warning(msg)
+            await in_thread(tg.send, f"⚠️ {msg}", level="warn")
+            return {"ok": False, "message": msg}
+
+        if block:
+            msg = f"Successfully suspended IP {ip} on {router.name} ({site})."
+        else:
+            msg = f"Successfully unsuspended IP {ip} on {router.name} ({site})."
+
+        ACTIONS.labels(change_type, "ok", site).inc()
+        status = in_thread(tg.send, f"✅ {msg}", level="info")
+
+        # Notify client via WhatsApp only on suspend
+        if block:
+            notice = _notify_suspension(cfg, client_id, msg, client_fetch)
+        elif cfg.notify_outbox_enabled:
+            # Paid before the notice went out: do not send it
+            notice = in_thread(withdraw_suspension_notice, cfg, client_id)
+        else:
+            notice = asyncio.sleep(0)
+        _, result = await asyncio.gather(status, notice)
+        return result if block else {"ok": True, "message": msg}
+
+    except Unavailable as e:
+        # Shedding load for this router; no operator alert per webhook
+        logging.warning(f"Deferring {change_type} for {ip}: {e}")
+        ACTIONS.labels(change_type, "deferred", site).inc()
+        return deferred("Router unavailable", e)
+
+    except Exception as e:
+        msg = f"Router operation failed: {e}"
+        logging.exception(msg)
+        ACTIONS.labels(change_type, "error", site).inc()
+        await in_thread(tg.send, f"❌ {msg}", level="error")
+        return {"ok": False, "message": msg, "retryable": True}
+
+
+async def _notify_suspension(cfg: AppConfig, client_id: int, msg: str, client_fetch) -> dict:
+    client_data = None
+    if client_fetch is not None:
+        # {} rather than None: a failed fetch is reported, not retried
+        client_data = await client_fetch or {}
+    return await in_thread(notify_suspension, cfg, client_id, msg, client_data)
@@ -0,0 +1,124 @@
+import json
+import logging
+from app.core.config import AppConfig, get_config
+from app.core.metrics import WEBHOOKS
+from app.services.suspensions import perform_action, parse_change_type
+from app.services.async_suspensions import run_action
+from app.services.reconcile import reconcile
+from app.services.worker import get_job_queue
+from app.services.sharding import shard_key_for
+from app.models.idempotency import get_idempotency_store
+from app.models.jobs import COALESCED
+from app.infra.notifier import prefetch_clients
+
+
+def webhook_response(change_type: str, client_id: int, ip: str, result: dict) -> dict:
+    """Response body for a processed suspension webhook."""
+    response = {
+        "action": change_type,
+        "clientId": str(client_id),
+        "ipAddress": ip,
+        "message": result.get("message"),
+        "ok": result.get("ok", False),
+    }
+    if "notification_error" in result:
+        response["notification_error"] = result["notification_error"]
+    return response
+
+
+def mark_webhook_processed(payload: dict, result: dict):
+    """Store the response for a queued webhook so UISP retries are answered from it."""
+    webhook_uuid = payload.get("uuid")
+    if not webhook_uuid:
+        return
+    change_type = payload["changeType"]
+    try:
+        get_idempotency_store().mark_processed(
+            webhook_uuid,
+            "service",
+            str(payload.get("entityId")),
+            change_type,
+            json.dumps(webhook_response(change_type, payload["clientId"], payload["ip"], result)),
+        )
+    except Exception as e:
+        logging.error(f"Failed to mark webhook as processed: {e}")
+
+
+def merge_webhooks(pending: list[dict], payload: dict) -> dict | None:
+    """
+    Fold the queued webhooks for one client/IP into the newest one.
+    Before the first of them the address was in the opposite state, so a
+    final command matching that state is a no-op and everything cancels out.
+    """
+    first = pending[0].get("initialChangeType", pending[0]["changeType"])
+    if parse_change_type(first) != parse_change_type(payload["changeType"]):
+        return None
+    return {**payload, "initialChangeType": first}
+
+
+def enqueue_webhook(cfg: AppConfig, payload: dict) -> tuple[dict, bool]:
+    """
+    Queue a suspension webhook. Webhooks for the same client and IP arriving
+    within coalesce_window_seconds are folded together, so only the final
+    state is applied to the router and notified. The job carries its router
+    site, so with sharding only the process owning that router runs it.
+    """
+    queue = get_job_queue(cfg)
+    window = cfg.coalesce_window_seconds
+    shard_key = shard_key_for(cfg, payload["ip"])
+    if window <= 0 or parse_change_type(payload["changeType"]) is None:
+        return queue.enqueue("webhook", payload, uuid=payload.get("uuid"), shard_key=shard_key)
+
+    job, created, superseded = queue.enqueue_coalesced(
+        "webhook",
+        payload,
+        f"{payload['clientId']}|{payload['ip']}",
+        merge_webhooks,
+        uuid=payload.get("uuid"),
+        delay=window,
+        shard_key=shard_key,
+    )
+    finished = [(j["payload"], j["result"]) for j in superseded]
+    if created and job["status"] == COALESCED:
+        finished.append((payload, job["result"]))
+    for finished_payload, result in finished:
+        mark_webhook_processed(finished_payload, result)
+    if finished:
+        WEBHOOKS.labels("coalesced").inc(len(finished))
+        outcome = "cancelled out" if job["status"] == COALESCED else f"collapsed into {job['uuid']}"
+        logging.info(f"Coalesced {len(finished)} webhook(s) for {payload['ip']}: {outcome}")
+    return job, created
+
+
+def handle_webhook_job(payload: dict) -> dict:
+    """Apply a queued suspension webhook and record it as processed."""
+    cfg = get_config()
+    if cfg.async_pipeline:
+        result = run_action(payload["changeType"], payload["ip"], payload["clientId"], cfg, payload.get("uuid"))
+    else:
+        result = perform_action(payload["changeType"], payload["ip"], payload["clientId"], cfg=cfg,
+                                uuid=payload.get("uuid"))
+    if not result.get("retryable"):
+        mark_webhook_processed(payload, result)
+    return result
+
+
+def handle_prefetch_clients_job(payload: dict) -> dict:
+    """Warm the UISP client cache ahead of a billing run."""
+    total = prefetch_clients(get_config(), payload.get("pageSize"))
+    return {"ok": True, "message": f"Prefetched {total} clients"}
+
+
+def handle_reconcile_job(payload: dict) -> dict:
+    """Sweep routers against UISP service state."""
+    report = reconcile(get_config(), dry_run=payload.get("dryRun", False))
+    summary = report["summary"]
+    ok = not summary["errors"] and not summary["failed"]
+    return {"ok": ok, "message": f"Reconcile: {summary}", "report": report}
+
+
+HANDLERS = {
+    "webhook": handle_webhook_job,
+    "prefetch_clients": handle_prefetch_clients_job,
+    "reconcile": handle_reconcile_job,
+}
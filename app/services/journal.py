@@ -0,0 +1,165 @@
+import os
+import time
+import queue
+import atexit
+import logging
+import threading
+from app.core.config import AppConfig, get_config, find_router_by_ip
+from app.models.journal import ActionJournal, journal_dir, month_of
+
+# Rows waiting for the writer, per batch size; beyond this new rows are dropped
+QUEUE_BATCHES = 20
+MAINTENANCE_INTERVAL = 3600
+
+
+def get_journal(cfg: AppConfig | None = None) -> ActionJournal:
+    return ActionJournal(journal_dir(cfg or get_config()))
+
+
+def outcome_of(result: dict | None) -> str:
+    if result is None:
+        return "error"
+    if result.get("ok"):
+        return "ok"
+    return "deferred" if result.get("retry_after") is not None else "failed"
+
+
+def record_action(cfg: AppConfig, change_type: str, ip: str, client_id: int, result: dict | None,
+                  started: float, duration: float, stages: list[tuple[str, float]] = (),
+                  uuid: str | None = None, site: str | None = None):
+    """
+    Queue one perform_action outcome for the journal. result is None when
+    the action raised. Stage seconds are summed per stage name.
+    """
+    if not cfg.journal_enabled:
+        return
+    if site is None:
+        try:
+            site = find_router_by_ip(cfg, ip)[0]
+        except ValueError:
+            site = "Unknown"
+    per_stage: dict[str, float] = {}
+    for stage, seconds in stages:
+        per_stage[stage] = per_stage.get(stage, 0) + seconds
+    start_journal_writer(cfg).put({
+        "ts": started,
+        "uuid": uuid,
+        "client_id": client_id,
+        "ip": ip,
+        "site": site,
+        "action": change_type,
+        "outcome": outcome_of(result),
+        "duration_ms": round(duration * 1000, 1),
+        "stages": {stage: round(seconds * 1000, 1) for stage, seconds in per_stage.items()},
+        "message": result.get("message") if result else None,
+    })
+
+
+class JournalWriter:
+    """
+    Appends journal rows from a background thread, up to
+    journal_batch_size rows per transaction and at most
+    journal_flush_seconds after they were recorded, so the webhook path
+    only pays for a queue put. Also drops months past retention and
+    compacts the previous month once it has closed.
+    """
+
+    def __init__(self, cfg: AppConfig):
+        self.cfg = cfg
+        self.journal = ActionJournal(journal_dir(cfg))
+        self.written = 0
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=cfg.journal_batch_size * QUEUE_BATCHES)
+        self._stop = threading.Event()
+        self._thread = None
+        self._month = None
+        self._maintained_at = 0.0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="journal-writer", daemon=True)
+        self._thread.start()
+
+    def put(self, row: dict):
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                logging.warning(f"Action journal backlog full, {self.dropped} row(s) dropped")
+
+    def stop(self, timeout: float = 5):
+        """Stop the thread and write whatever is still queued."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        while batch := self._drain(0):
+            self._write(batch)
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._drain(self.cfg.journal_flush_seconds)
+            if batch:
+                self._write(batch)
+            if time.time() - self._maintained_at >= MAINTENANCE_INTERVAL or month_of(time.time()) != self._month:
+                self._maintain()
+
+    def _drain(self, wait: float) -> list[dict]:
+        """Rows for one batch: block for the first, then collect until full or wait has passed."""
+        batch = []
+        deadline = time.monotonic() + wait
+        while len(batch) < self.cfg.journal_batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch: list[dict]):
+        if not batch:
+            return
+        try:
+            self.written += self.journal.append(batch)
+        except Exception as e:
+            logging.error(f"Failed to write {len(batch)} action journal row(s): {e}")
+
+    def _maintain(self):
+        now = time.time()
+        month = month_of(now)
+        try:
+            removed = self.journal.purge(self.cfg.journal_retention_months, now)
+            if removed:
+                logging.info(f"Action journal: dropped months {', '.join(removed)}")
+            if self._month is not None and self._month != month and self._month in self.journal.months():
+                if self.journal.compact(self._month):
+                    logging.info(f"Action journal: compacted {self._month}")
+        except Exception as e:
+            logging.error(f"Action journal maintenance failed: {e}")
+        self._month = month
+        self._maintained_at = now
+
+    def stats(self) -> dict:
+        return {"queued": self._queue.qsize(), "written": self.written, "dropped": self.dropped}
+
+
+_writer: JournalWriter | None = None
+_writer_pid = None
+_writer_lock = threading.Lock()
+
+
+def start_journal_writer(cfg: AppConfig | None = None) -> JournalWriter:
+    """This process's journal writer, started on first use."""
+    global _writer, _writer_pid
+    with _writer_lock:
+        if _writer is None or _writer_pid != os.getpid():
+            _writer = JournalWriter(cfg or get_config())
+            _writer_pid = os.getpid()
+            _writer.start()
+        return _writer
+
+
+@atexit.register
+def flush_journal():
+    """Write rows still queued when the process exits."""
+    if _writer is not None and _writer_pid == os.getpid():
+        _writer.stop()
@@ -0,0 +1,197 @@
+import os
+import time
+import fcntl
+import random
+import logging
+import threading
+from app.core.config import AppConfig, get_config
+from app.core.ratelimit import TokenBucket
+from app.models.outbox import NotificationOutbox, DELIVERED, FAILED, SKIPPED, outbox_path
+from app.infra.notifier import get_client, extract_whatsapp_number, build_message_text
+from app.infra.telegram import TelegramNotifier
+from app.infra.whatsapp import send_whatsapp_template
+
+POLL_INTERVAL = 1.0
+LEADER_RETRY_INTERVAL = 30
+SENDING_TIMEOUT = 300
+MAINTENANCE_INTERVAL = 300
+RETENTION_SECONDS = 30 * 86400
+MAX_BACKOFF = 3600
+
+
+def get_outbox(cfg: AppConfig | None = None) -> NotificationOutbox:
+    return NotificationOutbox(outbox_path(cfg or get_config()))
+
+
+def enqueue_suspension_notice(cfg: AppConfig, client_id: int) -> bool:
+    """
+    Queue the WhatsApp suspension notice for a client; sent by the dispatcher
+    once the coalescing window has passed without an unsuspend.
+    """
+    created = get_outbox(cfg).enqueue(client_id, delay=max(cfg.coalesce_window_seconds, 0))
+    if created and _dispatcher is not None:
+        _dispatcher.wake()
+    return created
+
+
+def withdraw_suspension_notice(cfg: AppConfig, client_id: int) -> int:
+    """Cancel a client's unsent suspension notice after an unsuspend."""
+    try:
+        cancelled = get_outbox(cfg).cancel_pending(client_id)
+    except Exception as e:
+        logging.error(f"Failed to cancel pending notice for client {client_id}: {e}")
+        return 0
+    if cancelled:
+        logging.info(f"Cancelled {cancelled} unsent suspension notice(s) for client {client_id}")
+    return cancelled
+
+
+def _is_retryable(status_code: int | None) -> bool:
+    return status_code is None or status_code == 429 or status_code >= 500
+
+
+class NotificationDispatcher:
+    """
+    Drains the notification outbox under a token-bucket rate limit.
+    Only one process per host dispatches (it holds an flock on
+    STATE_DIR/notify-dispatcher.lock), so the WhatsApp rate is not
+    multiplied by the gunicorn worker count.
+    """
+
+    def __init__(self, cfg: AppConfig):
+        self.cfg = cfg
+        self.outbox = NotificationOutbox(outbox_path(cfg))
+        self.bucket = TokenBucket(cfg.whatsapp_rate_per_second, cfg.whatsapp_burst)
+        self.lock_path = os.path.join(cfg.state_dir, "notify-dispatcher.lock")
+        self._lock_file = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._leader = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._elect, name="notify-leader", daemon=True).start()
+        for i in range(self.cfg.notify_dispatch_threads):
+            threading.Thread(target=self._run, name=f"notify-dispatch-{i}", daemon=True).start()
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def _elect(self):
+        while not self._stop.is_set():
+            f = None
+            try:
+                os.makedirs(self.cfg.state_dir, exist_ok=True)
+                f = open(self.lock_path, "a")
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                if f is not None:
+                    f.close()
+                self._stop.wait(LEADER_RETRY_INTERVAL)
+                continue
+            self._lock_file = f
+            logging.info(f"Notification dispatcher active in pid {os.getpid()}")
+            self._leader.set()
+            # Leader for the life of the process: keep the outbox tidy
+            self._maintain()
+            while not self._stop.wait(MAINTENANCE_INTERVAL):
+                self._maintain()
+            return
+
+    def _maintain(self):
+        """Requeue rows stuck in SENDING by a dead leader and purge old ones."""
+        try:
+            requeued = self.outbox.requeue_stale(SENDING_TIMEOUT)
+            purged = self.outbox.purge(time.time() - RETENTION_SECONDS)
+        except Exception as e:
+            logging.error(f"Notification outbox maintenance failed: {e}")
+            return
+        if requeued or purged:
+            logging.info(f"Notification outbox: requeued {requeued} stale, purged {purged} old")
+
+    def _run(self):
+        while not self._stop.is_set():
+            if not self._leader.wait(LEADER_RETRY_INTERVAL):
+                continue
+            try:
+                item = self.outbox.claim()
+            except Exception as e:
+                logging.error(f"Notification outbox unavailable: {e}")
+                item = None
+            if item is None:
+                self._wake.wait(POLL_INTERVAL)
+                self._wake.clear()
+                continue
+            if not self.bucket.acquire(self._stop):
+                # Shutting down; the claimed row is requeued as stale by the next leader
+                return
+            try:
+                self._deliver(item)
+            except Exception as e:
+                logging.exception(f"Notification {item['id']} raised:")
+                self.outbox.retry(item["id"], self.cfg.notify_retry_backoff_seconds, str(e))
+
+    def _deliver(self, item: dict):
+        cfg = get_config()
+        client_id = item["client_id"]
+        tg = TelegramNotifier.from_config(cfg)
+
+        client_data = get_client(cfg, client_id)
+        if not client_data:
+            self._retry_or_fail(item, tg, "Failed to fetch client data")
+            return
+
+        phone_number = extract_whatsapp_number(client_data)
+        if not phone_number:
+            msg = f"No notification phone found for client {client_id} (checked: none)"
+            logging.warning(msg)
+            tg.send(f"⚠️ {msg}", level="warn")
+            self.outbox.finish(item["id"], SKIPPED, error=msg)
+            return
+
+        message_text = build_message_text(client_data)
+        amount = round(client_data.get("accountOutstanding", 0.0) + 50)
+        status_code, detail = send_whatsapp_template(
+            cfg.whatsapp_phone_id, cfg.whatsapp_token, phone_number, message_text, amount, client_id,
+            cfg.whatsapp_api_url,
+        )
+
+        if status_code == 200:
+            self.outbox.finish(item["id"], DELIVERED, detail=phone_number)
+            tg.send(f"✅ WhatsApp sent to client {client_id} ({phone_number})", level="info")
+        elif _is_retryable(status_code):
+            self._retry_or_fail(item, tg, detail)
+        else:
+            self.outbox.finish(item["id"], FAILED, error=detail)
+            tg.send(f"⚠️ WhatsApp send failed for client {client_id}: {detail}", level="warn")
+
+    def _retry_or_fail(self, item: dict, tg: TelegramNotifier, error: str):
+        client_id = item["client_id"]
+        if item["attempts"] >= self.cfg.notify_max_attempts:
+            self.outbox.finish(item["id"], FAILED, error=error)
+            tg.send(f"⚠️ WhatsApp send failed for client {client_id} after {item['attempts']} attempts: {error}",
+                    level="warn")
+            return
+        delay = min(self.cfg.notify_retry_backoff_seconds * 2 ** (item["attempts"] - 1), MAX_BACKOFF)
+        delay *= random.uniform(0.8, 1.2)
+        logging.warning(f"Notification for client {client_id} failed, retrying in {delay:.0f}s: {error}")
+        self.outbox.retry(item["id"], delay, error)
+
+
+_dispatcher: NotificationDispatcher | None = None
+_dispatcher_pid = None
+_dispatcher_lock = threading.Lock()
+
+
+def start_dispatcher(cfg: AppConfig | None = None) -> NotificationDispatcher:
+    """Start this process's dispatcher once; it idles unless it wins the host lock."""
+    global _dispatcher, _dispatcher_pid
+    with _dispatcher_lock:
+        if _dispatcher is None or _dispatcher_pid != os.getpid():
+            _dispatcher = NotificationDispatcher(cfg or get_config())
+            _dispatcher_pid = os.getpid()
+            _dispatcher.start()
+        return _dispatcher
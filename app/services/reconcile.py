@@ -0,0 +1,165 @@
+import time
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from app.core.config import AppConfig, get_config, find_router_by_ip
+from app.infra.mikrotik import LEASE_PROPLIST, get_router_client
+from app.infra.lease_cache import get_lease_cache
+from app.infra.notifier import list_services
+from app.infra.telegram import TelegramNotifier
+from app.services.suspensions import ADDRESS_LIST_MODE, router_guard
+from app.services.sharding import owner_node, owns_site
+
+# UISP service statuses
+SERVICE_ACTIVE = 1
+SERVICE_SUSPENDED = 3
+
+
+def _service_ip(service: dict) -> str | None:
+    attr = next((a for a in service.get("attributes", []) if a.get("key") == "ipAddress"), None)
+    return attr.get("value") if attr else None
+
+
+def desired_state(cfg: AppConfig) -> dict:
+    """Suspended and active service IPs from UISP, grouped by router site."""
+    by_site = defaultdict(lambda: {"suspended": set(), "active": set()})
+    unrouted = []
+    for service in list_services(cfg, [SERVICE_ACTIVE, SERVICE_SUSPENDED]):
+        ip = _service_ip(service)
+        if not ip:
+            continue
+        try:
+            site, router = find_router_by_ip(cfg, ip)
+        except ValueError:
+            router = None
+        if not router:
+            unrouted.append(ip)
+            continue
+        key = "suspended" if service.get("status") == SERVICE_SUSPENDED else "active"
+        by_site[router.site][key].add(ip)
+    return {"sites": by_site, "unrouted": unrouted}
+
+
+def reconcile_router(cfg: AppConfig, router, desired: dict, dry_run: bool) -> dict:
+    """
+    Diff one router's lease block-access against UISP and apply the difference.
+    The full lease table is read every sweep: RouterOS has no cheap change
+    counter for it.
+    """
+    suspended = desired["suspended"]
+    active = desired["active"] - suspended
+    mt = get_router_client(router, cfg.tls_verify)
+    with router_guard(cfg, router):
+        leases = {l["address"]: l for l in mt.list_leases(proplist=LEASE_PROPLIST) if l.get("address")}
+
+    blocked = {ip for ip, l in leases.items() if l.get("block-access") == "yes"}
+    report = {"leases": len(leases), "blocked": len(blocked)}
+    to_block = (suspended & leases.keys()) - blocked
+    to_unblock = (blocked & active) - suspended
+    missing = suspended - leases.keys()
+    report.update({
+        "to_block": sorted(to_block),
+        "to_unblock": sorted(to_unblock),
+        "missing_lease": sorted(missing),
+        "applied": 0,
+        "failed": [],
+    })
+    if dry_run:
+        return report
+
+    cache = get_lease_cache(router, cfg) if cfg.lease_cache_enabled and owns_site(router.site) else None
+
+    changes = [(ip, True) for ip in to_block] + [(ip, False) for ip in to_unblock]
+    with router_guard(cfg, router):
+        errors = mt.set_block_access_many(
+            [(leases[ip][".id"], block) for ip, block in changes],
+            concurrency=cfg.batch_router_concurrency,
+        )
+    for (ip, block), error in zip(changes, errors):
+        if error:
+            report["failed"].append({"ip": ip, "error": error})
+            continue
+        report["applied"] += 1
+        leases[ip]["block-access"] = "yes" if block else "no"
+        if cache:
+            cache.put(ip, leases[ip])
+    return report
+
+
+def reconcile_address_list(cfg: AppConfig, router, desired: dict, dry_run: bool) -> dict:
+    """
+    Sync an address-list router's suspension list to UISP's suspended IPs
+    for the site: one read of the list, then a bulk add and a bulk remove.
+    The list is owned by this service; entries UISP does not show as
+    suspended are removed.
+    """
+    suspended = desired["suspended"]
+    mt = get_router_client(router, cfg.tls_verify)
+    with router_guard(cfg, router):
+        entries = mt.address_list(router.address_list)
+    report = {"address_list": router.address_list, "listed": len(entries)}
+    with router_guard(cfg, router):
+        diff = mt.sync_address_list(router.address_list, suspended, dry_run=dry_run, entries=entries)
+    report.update({
+        "to_block": diff["to_add"],
+        "to_unblock": diff["to_remove"],
+        "missing_lease": [],
+        "applied": 0 if dry_run else len(diff["to_add"]) + len(diff["to_remove"]),
+        "failed": [],
+    })
+    return report
+
+
+def reconcile(cfg: AppConfig | None = None, dry_run: bool = False) -> dict:
+    """
+    Sweep every router: compare UISP service state with lease block-access
+    and fix only the differences. Routers run in parallel, behind their
+    breakers and bulkheads. Every sweep is a full one: UISP's services and
+    each router's table are read afresh. With SHARD_NODES a node sweeps
+    only the routers it owns, so /reconcile goes to every node.
+    """
+    cfg = cfg or get_config()
+    started = time.time()
+    desired = desired_state(cfg)
+    routers = {}
+
+    def run(router):
+        node = owner_node(cfg, router.site)
+        if node is not None:
+            return router.site, {"owner": node}
+        site_desired = desired["sites"].get(router.site, {"suspended": set(), "active": set()})
+        sweep = reconcile_address_list if router.suspend_mode == ADDRESS_LIST_MODE else reconcile_router
+        try:
+            return router.site, sweep(cfg, router, site_desired, dry_run)
+        except Exception as e:
+            logging.error(f"Reconcile failed for {router.site}: {e}")
+            return router.site, {"error": str(e)}
+
+    if cfg.routers:
+        with ThreadPoolExecutor(max_workers=min(cfg.batch_max_routers, len(cfg.routers))) as pool:
+            for site, report in pool.map(run, cfg.routers):
+                routers[site] = report
+
+    summary = {
+        "routers": len(routers),
+        "other_nodes": sum(1 for r in routers.values() if "owner" in r),
+        "errors": sum(1 for r in routers.values() if "error" in r),
+        "blocked": sum(len(r.get("to_block", [])) for r in routers.values()),
+        "unblocked": sum(len(r.get("to_unblock", [])) for r in routers.values()),
+        "failed": sum(len(r.get("failed", [])) for r in routers.values()),
+        "missing_lease": sum(len(r.get("missing_lease", [])) for r in routers.values()),
+        "unrouted": len(desired["unrouted"]),
+        "dry_run": dry_run,
+        "duration_seconds": round(time.time() - started, 2),
+    }
+    logging.info(f"Reconcile finished: {summary}")
+
+    if summary["blocked"] or summary["unblocked"] or summary["errors"] or summary["failed"]:
+        verb = "would fix" if dry_run else "fixed"
+        TelegramNotifier.from_config(cfg).send(
+            f"⚠️ Reconcile {verb} {summary['blocked']} blocks and {summary['unblocked']} unblocks; "
+            f"{summary['failed']} failed, {summary['errors']} router errors.",
+            level="warn",
+        )
+
+    return {"summary": summary, "routers": routers, "unrouted": desired["unrouted"]}
@@ -0,0 +1,157 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+import requests
+from app.core.config import AppConfig, get_config, find_router_by_ip
+from app.core.resilience import call_timeout
+from app.infra.http import get_session, reset_session
+from app.infra.lease_cache import drop_lease_cache
+
+# Set on webhooks a node forwards, so the receiving node never forwards again
+FORWARDED_HEADER = "X-Shard-Forwarded"
+FORWARD_TIMEOUT = 10
+# A member is gone after this many missed heartbeats
+MISSED_HEARTBEATS = 3
+
+
+def rendezvous(key: str, members) -> list[str]:
+    """
+    Members in order of preference for key (rendezvous hashing): when one
+    joins or leaves, only the keys it wins or held change owner.
+    """
+    return sorted(members, key=lambda m: hashlib.sha1(f"{m}|{key}".encode()).digest(), reverse=True)
+
+
+def shard_key_for(cfg: AppConfig, ip: str) -> str | None:
+    """The router site a job for this IP belongs to, or None when no router matches."""
+    try:
+        site, router = find_router_by_ip(cfg, ip)
+    except ValueError:
+        return None
+    return site if router else None
+
+
+class ShardMembership:
+    """
+    This process's share of the routers. Every shard_heartbeat_seconds it
+    renews its heartbeat in the job database and works out the router sites
+    it owns among the live members, so each router's session, lease cache
+    and queued commands stay in one process. Lease caches of sites it stops
+    owning are dropped. /batch and /reconcile are exempt: they run in
+    whichever process receives them and touch any router, without using the
+    shared lease cache of routers the process does not own.
+    """
+
+    def __init__(self, queue, cfg: AppConfig, member_id: str, on_change=None):
+        self.queue = queue
+        self.cfg = cfg
+        self.member_id = member_id
+        self.on_change = on_change
+        self.members: list[str] = []
+        self.owned: list[str] = []
+        self.sites: list[str] = []
+        self._stop = threading.Event()
+
+    def start(self):
+        global _membership, _membership_pid
+        _membership, _membership_pid = self, os.getpid()
+        self.refresh()
+        threading.Thread(target=self._run, name="shard-heartbeat", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+        try:
+            self.queue.leave(self.member_id)
+        except Exception as e:
+            logging.warning(f"Failed to leave shard membership: {e}")
+
+    def _run(self):
+        while not self._stop.wait(self.cfg.shard_heartbeat_seconds):
+            try:
+                self.refresh()
+            except Exception as e:
+                logging.error(f"Shard heartbeat failed: {e}")
+
+    def refresh(self):
+        self.queue.heartbeat(self.member_id)
+        members = self.queue.live_members(self.cfg.shard_heartbeat_seconds * MISSED_HEARTBEATS)
+        # Current snapshot: routers added by a config reload are picked up
+        routers = get_config().routers
+        owned = sorted(r.site for r in routers if rendezvous(r.site, members)[0] == self.member_id)
+        changed = owned != self.owned
+        if members != self.members or changed:
+            logging.info(f"Shard members: {len(members)} live, {self.member_id} owns {owned or 'no routers'}")
+        released = set(self.owned) - set(owned)
+        self.members, self.owned, self.sites = members, owned, sorted(r.site for r in routers)
+        for site in released:
+            drop_lease_cache(site)
+        if changed and self.on_change:
+            self.on_change()
+
+    def stats(self) -> dict:
+        return {"member": self.member_id, "members": self.members, "owned": self.owned}
+
+
+# The membership of this process's worker pool, if sharding is on
+_membership: ShardMembership | None = None
+_membership_pid = None
+
+
+def owns_site(site: str) -> bool:
+    """False only when sharding is on and another process owns the site."""
+    if _membership is None or _membership_pid != os.getpid():
+        return True
+    return site in _membership.owned
+
+
+# Nodes that failed a forward, until they are tried again
+_down_until: dict[str, float] = {}
+
+
+def owner_node(cfg: AppConfig, site: str) -> str | None:
+    """The SHARD_NODES entry that should handle a site; None means this node."""
+    now = time.time()
+    for node in rendezvous(site, cfg.shard_nodes):
+        if node == cfg.shard_self_url:
+            return None
+        if _down_until.get(node, 0) <= now:
+            return node
+    return None
+
+
+def forward_webhook(cfg: AppConfig, site: str, body: bytes, signature: str) -> requests.Response | None:
+    """
+    Pass a webhook to the node owning its router. Nodes that cannot be
+    reached are skipped for shard_node_retry_seconds and the site falls to
+    the next node in its order. Returns the owner's response, or None when
+    this node should process the webhook itself.
+    """
+    while (node := owner_node(cfg, site)) is not None:
+        try:
+            return get_session("shard").post(
+                f"{node.rstrip('/')}/service_suspensions/",
+                data=body,
+                headers={
+                    "Content-Type": "application/json",
+                    "X-UISP-Signature": signature,
+                    FORWARDED_HEADER: cfg.shard_self_url,
+                },
+                timeout=call_timeout(FORWARD_TIMEOUT),
+            )
+        except requests.RequestException as e:
+            reset_session("shard")
+            _down_until[node] = time.time() + cfg.shard_node_retry_seconds
+            logging.warning(f"Shard node {node} unreachable, passing its routers on for "
+                            f"{cfg.shard_node_retry_seconds:.0f}s: {e}")
+    return None
+
+
+def node_stats(cfg: AppConfig) -> dict:
+    now = time.time()
+    return {
+        "self": cfg.shard_self_url,
+        "nodes": {node: "down" if _down_until.get(node, 0) > now else "up" for node in cfg.shard_nodes},
+        "sites": {r.site: owner_node(cfg, r.site) or cfg.shard_self_url for r in cfg.routers},
+    }
@@ -1,66 +1,359 @@
+import time
 import logging
-from app.core.config import load_config, find_router_by_ip
-from app.infra.mikrotik import MikroTikClient
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from app.core.config import AppConfig, get_config, find_router_by_ip
+from app.core.metrics import ACTIONS, timed, traced
+from app.core.resilience import Unavailable, deadline, get_breaker, get_bulkhead, guarded
+from app.infra.mikrotik import MikroTikClient, RouterError, LEASE_PROPLIST, get_router_client
+from app.infra.lease_cache import get_lease_cache
 from app.infra.notifier import notify_client_suspension
 from app.infra.telegram import TelegramNotifier
+from app.services.notifications import enqueue_suspension_notice, withdraw_suspension_notice
+from app.services.journal import record_action
+from app.services.sharding import owns_site
 
 
-def perform_action(change_type: str, ip: str, client_id: int):
+# Router.suspend_mode for firewall address-list suspension
+ADDRESS_LIST_MODE = "address_list"
+
+
+def _is_router_failure(e: Exception) -> bool:
+    """Connection errors, timeouts and 5xx count against a router's breaker; 4xx mean it is up."""
+    return isinstance(e, RouterError) and (e.status_code is None or e.status_code >= 500)
+
+
+def router_guard(cfg: AppConfig, router):
+    """
+    Breaker and bulkhead for one router site: at most router_max_concurrency
+    calls in flight per worker process, and fail fast (CircuitOpen) after
+    router_breaker_failures consecutive failures.
+    """
+    name = f"router:{router.site}"
+    return guarded(
+        get_breaker(name, cfg.router_breaker_failures, cfg.router_breaker_reset_seconds),
+        get_bulkhead(name, cfg.router_max_concurrency),
+        cfg.router_bulkhead_wait_seconds,
+        is_failure=_is_router_failure,
+    )
+
+
+def deferred(message: str, e: Unavailable) -> dict:
+    """Result for work refused by a router guard; the job queue retries it after retry_after."""
+    return {"ok": False, "message": f"{message}: {e}", "retryable": True, "retry_after": round(e.retry_after, 1)}
+
+
+def resolve_and_toggle(mt: MikroTikClient, cache, ip: str, block: bool, lease_id: str | None = None) -> bool:
+    """
+    Set block-access on the lease for an IP.
+    A cache hit costs one router call (the PATCH); a miss or a stale lease id
+    (404) falls back to a filtered lease lookup first. lease_id, when the
+    caller has just read it from the router, is used instead of the cache.
+    Returns False when the router has no lease for the IP.
+    """
+    if lease_id is None and cache:
+        entry = cache.get(ip)
+        lease_id = entry.lease_id if entry else None
+    if lease_id:
+        try:
+            with timed("lease_toggle", mt.site):
+                mt.toggle_block_access(lease_id, block)
+            if cache:
+                cache.put(ip, {".id": lease_id, "block-access": "yes" if block else "no"})
+            return True
+        except RouterError as e:
+            if e.status_code != 404:
+                raise
+            logging.info(f"Lease id {lease_id} for {ip} is gone; looking it up again")
+            if cache:
+                cache.invalidate(ip)
+
+    with timed("lease_lookup", mt.site):
+        lease = mt.find_lease(ip)
+    if not lease:
+        return False
+
+    with timed("lease_toggle", mt.site):
+        mt.toggle_block_access(lease.get(".id"), block)
+    if cache:
+        cache.put(ip, {**lease, "block-access": "yes" if block else "no"})
+    return True
+
+
+def set_address_listed(mt: MikroTikClient, router, ip: str, block: bool):
+    """Add (suspend) or remove (unsuspend) an IP on the router's suspension address-list."""
+    with timed("address_list", mt.site):
+        if block:
+            mt.add_addresses(router.address_list, [ip])
+        else:
+            mt.remove_addresses(router.address_list, [ip])
+
+
+def notify_suspension(cfg: AppConfig, client_id: int, msg: str, client_data: dict | None = None) -> dict:
+    """
+    Send (or queue) the client's suspension notice after a successful block.
+    With the outbox enabled the notice is delivered later by the dispatcher,
+    so the result cannot carry a notification_error.
+    """
+    if cfg.notify_outbox_enabled:
+        enqueue_suspension_notice(cfg, client_id)
+        return {"ok": True, "message": msg}
+
+    ok, detail = notify_client_suspension(cfg, client_id, client_data)
+    if not ok:
+        msg = f"{msg} Notification failed: {detail}"
+        logging.warning(msg)
+        return {"ok": True, "message": msg, "notification_error": detail}
+    return {"ok": True, "message": msg}
+
+
+def parse_change_type(change_type: str) -> bool | None:
+    """True to block (suspend), False to unblock (unsuspend/end), None if unknown."""
+    action = (change_type or "").lower()
+    if action == "suspend":
+        return True
+    if action in ("unsuspend", "end"):
+        return False
+    return None
+
+
+def apply_on_router(cfg: AppConfig, router, ip: str, block: bool) -> bool:
+    """
+    Block or unblock an IP on its router, within the router's share of the
+    webhook deadline and behind its guard. False when there is no lease.
+    """
+    mt = get_router_client(router, cfg.tls_verify)
+    address_list_mode = router.suspend_mode == ADDRESS_LIST_MODE
+    use_cache = cfg.lease_cache_enabled and not address_list_mode and owns_site(router.site)
+    cache = get_lease_cache(router, cfg) if use_cache else None
+
+    router_budget = cfg.webhook_deadline_seconds * cfg.router_deadline_share
+    with deadline(router_budget), router_guard(cfg, router):
+        if address_list_mode:
+            # No lease needed: static and PPPoE clients are covered too
+            set_address_listed(mt, router, ip, block)
+            return True
+        return resolve_and_toggle(mt, cache, ip, block)
+
+
+def perform_action(change_type: str, ip: str, client_id: int, cfg: AppConfig | None = None,
+                   uuid: str | None = None):
     """
     Handle suspend or unsuspend event:
     - Locate router from IP.
     - Execute DHCP lease toggle.
     - Notify via Telegram and WhatsApp.
+    Uses the caller's config snapshot when given, else the cached one.
+    The whole call is bounded by webhook_deadline_seconds, of which the
+    router gets router_deadline_share and notifications the rest.
+    The outcome and per-stage latencies go to the action journal.
     """
 
-    cfg = load_config()
-    tg = TelegramNotifier(cfg.telegram_token, cfg.telegram_chat_id)
+    cfg = cfg or get_config()
+    started, start = time.time(), time.perf_counter()
+    result = None
+    with traced() as stages:
+        try:
+            with deadline(cfg.webhook_deadline_seconds):
+                result = _perform_action(change_type, ip, client_id, cfg)
+        finally:
+            record_action(cfg, change_type, ip, client_id, result, started, time.perf_counter() - start,
+                          stages, uuid)
+    return result
+
 
-    site, router = find_router_by_ip(cfg, ip)
+def _perform_action(change_type: str, ip: str, client_id: int, cfg: AppConfig) -> dict:
+    tg = TelegramNotifier.from_config(cfg)
+
+    with timed("router_lookup"):
+        site, router = find_router_by_ip(cfg, ip)
     if not router:
         msg = f"Router not found for IP {ip}"
         logging.error(msg)
+        ACTIONS.labels(change_type, "router_not_found", "").inc()
         tg.send(f"❌ {msg}", level="error")
         return {"ok": False, "message": msg}
 
-    try:
-        mt = MikroTikClient(router.api_url, router.username, router.password, verify=cfg.tls_verify)
-        leases = mt.list_leases()
-        lease = next((l for l in leases if l.get("address") == ip), None)
+    block = parse_change_type(change_type)
+    if block is None:
+        msg = f"Unknown changeType '{change_type}'"
+        ACTIONS.labels(change_type, "unknown_type", site).inc()
+        logging.warning(msg)
+        tg.send(f"⚠️ {msg}", level="warn")
+        return {"ok": False, "message": msg}
 
-        if not lease:
+    try:
+        found = apply_on_router(cfg, router, ip, block)
+        if not found:
             msg = f"No DHCP lease found for IP {ip} on {router.name}"
+            ACTIONS.labels(change_type, "no_lease", site).inc()
             logging.warning(msg)
             tg.send(f"⚠️ {msg}", level="warn")
             return {"ok": False, "message": msg}
 
-        lease_id = lease.get(".id")
-        if change_type.lower() == "suspend":
-            mt.toggle_block_access(lease_id, True)
+        if block:
             msg = f"Successfully suspended IP {ip} on {router.name} ({site})."
-        elif change_type.lower() in ("unsuspend", "end"):
-            mt.toggle_block_access(lease_id, False)
-            msg = f"Successfully unsuspended IP {ip} on {router.name} ({site})."
         else:
-            msg = f"Unknown changeType '{change_type}'"
-            logging.warning(msg)
-            tg.send(f"⚠️ {msg}", level="warn")
-            return {"ok": False, "message": msg}
+            msg = f"Successfully unsuspended IP {ip} on {router.name} ({site})."
 
+        ACTIONS.labels(change_type, "ok", site).inc()
         tg.send(f"✅ {msg}", level="info")
 
         # Notify client via WhatsApp only on suspend
-        if change_type.lower() == "suspend":
-            ok, detail = notify_client_suspension(cfg, client_id)
-            if not ok:
-                msg = f"{msg} Notification failed: {detail}"
-                logging.warning(msg)
-                return {"ok": True, "message": msg, "notification_error": detail}
+        if block:
+            return notify_suspension(cfg, client_id, msg)
 
+        if cfg.notify_outbox_enabled:
+            # Paid before the notice went out: do not send it
+            withdraw_suspension_notice(cfg, client_id)
         return {"ok": True, "message": msg}
 
+    except Unavailable as e:
+        # Shedding load for this router; no operator alert per webhook
+        logging.warning(f"Deferring {change_type} for {ip}: {e}")
+        ACTIONS.labels(change_type, "deferred", site).inc()
+        return deferred("Router unavailable", e)
+
     except Exception as e:
         msg = f"Router operation failed: {e}"
         logging.exception(msg)
+        ACTIONS.labels(change_type, "error", site).inc()
         tg.send(f"❌ {msg}", level="error")
-        return {"ok": False, "message": msg}
+        return {"ok": False, "message": msg, "retryable": True}
+
+
+def perform_batch(items: list[dict], cfg: AppConfig | None = None) -> list[dict]:
+    """
+    Apply many suspend/unsuspend items at once.
+    Items are grouped by router; each router gets one lease-table fetch and
+    its PATCHes run with bounded concurrency, routers in parallel.
+    Address-list routers get one bulk add and one bulk remove instead.
+    Items carry an int clientId. Returns one perform_action-style result
+    per item, in input order; an item that raises fails on its own.
+    """
+    cfg = cfg or get_config()
+    started, start = time.time(), time.perf_counter()
+    tg = TelegramNotifier.from_config(cfg)
+    results: list[dict | None] = [None] * len(items)
+    groups = defaultdict(list)
+
+    for i, item in enumerate(items):
+        ip = item.get("ip")
+        block = parse_change_type(item.get("changeType"))
+        if block is None:
+            results[i] = {"ok": False, "message": f"Unknown changeType '{item.get('changeType')}'"}
+            continue
+        try:
+            site, router = find_router_by_ip(cfg, ip)
+        except ValueError:
+            site, router = "Unknown", None
+        if not router:
+            results[i] = {"ok": False, "message": f"Router not found for IP {ip}"}
+            continue
+        groups[router].append((i, item, block))
+
+    def succeeded(i, item, router, block):
+        verb = "suspended" if block else "unsuspended"
+        msg = f"Successfully {verb} IP {item['ip']} on {router.name} ({router.site})."
+        if block:
+            results[i] = notify_suspension(cfg, item["clientId"], msg)
+        else:
+            if cfg.notify_outbox_enabled:
+                withdraw_suspension_notice(cfg, item["clientId"])
+            results[i] = {"ok": True, "message": msg}
+
+    def isolated(entries, fn, *args):
+        # An unexpected error fails only the items it concerns, so the rest still report
+        try:
+            fn(*args)
+        except Exception as e:
+            logging.error(f"Batch item failed: {e}")
+            for i, _, _ in entries:
+                if results[i] is None:
+                    results[i] = {"ok": False, "message": f"Batch item failed: {e}"}
+
+    def run_address_list(router, mt, entries):
+        # One bulk add and one bulk remove for all of this router's items
+        blocks = [item["ip"] for _, item, block in entries if block]
+        unblocks = [item["ip"] for _, item, block in entries if not block]
+        try:
+            with router_guard(cfg, router), timed("address_list", router.site):
+                mt.add_addresses(router.address_list, blocks)
+                mt.remove_addresses(router.address_list, unblocks)
+        except Unavailable as e:
+            for i, _, _ in entries:
+                results[i] = deferred("Router unavailable", e)
+            return
+        except Exception as e:
+            msg = f"Router operation failed: {e}"
+            for i, _, _ in entries:
+                results[i] = {"ok": False, "message": msg, "retryable": True}
+            return
+        for i, item, block in entries:
+            succeeded(i, item, router, block)
+
+    def run_router(router, entries):
+        mt = get_router_client(router, cfg.tls_verify)
+        if router.suspend_mode == ADDRESS_LIST_MODE:
+            return run_address_list(router, mt, entries)
+        try:
+            with router_guard(cfg, router):
+                leases = {l.get("address"): l for l in mt.list_leases(proplist=LEASE_PROPLIST)}
+        except Unavailable as e:
+            for i, _, _ in entries:
+                results[i] = deferred("Router unavailable", e)
+            return
+        except Exception as e:
+            msg = f"Router operation failed: {e}"
+            for i, _, _ in entries:
+                results[i] = {"ok": False, "message": msg, "retryable": True}
+            return
+
+        # Only a shared cache is kept up to date; the table read above supplies the lease ids
+        cache = get_lease_cache(router, cfg) if cfg.lease_cache_enabled and owns_site(router.site) else None
+
+        def run_item(entry):
+            i, item, block = entry
+            ip = item["ip"]
+            if ip not in leases:
+                results[i] = {"ok": False, "message": f"No DHCP lease found for IP {ip} on {router.name}"}
+                return
+            try:
+                with router_guard(cfg, router):
+                    found = resolve_and_toggle(mt, cache, ip, block, leases[ip].get(".id"))
+            except Unavailable as e:
+                results[i] = deferred("Router unavailable", e)
+                return
+            except Exception as e:
+                results[i] = {"ok": False, "message": f"Router operation failed: {e}", "retryable": True}
+                return
+            if not found:
+                # The table's lease id was stale and the lease is gone now
+                results[i] = {"ok": False, "message": f"No DHCP lease found for IP {ip} on {router.name}"}
+                return
+            succeeded(i, item, router, block)
+
+        with ThreadPoolExecutor(max_workers=cfg.batch_router_concurrency) as pool:
+            list(pool.map(lambda entry: isolated([entry], run_item, entry), entries))
+
+    if groups:
+        with ThreadPoolExecutor(max_workers=min(cfg.batch_max_routers, len(groups))) as pool:
+            list(pool.map(lambda g: isolated(g[1], run_router, *g), groups.items()))
+
+    # Items share one run, so each is journaled with the batch's duration
+    duration = time.perf_counter() - start
+    for item, result in zip(items, results):
+        record_action(cfg, item.get("changeType"), item.get("ip"), item.get("clientId"), result,
+                      started, duration, uuid=item.get("uuid"))
+
+    ok_count = sum(1 for r in results if r["ok"])
+    failed = [r["message"] for r in results if not r["ok"]]
+    logging.info(f"Batch processed: {ok_count} ok, {len(failed)} failed across {len(groups)} routers")
+    summary = f"Batch: {ok_count}/{len(items)} applied across {len(groups)} routers."
+    if failed:
+        summary += "\n" + "\n".join(failed[:20])
+        tg.send(f"⚠️ {summary}", level="warn")
+    else:
+        tg.send(f"✅ {summary}", level="info")
+
+    return results
@@ -0,0 +1,127 @@
+import os
+import time
+import logging
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait
+from app.core.config import AppConfig, get_config
+from app.core.resilience import deadline, remaining
+from app.infra.mikrotik import get_router_client
+from app.infra.lease_cache import get_lease_cache
+from app.infra.notifier import ping_uisp
+from app.services.suspensions import ADDRESS_LIST_MODE
+from app.services.sharding import owns_site
+
+
+class Warmup:
+    """
+    One process's boot prewarm: load the config snapshot, open (and log in)
+    the connection to every router and UISP, and optionally wait for the
+    first lease table load. With sharding, only the routers this process
+    owns are warmed. warmup_timeout_seconds bounds the whole run. Failures
+    are reported but do not block readiness, so one dead router cannot keep
+    the worker out of rotation.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self.seconds = None
+        self.steps: dict[str, float] = {}
+        self.errors: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def run(self, cfg: AppConfig | None = None):
+        """Warm up once; concurrent callers wait for the run in progress."""
+        with self._lock:
+            if self.ready:
+                return
+            start = time.perf_counter()
+            try:
+                cfg = self._step("config", lambda: cfg or get_config())
+            except Exception as e:
+                # Nothing else can be warmed without routers; report ready and let requests fail loudly
+                cfg = None
+                self.errors["config"] = str(e)
+            if cfg is not None:
+                # One budget for the whole warmup, however many routers there are
+                with deadline(cfg.warmup_timeout_seconds):
+                    self._connect(cfg)
+            self.seconds = round(time.perf_counter() - start, 3)
+            self.ready = True
+        level = logging.WARNING if self.errors else logging.INFO
+        logging.log(level, f"Warmup finished in {self.seconds}s"
+                           f"{f' with errors: {self.errors}' if self.errors else ''}")
+
+    def _step(self, name: str, fn):
+        start = time.perf_counter()
+        try:
+            return fn()
+        finally:
+            self.steps[name] = round(time.perf_counter() - start, 3)
+
+    def _connect(self, cfg: AppConfig):
+        def warm_router(router):
+            try:
+                self._step(f"router:{router.site}", lambda: warm_router_client(cfg, router))
+            except Exception as e:
+                self.errors[f"router:{router.site}"] = str(e)
+
+        def warm_uisp():
+            try:
+                self._step("uisp", lambda: ping_uisp(cfg))
+            except Exception as e:
+                self.errors["uisp"] = str(e)
+
+        routers = [r for r in cfg.routers if owns_site(r.site)]
+        workers = max(1, min(cfg.batch_max_routers, len(routers) + 1))
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="warmup")
+        # Each task runs in a copy of this context, so it shares the warmup deadline
+        futures = {pool.submit(contextvars.copy_context().run, warm_uisp): "uisp"}
+        for router in routers:
+            futures[pool.submit(contextvars.copy_context().run, warm_router, router)] = f"router:{router.site}"
+        _, pending = wait(futures, timeout=max(remaining(), 0) if cfg.warmup_timeout_seconds else None)
+        pool.shutdown(wait=False, cancel_futures=True)
+        for future in pending:
+            self.errors.setdefault(futures[future], "Warmup timeout passed")
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready,
+            "seconds": self.seconds,
+            "steps": dict(self.steps),
+            "errors": dict(self.errors),
+        }
+
+
+def warm_router_client(cfg: AppConfig, router):
+    """
+    Connect to a router and, if enabled, wait for its lease cache to load,
+    within the caller's deadline.
+    """
+    get_router_client(router, cfg.tls_verify).warm()
+    if cfg.lease_cache_enabled and cfg.warmup_lease_cache and router.suspend_mode != ADDRESS_LIST_MODE:
+        cache = get_lease_cache(router, cfg)
+        if not cache.wait_loaded(max(remaining(), 0)):
+            raise TimeoutError("Lease table not loaded in time")
+
+
+_warmup: Warmup | None = None
+_warmup_pid = None
+_warmup_lock = threading.Lock()
+
+
+def get_warmup() -> Warmup:
+    """This process's warmup state (fresh after fork)."""
+    global _warmup, _warmup_pid
+    with _warmup_lock:
+        if _warmup is None or _warmup_pid != os.getpid():
+            _warmup = Warmup()
+            _warmup_pid = os.getpid()
+        return _warmup
+
+
+def start_warmup(cfg: AppConfig | None = None) -> Warmup:
+    """Warm up in the background; /healthz reports ready once it is done."""
+    warmup = get_warmup()
+    threading.Thread(target=warmup.run, args=(cfg,), name="warmup", daemon=True).start()
+    return warmup
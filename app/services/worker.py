@@ -0,0 +1,153 @@
+import os
+import time
+import random
+import atexit
+import socket
+import logging
+import threading
+from app.core.config import AppConfig, get_config
+from app.core.metrics import timed
+from app.models.jobs import JobQueue, SUCCEEDED, FAILED, DEAD, job_queue_path
+from app.infra.telegram import TelegramNotifier
+from app.services.sharding import ShardMembership
+
+# Running jobs not finished within this many seconds are assumed lost
+VISIBILITY_TIMEOUT = 300
+POLL_INTERVAL = 1.0
+HOUSEKEEPING_INTERVAL = 60
+MAX_BACKOFF = 3600
+
+
+class WorkerPool:
+    """
+    Threads that drain the job queue.
+    A handler returns a perform_action-style dict; {"ok": False, "retryable": True}
+    or an exception is retried with exponential backoff until max_attempts,
+    after which the job is dead-lettered. A result with retry_after (router
+    shedding load) is deferred that long without counting as an attempt.
+    With shard_enabled the pool only takes jobs for the routers this
+    process owns, plus jobs not tied to a router.
+    """
+
+    def __init__(self, queue: JobQueue, handlers: dict, cfg: AppConfig):
+        self.queue = queue
+        self.handlers = handlers
+        self.cfg = cfg
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads: list[threading.Thread] = []
+        self._last_housekeeping = 0.0
+        self.shard = ShardMembership(queue, cfg, self.worker_id, self.wake) if cfg.shard_enabled else None
+
+    def start(self):
+        if self.shard is not None:
+            self.shard.start()
+        for i in range(self.cfg.job_workers):
+            t = threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        logging.info(f"Started {self.cfg.job_workers} job workers ({self.worker_id})")
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self.shard is not None:
+            self.shard.stop()
+
+    def _claim(self) -> dict | None:
+        if self.shard is None:
+            return self.queue.claim(self.worker_id)
+        return self.queue.claim_sharded(self.worker_id, self.shard.owned, self.shard.sites,
+                                        self.cfg.shard_router_concurrency)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self._housekeeping()
+                job = self._claim()
+            except Exception as e:
+                logging.error(f"Job queue unavailable: {e}")
+                job = None
+            if job is None:
+                self._wake.wait(POLL_INTERVAL)
+                self._wake.clear()
+                continue
+            self._execute(job)
+
+    def _execute(self, job: dict):
+        handler = self.handlers.get(job["kind"])
+        error = None
+        result = None
+        retryable = False
+        if handler is None:
+            error = f"No handler for job kind '{job['kind']}'"
+        else:
+            try:
+                with timed(f"job_{job['kind']}"):
+                    result = handler(job["payload"])
+                retryable = bool(result.get("retryable")) and not result.get("ok")
+                if not result.get("ok"):
+                    error = result.get("message")
+            except Exception as e:
+                logging.exception(f"Job {job['uuid']} raised:")
+                error = str(e)
+                retryable = True
+
+        if error is None:
+            self.queue.complete(job["id"], SUCCEEDED, result)
+        elif not retryable:
+            self.queue.complete(job["id"], FAILED, result, error)
+        elif result and result.get("retry_after") is not None:
+            # Router breaker open or bulkhead full: wait it out without spending an attempt
+            delay = result["retry_after"] * random.uniform(1.0, 1.5)
+            logging.info(f"Job {job['uuid']} deferred {delay:.0f}s: {error}")
+            self.queue.retry(job["id"], delay, error, result, count_attempt=False)
+        elif job["attempts"] >= self.cfg.job_max_attempts:
+            self.queue.complete(job["id"], DEAD, result, error)
+            msg = f"Job {job['uuid']} ({job['kind']}) dead-lettered after {job['attempts']} attempts: {error}"
+            logging.error(msg)
+            TelegramNotifier.from_config(self.cfg).send(f"❌ {msg}", level="error")
+        else:
+            delay = min(self.cfg.job_retry_backoff_seconds * 2 ** (job["attempts"] - 1), MAX_BACKOFF)
+            delay *= random.uniform(0.8, 1.2)
+            logging.warning(f"Job {job['uuid']} attempt {job['attempts']} failed, retrying in {delay:.0f}s: {error}")
+            self.queue.retry(job["id"], delay, error, result)
+
+    def _housekeeping(self):
+        now = time.time()
+        if now - self._last_housekeeping < HOUSEKEEPING_INTERVAL:
+            return
+        self._last_housekeeping = now
+        requeued = self.queue.requeue_stale(VISIBILITY_TIMEOUT)
+        if requeued:
+            logging.warning(f"Requeued {requeued} stale jobs")
+        self.queue.purge(now - self.cfg.job_retention_days * 86400)
+
+
+_pool: WorkerPool | None = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_job_queue(cfg: AppConfig | None = None) -> JobQueue:
+    return JobQueue(job_queue_path(cfg or get_config()))
+
+
+def start_workers(cfg: AppConfig | None = None) -> WorkerPool:
+    """Start this process's worker pool once (again after fork)."""
+    global _pool, _pool_pid
+    from app.services.jobs import HANDLERS
+
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            cfg = cfg or get_config()
+            _pool = WorkerPool(get_job_queue(cfg), HANDLERS, cfg)
+            _pool_pid = os.getpid()
+            _pool.start()
+            # Hand this process's routers to the other members right away
+            atexit.register(_pool.stop)
+        return _pool
@@ -4,6 +4,8 @@ WSGI entrypoint for Gunicorn.
 
 import logging
 
+logging.basicConfig(level=logging.INFO)
+
 try:
     from app import create_app
 except Exception as e:
@@ -11,7 +13,6 @@ except Exception as e:
 
 app = create_app()
 
-logging.basicConfig(level=logging.INFO)
 logging.getLogger(__name__).info("WSGI application loaded successfully.")
 
 if __name__ == "__main__":
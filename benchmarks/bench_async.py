@@ -0,0 +1,98 @@
+"""
+Per-webhook latency of the asyncio pipeline against the synchronous
+perform_action(), on the inline path: every call does its own router,
+UISP, Telegram and WhatsApp I/O against local stand-ins (no outbox, no
+Telegram digest). Each mode gets its own clients, so neither benefits
+from the other's client cache; lease tables are loaded before timing.
+
+    python -m benchmarks.bench_async --webhooks 200 --router-latency 0.02 --uisp-latency 0.05 --notify-latency 0.05
+"""
+
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+
+from benchmarks.fakes import FakeRouterOS, FakeUISP, FakeTelegram, FakeWhatsApp, client_ip
+from benchmarks.bench_webhooks import APP_KEY, percentile, write_nas_config
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--routers", type=int, default=4)
+    parser.add_argument("--leases", type=int, default=2000)
+    parser.add_argument("--webhooks", type=int, default=200, help="per mode")
+    parser.add_argument("--unsuspend-every", type=int, default=5, help="every Nth webhook is an unsuspend")
+    parser.add_argument("--router-latency", type=float, default=0.02)
+    parser.add_argument("--uisp-latency", type=float, default=0.05)
+    parser.add_argument("--notify-latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    routers = [FakeRouterOS(leases=args.leases, first_ip=f"100.{64 + i}.0.1", latency=args.router_latency).start()
+               for i in range(args.routers)]
+    uisp = FakeUISP(clients=args.routers * args.leases, latency=args.uisp_latency).start()
+    telegram = FakeTelegram(latency=args.notify_latency).start()
+    whatsapp = FakeWhatsApp(latency=args.notify_latency).start()
+    tmp = tempfile.mkdtemp(prefix="bench-async-")
+    nas_config = os.path.join(tmp, "nas_config.json")
+    write_nas_config(nas_config, routers, [])
+    os.environ.update({
+        "NAS_CONFIG_PATH": nas_config,
+        "STATE_DIR": tmp,
+        "UISP_BASE_URL": uisp.url,
+        "UISP_APP_KEY": APP_KEY,
+        "TELEGRAM_API_URL": telegram.url,
+        "TELEGRAM_BOT_TOKEN": "bench",
+        "TELEGRAM_CHAT_ID": "1",
+        "TELEGRAM_DIGEST_SECONDS": "0",
+        "WHATSAPP_API_URL": whatsapp.url,
+        "WHATSAPP_PHONE_NUMBER_ID": "bench",
+        "WHATSAPP_TOKEN": "bench",
+        "TLS_VERIFY": "false",
+        "NOTIFY_OUTBOX_ENABLED": "false",
+    })
+    os.environ.pop("PROMETHEUS_MULTIPROC_DIR", None)
+
+    # Imported after the environment is set: config is read once per process
+    from app.core.config import get_config
+    from app.infra.lease_cache import get_lease_cache
+    from app.infra.mikrotik import get_router_client
+    from app.services.suspensions import perform_action
+    from app.services.async_suspensions import run_action
+
+    cfg = get_config()
+    for router in cfg.routers:
+        get_lease_cache(router, cfg, lambda r=router: get_router_client(r, cfg.tls_verify)).wait_loaded(60)
+
+    print(f"routers={args.routers} webhooks/mode={args.webhooks} "
+          f"latency router/uisp/notify={args.router_latency * 1000:.0f}/{args.uisp_latency * 1000:.0f}/"
+          f"{args.notify_latency * 1000:.0f} ms")
+    try:
+        per_router = args.leases // 2
+        for offset, (name, action) in enumerate((("sync", perform_action), ("async", run_action))):
+            timings = {"suspend": [], "unsuspend": []}
+            failed = 0
+            for n in range(args.webhooks):
+                site = n % args.routers
+                i = offset * per_router + (n // args.routers) % per_router
+                change = "unsuspend" if n % args.unsuspend_every == args.unsuspend_every - 1 else "suspend"
+                start = time.perf_counter()
+                result = action(change, client_ip(i, f"100.{64 + site}.0.1"), 10000 + site * args.leases + i, cfg)
+                timings[change].append((time.perf_counter() - start) * 1000)
+                failed += not result.get("ok")
+            for change, samples in timings.items():
+                if not samples:
+                    continue
+                samples.sort()
+                print(f"{name:<6} {change:<10} n={len(samples):<5} mean={statistics.mean(samples):7.1f} ms  "
+                      f"p50={percentile(samples, 0.5):7.1f} ms  p95={percentile(samples, 0.95):7.1f} ms")
+            if failed:
+                print(f"{name:<6} {failed} webhook(s) failed")
+    finally:
+        shutil.rmtree(tmp, True)
+
+
+if __name__ == "__main__":
+    main()
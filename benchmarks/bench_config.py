@@ -0,0 +1,69 @@
+"""
+Per-request config cost: load_config() twice (old webhook path) vs the
+cached get_config() snapshot.
+
+    python -m benchmarks.bench_config --routers 50 --iterations 5000
+"""
+
+import os
+import json
+import time
+import argparse
+import tempfile
+
+
+def write_nas_config(path: str, routers: int):
+    data = {}
+    for i in range(routers):
+        data[f"Site{i}"] = {
+            "api_url": f"https://10.{i // 256}.{i % 256}.1/rest",
+            "router_ip": f"10.{i // 256}.{i % 256}.1",
+            "username": "api",
+            "password": "secret",
+            "router_ip_range": f"100.{64 + i // 128}.{(i % 128) * 2}.0/23",
+        }
+    with open(path, "w") as f:
+        json.dump(data, f)
+
+
+def bench(fn, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--routers", type=int, default=50)
+    parser.add_argument("--iterations", type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        nas_path = os.path.join(tmp, "nas_config.json")
+        write_nas_config(nas_path, args.routers)
+        os.environ["NAS_CONFIG_PATH"] = nas_path
+
+        from app.core.config import load_config, get_config
+
+        def uncached():
+            # The old webhook path loaded config in the blueprint and again in perform_action
+            load_config()
+            load_config()
+
+        def cached():
+            get_config()
+            get_config()
+
+        get_config()
+        before = bench(uncached, args.iterations)
+        after = bench(cached, args.iterations)
+
+    print(f"routers={args.routers} iterations={args.iterations}")
+    print(f"load_config x2 per request: {before:9.1f} us")
+    print(f"get_config  x2 per request: {after:9.1f} us")
+    print(f"speedup: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
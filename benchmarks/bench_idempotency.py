@@ -0,0 +1,70 @@
+"""
+Duplicate-check latency of IdempotencyStore with a large table:
+new-uuid claims, duplicates answered by the in-memory front, and
+duplicates that have to go to SQLite (front cold, e.g. another worker).
+
+    python -m benchmarks.bench_idempotency --rows 1000000 --iterations 20000
+"""
+
+import os
+import time
+import uuid
+import random
+import argparse
+import tempfile
+import statistics
+
+
+def percentiles(samples: list[float]) -> str:
+    samples.sort()
+    p99 = samples[int(len(samples) * 0.99) - 1]
+    return f"p50={statistics.median(samples):7.1f} us  p99={p99:7.1f} us"
+
+
+def timed(fn, keys) -> list[float]:
+    samples = []
+    for key in keys:
+        start = time.perf_counter()
+        fn(key)
+        samples.append((time.perf_counter() - start) * 1e6)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    from app.models.idempotency import IdempotencyStore
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "idempotency.db")
+        store = IdempotencyStore(path, ttl=30 * 86400, front_size=100000)
+
+        start = time.perf_counter()
+        now = time.time()
+        existing = [str(uuid.uuid4()) for _ in range(args.rows)]
+        conn = store._conn
+        conn.execute("BEGIN")
+        conn.executemany(
+            "INSERT INTO webhooks (uuid, entity_type, entity_id, change_type, status, created_at) "
+            "VALUES (?, 'service', '1', 'suspend', 'processed', ?)",
+            ((u, now) for u in existing),
+        )
+        conn.execute("COMMIT")
+        print(f"rows={args.rows} loaded in {time.perf_counter() - start:.1f}s "
+              f"({os.path.getsize(path) / 1e6:.0f} MB)")
+
+        new_keys = [str(uuid.uuid4()) for _ in range(args.iterations)]
+        print(f"claim (new uuid)           {percentiles(timed(store.claim, new_keys))}")
+        print(f"claim (duplicate, front)   {percentiles(timed(store.claim, new_keys))}")
+
+        cold = IdempotencyStore(path, ttl=30 * 86400, front_size=100000)
+        sample = random.sample(existing, args.iterations)
+        print(f"claim (duplicate, SQLite)  {percentiles(timed(cold.claim, sample))}")
+        print(f"is_duplicate (front)       {percentiles(timed(cold.is_duplicate, sample))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Action journal at volume: append rate through the batched writer, file
+size per row, and query latency by client, IP, router and time range
+once the journal holds millions of rows (spread over --months month
+files, as retention would keep them).
+
+    python -m benchmarks.bench_journal --rows 2000000 --months 3 --queries 200
+"""
+
+import os
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import statistics
+from types import SimpleNamespace
+
+from app.models.journal import ActionJournal
+from app.services.journal import JournalWriter
+from benchmarks.bench_webhooks import percentile
+from benchmarks.fakes import client_ip
+
+STAGES = ("router_lookup", "lease_lookup", "lease_toggle", "uisp_fetch", "whatsapp_send", "telegram_send")
+
+
+def build_row(ts: float, routers: int, clients: int) -> dict:
+    n = random.randrange(clients)
+    site = n % routers
+    return {
+        "ts": ts,
+        "uuid": f"{random.getrandbits(128):032x}",
+        "client_id": 10000 + n,
+        "ip": client_ip(n // routers, f"100.{64 + site}.0.1"),
+        "site": f"Site{site}",
+        "action": "unsuspend" if random.random() < 0.3 else "suspend",
+        "outcome": "ok",
+        "duration_ms": round(random.uniform(20, 300), 1),
+        "stages": {stage: round(random.uniform(1, 60), 1) for stage in STAGES},
+        "message": f"Successfully suspended IP on Site{site}.",
+    }
+
+
+def timed_queries(fn, n: int) -> str:
+    samples = []
+    for _ in range(n):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return (f"mean={statistics.mean(samples):6.2f} ms  p50={percentile(samples, 0.5):6.2f} ms  "
+            f"p95={percentile(samples, 0.95):6.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--months", type=int, default=3)
+    parser.add_argument("--routers", type=int, default=8)
+    parser.add_argument("--clients", type=int, default=40000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench-journal-")
+    cfg = SimpleNamespace(state_dir=tmp, journal_batch_size=args.batch_size, journal_flush_seconds=0.2,
+                          journal_retention_months=args.months + 1)
+    try:
+        end = time.time()
+        begin = end - args.months * 30 * 86400
+        step = (end - begin) / args.rows
+
+        writer = JournalWriter(cfg)
+        writer.start()
+        start = time.perf_counter()
+        for i in range(args.rows):
+            row = build_row(begin + i * step, args.routers, args.clients)
+            while writer.stats()["queued"] >= args.batch_size * 10:
+                # Generate no faster than the writer drains, so nothing is dropped
+                time.sleep(0.001)
+            writer.put(row)
+        writer.stop(timeout=600)
+        elapsed = time.perf_counter() - start
+        stats = writer.stats()
+        journal = ActionJournal(os.path.join(tmp, "journal"))
+        size = sum(os.path.getsize(os.path.join(journal.directory, name)) for name in os.listdir(journal.directory))
+        print(f"rows={stats['written']} dropped={stats['dropped']} months={len(journal.months())}  "
+              f"append {stats['written'] / elapsed:9.0f} rows/s  {size / 1024 / 1024:7.1f} MB "
+              f"({size / max(stats['written'], 1):.0f} B/row)")
+
+        span = end - begin
+        queries = {
+            "client": lambda: journal.query(client_id=10000 + random.randrange(args.clients), limit=50),
+            "ip": lambda: journal.query(ip=client_ip(random.randrange(args.clients // args.routers),
+                                                     f"100.{64 + random.randrange(args.routers)}.0.1"), limit=50),
+            "router, 1 day": lambda: journal.query(site=f"Site{random.randrange(args.routers)}",
+                                                   since=(s := begin + random.random() * (span - 86400)),
+                                                   until=s + 86400, limit=100),
+            "time, 1 hour": lambda: journal.query(since=(s := begin + random.random() * (span - 3600)),
+                                                  until=s + 3600, limit=100),
+            "client, 1 week": lambda: journal.query(client_id=10000 + random.randrange(args.clients),
+                                                    since=(s := begin + random.random() * (span - 7 * 86400)),
+                                                    until=s + 7 * 86400, limit=50),
+        }
+        for name, fn in queries.items():
+            print(f"query {name:<15} {timed_queries(fn, args.queries)}")
+    finally:
+        shutil.rmtree(tmp, True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Lease lookup against a fake RouterOS holding a large lease table:
+full list + Python scan (old path) vs find_lease() with REST filtering,
+and find_lease() on a router without filter support (fallback path).
+
+    python -m benchmarks.bench_lease_lookup --leases 20000 --iterations 50
+"""
+
+import time
+import random
+import argparse
+import statistics
+
+from benchmarks.fakes import FakeRouterOS
+
+
+def run(label: str, fn, addresses: list[str]):
+    samples = []
+    for address in addresses:
+        start = time.perf_counter()
+        lease = fn(address)
+        samples.append((time.perf_counter() - start) * 1000)
+        assert lease and lease["address"] == address, f"{label}: lookup failed for {address}"
+    samples.sort()
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{label:<28} p50={statistics.median(samples):8.2f} ms  p95={p95:8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--leases", type=int, default=20000)
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    from app.infra.mikrotik import MikroTikClient
+
+    with FakeRouterOS(leases=args.leases) as router, \
+            FakeRouterOS(leases=args.leases, supports_filter=False) as legacy:
+        addresses = random.sample(sorted(router.by_address), args.iterations)
+
+        mt = MikroTikClient(f"{router.url}/rest", "api", "secret")
+        old_mt = MikroTikClient(f"{legacy.url}/rest", "api", "secret")
+
+        def full_scan(address):
+            leases = mt.list_leases()
+            return next((l for l in leases if l.get("address") == address), None)
+
+        print(f"leases={args.leases} iterations={args.iterations}")
+        run("list_leases + scan", full_scan, addresses)
+        run("find_lease (filtered)", mt.find_lease, addresses)
+        run("find_lease (fallback)", old_mt.find_lease, addresses)
+
+
+if __name__ == "__main__":
+    main()
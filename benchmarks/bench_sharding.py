@@ -0,0 +1,131 @@
+"""
+Router affinity across gunicorn workers: the same queued webhook burst
+with SHARD_ENABLED off and on. Reports drain time and, per router, the
+connections opened, full lease-table reads (one per cold lease cache) and
+the most requests the router saw at once.
+
+    python -m benchmarks.bench_sharding --workers 4 --routers 4 --webhooks 800
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+from benchmarks.fakes import FakeRouterOS, FakeUISP, FakeTelegram, FakeWhatsApp
+from benchmarks.bench_webhooks import APP_KEY, write_nas_config, build_burst, fire
+from benchmarks.bench_workers import ROOT, free_port, wait_ready
+from app.models.jobs import JobQueue
+
+
+def wait_drained(state_dir: str, timeout: float) -> float | None:
+    queue = JobQueue(os.path.join(state_dir, "jobs.db"))
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        counts = queue.counts()
+        if not counts.get("queued") and not counts.get("running"):
+            return time.perf_counter() - started
+        time.sleep(0.05)
+    return None
+
+
+def run(sharded: bool, routers: list[FakeRouterOS], env: dict, args):
+    for router in routers:
+        router.requests = router.connections = router.max_in_flight = router.table_reads = 0
+    port = free_port()
+    state_dir = tempfile.mkdtemp(prefix=f"shard-{sharded}-", dir=env["BENCH_TMP"])
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app.wsgi:app"],
+        cwd=ROOT,
+        env={**env, "STATE_DIR": state_dir, "GUNICORN_BIND": f"127.0.0.1:{port}",
+             "SHARD_ENABLED": str(sharded).lower()},
+        stdout=subprocess.DEVNULL,
+        stderr=open(os.path.join(state_dir, "gunicorn.log"), "w"),
+    )
+    try:
+        base = f"http://127.0.0.1:{port}"
+        if not wait_ready(f"{base}/healthz"):
+            print(f"sharding={sharded} failed to start")
+            return
+        # Let every worker send its first heartbeat before the burst
+        time.sleep(args.settle)
+        start = time.perf_counter()
+        _, statuses, _ = fire(f"{base}/service_suspensions/", build_burst(args), args.concurrency)
+        drained = wait_drained(state_dir, args.drain_timeout)
+        total = time.perf_counter() - start
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+    print(f"sharding={str(sharded).lower():<5} applied in {total:6.2f} s"
+          f"{'' if drained is not None else ' (drain timed out)'}  {statuses}")
+    for i, router in enumerate(routers):
+        print(f"    Site{i}: {router.requests:5d} requests  {router.connections:3d} connections  "
+              f"{router.table_reads:2d} lease-table reads  max {router.max_in_flight} at once")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, default=4, help="gunicorn worker processes")
+    parser.add_argument("--job-workers", type=int, default=4, help="job threads per process")
+    parser.add_argument("--routers", type=int, default=4)
+    parser.add_argument("--leases", type=int, default=5000)
+    parser.add_argument("--webhooks", type=int, default=800)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--router-latency", type=float, default=0.01)
+    parser.add_argument("--router-concurrency", type=int, default=1, help="SHARD_ROUTER_CONCURRENCY")
+    parser.add_argument("--settle", type=float, default=2.0)
+    parser.add_argument("--drain-timeout", type=float, default=300)
+    args = parser.parse_args()
+    # build_burst() parameters
+    args.unsuspend_share, args.duplicate_share, args.flap_share = 0.1, 0.0, 0.0
+
+    routers = [FakeRouterOS(leases=args.leases, first_ip=f"100.{64 + i}.0.1", latency=args.router_latency).start()
+               for i in range(args.routers)]
+    uisp = FakeUISP(clients=args.routers * args.leases).start()
+    telegram = FakeTelegram().start()
+    whatsapp = FakeWhatsApp().start()
+    tmp = tempfile.mkdtemp(prefix="bench-sharding-")
+    nas_config = os.path.join(tmp, "nas_config.json")
+    write_nas_config(nas_config, routers, [])
+
+    env = {
+        **os.environ,
+        "BENCH_TMP": tmp,
+        "NAS_CONFIG_PATH": nas_config,
+        "UISP_BASE_URL": uisp.url,
+        "UISP_APP_KEY": APP_KEY,
+        "TELEGRAM_API_URL": telegram.url,
+        "TELEGRAM_BOT_TOKEN": "bench",
+        "TELEGRAM_CHAT_ID": "1",
+        "WHATSAPP_API_URL": whatsapp.url,
+        "WHATSAPP_PHONE_NUMBER_ID": "bench",
+        "WHATSAPP_TOKEN": "bench",
+        "TLS_VERIFY": "false",
+        "GUNICORN_WORKERS": str(args.workers),
+        "JOB_WORKERS": str(args.job_workers),
+        "COALESCE_WINDOW_SECONDS": "0",
+        # Lease tables load on first use, so cold caches show up as table reads
+        "WARMUP_LEASE_CACHE": "false",
+        "SHARD_HEARTBEAT_SECONDS": "1",
+        "SHARD_ROUTER_CONCURRENCY": str(args.router_concurrency),
+    }
+    env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+
+    print(f"workers={args.workers}x{args.job_workers} routers={args.routers} webhooks={args.webhooks} "
+          f"router latency={args.router_latency * 1000:.0f} ms")
+    try:
+        for sharded in (False, True):
+            run(sharded, routers, env, args)
+    finally:
+        shutil.rmtree(tmp, True)
+
+
+if __name__ == "__main__":
+    main()
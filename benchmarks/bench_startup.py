@@ -0,0 +1,155 @@
+"""
+Worker boot cost: import time of the app package, create_app(), warmup,
+and the latency of the first webhooks a fresh process serves, with and
+without the boot prewarm. Every run is a new interpreter against local
+stand-ins, so nothing is warm that a real worker would not have.
+
+    python -m benchmarks.bench_startup --routers 4 --leases 5000 --router-latency 0.02 --first 5
+"""
+
+import os
+import sys
+import hmac
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import tempfile
+import subprocess
+import statistics
+
+from benchmarks.fakes import FakeRouterOS, FakeUISP, FakeTelegram, FakeWhatsApp, client_ip
+from benchmarks.bench_webhooks import APP_KEY, write_nas_config
+
+
+def import_times(env: dict) -> tuple[float, dict]:
+    """
+    `import app` in a fresh interpreter (python -X importtime): cumulative ms
+    for the package and for each module it imports directly.
+    """
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"],
+                         env=env, capture_output=True, text=True, timeout=60)
+    children, total = {}, 0.0
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        ms = int(cumulative) / 1000
+        if depth == 1:
+            children[name.strip()] = ms
+        elif depth == 0:
+            # A top-level import's children are listed just before it
+            if name.strip() == "app":
+                total = ms
+                break
+            children = {}
+    return total, children
+
+
+def child(args):
+    """Runs in a fresh interpreter; prints one JSON line of timings."""
+    from app import create_app
+
+    start = time.perf_counter()
+    app = create_app()
+    created = time.perf_counter() - start
+
+    client = app.test_client()
+    start = time.perf_counter()
+    while client.get("/healthz").status_code != 200:
+        time.sleep(0.005)
+    ready = time.perf_counter() - start
+
+    latencies = []
+    for n in range(args.first):
+        site, i = n % args.routers, n
+        body = json.dumps({
+            "uuid": f"startup-{n}",
+            "changeType": "suspend",
+            "entity": "service",
+            "extraData": {"entity": {
+                "id": 500000 + n,
+                "clientId": 10000 + site * args.leases + i,
+                "attributes": [{"key": "ipAddress", "value": client_ip(i, f"100.{64 + site}.0.1")}],
+            }},
+        }).encode()
+        signature = hmac.new(APP_KEY.encode(), body, hashlib.sha256).hexdigest()
+        start = time.perf_counter()
+        client.post("/service_suspensions/", data=body, headers={"X-UISP-Signature": signature})
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    print(json.dumps({"create_app_ms": created * 1000,
+                      "ready_ms": ready * 1000, "first_ms": latencies}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--routers", type=int, default=4)
+    parser.add_argument("--leases", type=int, default=5000)
+    parser.add_argument("--router-latency", type=float, default=0.02)
+    parser.add_argument("--uisp-latency", type=float, default=0.05)
+    parser.add_argument("--first", type=int, default=5, help="webhooks timed after boot")
+    parser.add_argument("--runs", type=int, default=3, help="fresh processes per mode")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child(args)
+
+    routers = [FakeRouterOS(leases=args.leases, first_ip=f"100.{64 + i}.0.1", latency=args.router_latency).start()
+               for i in range(args.routers)]
+    uisp = FakeUISP(clients=args.routers * args.leases, latency=args.uisp_latency).start()
+    telegram = FakeTelegram().start()
+    whatsapp = FakeWhatsApp().start()
+    tmp = tempfile.mkdtemp(prefix="bench-startup-")
+    nas_config = os.path.join(tmp, "nas_config.json")
+    write_nas_config(nas_config, routers, [])
+
+    env = {
+        **os.environ,
+        "NAS_CONFIG_PATH": nas_config,
+        "UISP_BASE_URL": uisp.url,
+        "UISP_APP_KEY": APP_KEY,
+        "TELEGRAM_API_URL": telegram.url,
+        "TELEGRAM_BOT_TOKEN": "bench",
+        "TELEGRAM_CHAT_ID": "1",
+        "WHATSAPP_API_URL": whatsapp.url,
+        "WHATSAPP_PHONE_NUMBER_ID": "bench",
+        "WHATSAPP_TOKEN": "bench",
+        "TLS_VERIFY": "false",
+        "JOB_QUEUE_ENABLED": "false",
+        "NOTIFY_OUTBOX_ENABLED": "false",
+    }
+    env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+    command = [sys.executable, "-m", "benchmarks.bench_startup", "--child", "--routers", str(args.routers),
+               "--leases", str(args.leases), "--first", str(args.first)]
+
+    print(f"routers={args.routers} leases/router={args.leases} router latency={args.router_latency * 1000:.0f} ms "
+          f"uisp latency={args.uisp_latency * 1000:.0f} ms, {args.runs} fresh processes per mode")
+    try:
+        totals = [import_times({**env, "STATE_DIR": tmp}) for _ in range(args.runs)]
+        slowest = sorted(totals[-1][1].items(), key=lambda m: -m[1])[:6]
+        print(f"import app  {statistics.median(t for t, _ in totals):7.1f} ms  "
+              f"({', '.join(f'{m} {ms:.1f}' for m, ms in slowest)})")
+        for warm in ("false", "true"):
+            rows = []
+            for run in range(args.runs):
+                state_dir = os.path.join(tmp, f"state-{warm}-{run}")
+                out = subprocess.run(command, env={**env, "WARMUP_ENABLED": warm, "STATE_DIR": state_dir},
+                                     capture_output=True, text=True, timeout=300)
+                if out.returncode != 0:
+                    raise SystemExit(out.stderr)
+                rows.append(json.loads(out.stdout.strip().splitlines()[-1]))
+            first = [r["first_ms"][0] for r in rows]
+            rest = [ms for r in rows for ms in r["first_ms"][1:]]
+            print(f"warmup={warm:<5}  create_app={statistics.median(r['create_app_ms'] for r in rows):6.1f} ms  "
+                  f"ready={statistics.median(r['ready_ms'] for r in rows):7.1f} ms  "
+                  f"1st webhook={statistics.median(first):7.1f} ms  "
+                  f"next={statistics.median(rest) if rest else 0:7.1f} ms")
+    finally:
+        shutil.rmtree(tmp, True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+REST vs native RouterOS API transport in MikroTikClient, against the same
+fake lease table: single lease lookup, single toggle, and a bulk toggle
+(concurrent PATCHes over REST, pipelined sets over the API).
+
+    python -m benchmarks.bench_transport --leases 20000 --iterations 200 --latency 0.005 --bulk 500
+"""
+
+import time
+import random
+import argparse
+import statistics
+
+from benchmarks.fakes import FakeRouterOS, FakeRouterOSAPI
+
+
+def run(label: str, fn, args_list) -> None:
+    samples = []
+    for args in args_list:
+        start = time.perf_counter()
+        fn(*args)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{label:<30} p50={statistics.median(samples):8.2f} ms  p95={p95:8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--leases", type=int, default=20000)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.005, help="per-request delay on both fakes")
+    parser.add_argument("--bulk", type=int, default=500, help="leases toggled in the bulk run")
+    parser.add_argument("--concurrency", type=int, default=4, help="concurrent PATCHes for REST bulk")
+    args = parser.parse_args()
+
+    from app.infra.mikrotik import MikroTikClient
+
+    with FakeRouterOS(leases=args.leases, latency=args.latency) as router, \
+            FakeRouterOSAPI(router, latency=args.latency) as api:
+        clients = {
+            "rest": MikroTikClient(f"{router.url}/rest", "api", "secret"),
+            "api": MikroTikClient(f"{router.url}/rest", "api", "secret", transport="api", api_port=api.port),
+        }
+        addresses = random.sample(sorted(router.by_address), args.iterations)
+        print(f"leases={args.leases} iterations={args.iterations} latency={args.latency * 1000:.1f} ms")
+
+        for name, mt in clients.items():
+            mt.find_lease(addresses[0])  # connect / log in
+            run(f"{name}: find_lease", mt.find_lease, [(a,) for a in addresses])
+            ids = [router.by_address[a][".id"] for a in addresses]
+            run(f"{name}: toggle_block_access", mt.toggle_block_access, [(i, True) for i in ids])
+
+            changes = [(router.by_address[a][".id"], False) for a in random.sample(sorted(router.by_address), args.bulk)]
+            start = time.perf_counter()
+            errors = mt.set_block_access_many(changes, concurrency=args.concurrency)
+            elapsed = time.perf_counter() - start
+            assert not any(errors), errors
+            print(f"{name + ': bulk toggle':<30} {args.bulk} leases in {elapsed * 1000:8.1f} ms "
+                  f"({args.bulk / elapsed:,.0f}/s)")
+
+            start = time.perf_counter()
+            mt.list_leases(proplist=".id,address,block-access")
+            print(f"{name + ': list_leases':<30} {(time.perf_counter() - start) * 1000:8.1f} ms")
+
+        print(f"api logins={api.logins} (one persistent connection)")
+
+
+if __name__ == "__main__":
+    main()
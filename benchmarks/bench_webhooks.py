@@ -0,0 +1,312 @@
+"""
+Month-end webhook burst against the Flask app, with every upstream
+(RouterOS, UISP, Telegram, WhatsApp) replaced by a local stand-in.
+
+Reports webhook response latency (p50/p95/p99) and requests/sec, how long
+the job queue takes to apply the burst, and the mean time spent in each
+pipeline stage. Each run is appended to --results and compared with the
+previous run that used the same parameters, so regressions in
+perform_action or the infra clients stand out.
+
+    python -m benchmarks.bench_webhooks --routers 4 --leases 5000 --webhooks 2000 --concurrency 32
+    python -m benchmarks.bench_webhooks --mode inline --router-latency 0.02 --uisp-latency 0.05
+    python -m benchmarks.bench_webhooks --flap-share 0.3 --coalesce-window 0
+"""
+
+import os
+import atexit
+import hmac
+import json
+import time
+import uuid
+import random
+import shutil
+import hashlib
+import argparse
+import tempfile
+import threading
+import subprocess
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.fakes import FakeRouterOS, FakeRouterOSAPI, FakeUISP, FakeTelegram, FakeWhatsApp, client_ip
+
+APP_KEY = "bench-app-key"
+DEFAULT_RESULTS = os.path.join(os.path.dirname(__file__), "results", "webhooks.jsonl")
+# Compared metrics, and whether a higher value is better
+TRACKED = {"p50_ms": False, "p95_ms": False, "p99_ms": False, "req_per_sec": True, "applied_per_sec": True}
+REGRESSION_THRESHOLD = 0.10
+
+
+def percentile(samples: list[float], q: float) -> float:
+    return samples[max(int(len(samples) * q) - 1, 0)]
+
+
+def write_nas_config(path: str, routers: list[FakeRouterOS], api_servers: list[FakeRouterOSAPI]):
+    data = {}
+    for i, router in enumerate(routers):
+        data[f"Site{i}"] = {
+            "api_url": f"{router.url}/rest",
+            "router_ip": f"10.0.{i}.1",
+            "username": "api",
+            "password": "secret",
+            "router_ip_range": f"100.{64 + i}.0.0/16",
+        }
+        if api_servers:
+            data[f"Site{i}"].update({"transport": "api", "api_port": api_servers[i].port})
+    with open(path, "w") as f:
+        json.dump(data, f)
+
+
+def build_burst(args) -> list[dict]:
+    """UISP service.suspend / service.unsuspend webhooks, with some UISP retries mixed in."""
+    events = []
+    for _ in range(args.webhooks):
+        site = random.randrange(args.routers)
+        i = random.randrange(args.leases)
+        index = site * args.leases + i
+        change = "unsuspend" if random.random() < args.unsuspend_share else "suspend"
+        events.append({
+            "uuid": str(uuid.uuid4()),
+            "changeType": change,
+            "entity": "service",
+            "entityId": str(500000 + index),
+            "eventName": f"service.{change}",
+            "extraData": {"entity": {
+                "id": 500000 + index,
+                "clientId": 10000 + index,
+                "attributes": [{"key": "ipAddress", "value": client_ip(i, f"100.{64 + site}.0.1")}],
+            }},
+        })
+    for event in [e for e in events if e["changeType"] == "suspend" and random.random() < args.flap_share]:
+        # Paid right after being suspended: the unsuspend follows within seconds
+        unsuspend = {**event, "uuid": str(uuid.uuid4()), "changeType": "unsuspend", "eventName": "service.unsuspend"}
+        events.insert(events.index(event) + 1, unsuspend)
+    for _ in range(int(args.webhooks * args.duplicate_share)):
+        # Retries arrive shortly after the original
+        events.insert(random.randrange(len(events) + 1), random.choice(events))
+    return events
+
+
+def stage_means() -> dict:
+    """Mean milliseconds per pipeline stage from this process's metrics."""
+    from app.core.metrics import STAGE_SECONDS
+
+    sums, counts = {}, {}
+    for metric in STAGE_SECONDS.collect():
+        for sample in metric.samples:
+            stage = sample.labels.get("stage")
+            if sample.name.endswith("_sum"):
+                sums[stage] = sums.get(stage, 0) + sample.value
+            elif sample.name.endswith("_count"):
+                counts[stage] = counts.get(stage, 0) + sample.value
+    return {stage: round(sums[stage] / counts[stage] * 1000, 3) for stage in sorted(counts) if counts[stage]}
+
+
+def fire(url: str, events: list[dict], concurrency: int) -> tuple[list[float], dict, float]:
+    local = threading.local()
+
+    def send(event):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        body = json.dumps(event).encode()
+        signature = hmac.new(APP_KEY.encode(), body, hashlib.sha256).hexdigest()
+        start = time.perf_counter()
+        r = session.post(url, data=body, timeout=60, headers={
+            "Content-Type": "application/json",
+            "X-UISP-Signature": signature,
+        })
+        return (time.perf_counter() - start) * 1000, r.status_code
+
+    statuses = {}
+    samples = []
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for ms, status in pool.map(send, events):
+            samples.append(ms)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return samples, statuses, time.perf_counter() - started
+
+
+def wait_for_queue(cfg, timeout: float) -> float | None:
+    """Seconds until no webhook job is queued or running, None on timeout."""
+    from app.services.worker import get_job_queue
+
+    queue = get_job_queue(cfg)
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        counts = queue.counts()
+        if not counts.get("queued") and not counts.get("running"):
+            return time.perf_counter() - started
+        time.sleep(0.05)
+    return None
+
+
+def git_revision() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10)
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(record: dict, path: str):
+    """Print the change against the last stored run with the same parameters."""
+    previous = None
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    continue
+                if row.get("params") == record["params"]:
+                    previous = row
+    if previous is None:
+        print("no previous run with these parameters")
+        return
+
+    print(f"vs {previous.get('revision') or '?'} ({previous['timestamp']}):")
+    rows = [(name, previous["results"].get(name), record["results"].get(name), higher)
+            for name, higher in TRACKED.items()]
+    rows += [(f"stage {stage} ms", previous["stages"].get(stage), value, False)
+             for stage, value in record["stages"].items()]
+    for name, before, after, higher_is_better in rows:
+        if not before or after is None:
+            continue
+        change = (after - before) / before
+        worse = -change if higher_is_better else change
+        flag = "  REGRESSION" if worse > REGRESSION_THRESHOLD else ""
+        print(f"  {name:<28} {before:>10.2f} -> {after:>10.2f}  {change:+7.1%}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=("queued", "inline"), default="queued",
+                        help="queued: endpoint enqueues (JOB_QUEUE_ENABLED); inline: perform_action in the request")
+    parser.add_argument("--transport", choices=("rest", "api"), default="rest", help="router transport")
+    parser.add_argument("--routers", type=int, default=4)
+    parser.add_argument("--leases", type=int, default=5000, help="leases (and UISP clients) per router")
+    parser.add_argument("--webhooks", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--unsuspend-share", type=float, default=0.1)
+    parser.add_argument("--duplicate-share", type=float, default=0.05, help="share of webhooks UISP re-sends")
+    parser.add_argument("--flap-share", type=float, default=0.0,
+                        help="share of suspends followed at once by an unsuspend for the same client")
+    parser.add_argument("--coalesce-window", type=float, default=5.0, help="COALESCE_WINDOW_SECONDS (0 disables)")
+    parser.add_argument("--router-latency", type=float, default=0.005)
+    parser.add_argument("--uisp-latency", type=float, default=0.02)
+    parser.add_argument("--notify-latency", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="injected 503s on every stand-in")
+    parser.add_argument("--whatsapp-throttle", type=float, default=0.0, help="share of WhatsApp sends answered 429")
+    parser.add_argument("--drain-timeout", type=float, default=300)
+    parser.add_argument("--results", default=DEFAULT_RESULTS)
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    faults = {"error_rate": args.error_rate}
+    routers = [
+        FakeRouterOS(leases=args.leases, first_ip=f"100.{64 + i}.0.1", latency=args.router_latency, **faults).start()
+        for i in range(args.routers)
+    ]
+    uisp = FakeUISP(clients=args.routers * args.leases, latency=args.uisp_latency, **faults).start()
+    telegram = FakeTelegram(latency=args.notify_latency, **faults).start()
+    whatsapp = FakeWhatsApp(throttle_rate=args.whatsapp_throttle, latency=args.notify_latency, **faults).start()
+    tmp = tempfile.mkdtemp(prefix="bench-webhooks-")
+    # Stand-ins and app threads run until exit so late digests and notices still land
+    atexit.register(shutil.rmtree, tmp, True)
+
+    nas_config = os.path.join(tmp, "nas_config.json")
+    api_servers = [FakeRouterOSAPI(r, latency=args.router_latency).start() for r in routers] \
+        if args.transport == "api" else []
+    write_nas_config(nas_config, routers, api_servers)
+    os.environ.update({
+        "NAS_CONFIG_PATH": nas_config,
+        "STATE_DIR": tmp,
+        "UISP_BASE_URL": uisp.url,
+        "UISP_APP_KEY": APP_KEY,
+        "TELEGRAM_API_URL": telegram.url,
+        "TELEGRAM_BOT_TOKEN": "bench",
+        "TELEGRAM_CHAT_ID": "1",
+        "WHATSAPP_API_URL": whatsapp.url,
+        "WHATSAPP_PHONE_NUMBER_ID": "bench",
+        "WHATSAPP_TOKEN": "bench",
+        "TLS_VERIFY": "false",
+        "JOB_QUEUE_ENABLED": "true" if args.mode == "queued" else "false",
+        "COALESCE_WINDOW_SECONDS": str(args.coalesce_window),
+    })
+    os.environ.pop("PROMETHEUS_MULTIPROC_DIR", None)
+
+    # Imported after the environment points at the stand-ins
+    from werkzeug.serving import make_server
+    from app import create_app
+    from app.core.config import get_config
+
+    server = make_server("127.0.0.1", 0, create_app(), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/service_suspensions/"
+
+    events = build_burst(args)
+    print(f"mode={args.mode} routers={args.routers} leases/router={args.leases} "
+          f"webhooks={len(events)} concurrency={args.concurrency}")
+    samples, statuses, elapsed = fire(url, events, args.concurrency)
+
+    drained = wait_for_queue(get_config(), args.drain_timeout) if args.mode == "queued" else 0.0
+    if args.coalesce_window > 0:
+        # Suspension notices are held back for the window before the dispatcher sends them
+        time.sleep(args.coalesce_window + 1)
+    samples.sort()
+    blocked = sum(1 for r in routers for l in r.leases.values() if l["block-access"] == "yes")
+    results = {
+        "webhooks": len(events),
+        "statuses": statuses,
+        "p50_ms": round(statistics.median(samples), 2),
+        "p95_ms": round(percentile(samples, 0.95), 2),
+        "p99_ms": round(percentile(samples, 0.99), 2),
+        "max_ms": round(samples[-1], 2),
+        "req_per_sec": round(len(events) / elapsed, 1),
+        "drain_seconds": round(drained, 2) if drained is not None else None,
+        "applied_per_sec": round(len(events) / (elapsed + drained), 1) if drained is not None else None,
+        "leases_blocked": blocked,
+        "router_requests": sum(r.requests for r in routers),
+        "uisp_requests": uisp.requests,
+        "telegram_messages": len(telegram.messages),
+        "whatsapp_sent": whatsapp.sent,
+        "whatsapp_throttled": whatsapp.throttled,
+    }
+    stages = stage_means()
+
+    print(f"responses        {statuses}")
+    print(f"latency          p50={results['p50_ms']} ms  p95={results['p95_ms']} ms  "
+          f"p99={results['p99_ms']} ms  max={results['max_ms']} ms")
+    print(f"throughput       {results['req_per_sec']} req/s accepted, "
+          f"{results['applied_per_sec']} webhooks/s applied (queue drained in {results['drain_seconds']} s)")
+    print(f"upstream calls   routers={results['router_requests']} uisp={results['uisp_requests']} "
+          f"telegram={results['telegram_messages']} whatsapp={results['whatsapp_sent']} "
+          f"(429s: {results['whatsapp_throttled']})")
+    print("stage means (ms)")
+    for stage, ms in stages.items():
+        print(f"  {stage:<20} {ms:>10.3f}")
+
+    params = {k: v for k, v in vars(args).items() if k not in ("results", "no_save", "drain_timeout")}
+    record = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "revision": git_revision(),
+        "params": params,
+        "results": results,
+        "stages": stages,
+    }
+    compare(record, args.results)
+    if not args.no_save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.results)), exist_ok=True)
+        with open(args.results, "a") as f:
+            f.write(json.dumps(record) + "\n")
+        print(f"saved to {args.results}")
+
+
+if __name__ == "__main__":
+    main()
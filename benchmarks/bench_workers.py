@@ -0,0 +1,192 @@
+"""
+Gunicorn worker classes compared on the inline webhook path (router,
+UISP and WhatsApp calls made inside the request): requests/sec, memory
+(PSS of master + workers, so shared pages are not double counted) and
+requests/sec per GB. gevent modes are skipped unless gevent is installed.
+
+    python -m benchmarks.bench_workers --webhooks 600 --concurrency 64
+    python -m benchmarks.bench_workers --modes sync:4 gthread:2x16 gevent:2x200
+"""
+
+import os
+import sys
+import time
+import socket
+import shutil
+import argparse
+import tempfile
+import importlib.util
+import subprocess
+
+import requests
+
+from benchmarks.fakes import FakeRouterOS, FakeUISP, FakeTelegram, FakeWhatsApp
+from benchmarks.bench_webhooks import APP_KEY, write_nas_config, build_burst, fire
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_mode(mode: str) -> tuple[str, int, int]:
+    """'sync:4' -> (sync, 4 workers, 1); 'gthread:2x16' -> (gthread, 2 workers, 16 threads/connections)."""
+    worker_class, _, shape = mode.partition(":")
+    workers, _, per_worker = shape.partition("x")
+    return worker_class, int(workers or 1), int(per_worker or 1)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def process_tree(pid: int) -> list[int]:
+    pids = [pid]
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            children = [int(p) for p in f.read().split()]
+    except OSError:
+        return pids
+    for child in children:
+        pids += process_tree(child)
+    return pids
+
+
+def pss_mb(pid: int) -> float:
+    """Proportional set size of a process tree in MB (RSS where smaps_rollup is unavailable)."""
+    total = 0
+    for p in process_tree(pid):
+        for name, key in (("smaps_rollup", "Pss:"), ("status", "VmRSS:")):
+            try:
+                with open(f"/proc/{p}/{name}") as f:
+                    kb = next((int(line.split()[1]) for line in f if line.startswith(key)), None)
+            except OSError:
+                continue
+            if kb is not None:
+                total += kb
+                break
+    return total / 1024
+
+
+def wait_ready(url: str, timeout: float = 60) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(url, timeout=1).status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    return False
+
+
+def run_mode(mode: str, env: dict, args) -> dict | None:
+    worker_class, workers, per_worker = parse_mode(mode)
+    if worker_class == "gevent" and importlib.util.find_spec("gevent") is None:
+        print(f"{mode:<16} skipped (gevent not installed)")
+        return None
+
+    port = free_port()
+    state_dir = tempfile.mkdtemp(prefix="bench-workers-", dir=env["BENCH_TMP"])
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app.wsgi:app"],
+        cwd=ROOT,
+        env={
+            **env,
+            "STATE_DIR": state_dir,
+            "GUNICORN_BIND": f"127.0.0.1:{port}",
+            "GUNICORN_WORKERS": str(workers),
+            "GUNICORN_WORKER_CLASS": worker_class,
+            "GUNICORN_THREADS": str(per_worker if worker_class == "gthread" else 1),
+            "GUNICORN_WORKER_CONNECTIONS": str(per_worker if worker_class == "gevent" else 1000),
+            "HTTP_POOL_MAXSIZE": str(max(per_worker, 10)),
+        },
+        stdout=subprocess.DEVNULL,
+        stderr=open(os.path.join(state_dir, "gunicorn.log"), "w"),
+    )
+    try:
+        base = f"http://127.0.0.1:{port}"
+        if not wait_ready(f"{base}/healthz"):
+            print(f"{mode:<16} failed to start")
+            return None
+        idle = pss_mb(proc.pid)
+        samples, statuses, elapsed = fire(f"{base}/service_suspensions/", build_burst(args), args.concurrency)
+        loaded = pss_mb(proc.pid)
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+    samples.sort()
+    rate = len(samples) / elapsed
+    row = {
+        "mode": mode,
+        "req_per_sec": rate,
+        "p95_ms": samples[int(len(samples) * 0.95) - 1],
+        "idle_mb": idle,
+        "loaded_mb": loaded,
+        "req_per_sec_per_gb": rate / (loaded / 1024),
+        "statuses": statuses,
+    }
+    print(f"{mode:<16} {rate:8.1f} req/s  p95={row['p95_ms']:8.1f} ms  memory={loaded:7.1f} MB "
+          f"(idle {idle:6.1f})  {row['req_per_sec_per_gb']:8.1f} req/s per GB  {statuses}")
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--modes", nargs="+", default=["sync:2", "sync:8", "gthread:2x16", "gevent:2x200"])
+    parser.add_argument("--routers", type=int, default=4)
+    parser.add_argument("--leases", type=int, default=2000)
+    parser.add_argument("--webhooks", type=int, default=600)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--router-latency", type=float, default=0.02)
+    parser.add_argument("--uisp-latency", type=float, default=0.05)
+    parser.add_argument("--notify-latency", type=float, default=0.05)
+    args = parser.parse_args()
+    # build_burst() parameters
+    args.unsuspend_share, args.duplicate_share, args.flap_share = 0.1, 0.0, 0.0
+
+    routers = [FakeRouterOS(leases=args.leases, first_ip=f"100.{64 + i}.0.1", latency=args.router_latency).start()
+               for i in range(args.routers)]
+    uisp = FakeUISP(clients=args.routers * args.leases, latency=args.uisp_latency).start()
+    telegram = FakeTelegram(latency=args.notify_latency).start()
+    whatsapp = FakeWhatsApp(latency=args.notify_latency).start()
+    tmp = tempfile.mkdtemp(prefix="bench-workers-")
+    nas_config = os.path.join(tmp, "nas_config.json")
+    write_nas_config(nas_config, routers, [])
+
+    env = {
+        **os.environ,
+        "BENCH_TMP": tmp,
+        "NAS_CONFIG_PATH": nas_config,
+        "UISP_BASE_URL": uisp.url,
+        "UISP_APP_KEY": APP_KEY,
+        "TELEGRAM_API_URL": telegram.url,
+        "TELEGRAM_BOT_TOKEN": "bench",
+        "TELEGRAM_CHAT_ID": "1",
+        "WHATSAPP_API_URL": whatsapp.url,
+        "WHATSAPP_PHONE_NUMBER_ID": "bench",
+        "WHATSAPP_TOKEN": "bench",
+        "TLS_VERIFY": "false",
+        # Inline path: every request does its own router, UISP and WhatsApp I/O
+        "JOB_QUEUE_ENABLED": "false",
+        "NOTIFY_OUTBOX_ENABLED": "false",
+        "COALESCE_WINDOW_SECONDS": "0",
+        "ROUTER_MAX_CONCURRENCY": str(args.concurrency),
+    }
+    env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+
+    print(f"routers={args.routers} webhooks={args.webhooks} concurrency={args.concurrency} "
+          f"latency router/uisp/notify={args.router_latency * 1000:.0f}/{args.uisp_latency * 1000:.0f}/"
+          f"{args.notify_latency * 1000:.0f} ms")
+    try:
+        for mode in args.modes:
+            run_mode(mode, env, args)
+    finally:
+        shutil.rmtree(tmp, True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,545 @@
+"""
+Local HTTP stand-ins for the services the suspension pipeline talks to.
+"""
+
+import re
+import json
+import time
+import queue
+import socket
+import random
+import ipaddress
+import threading
+import socketserver
+from urllib.parse import urlsplit, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        with self.server.fake._lock:
+            self.server.fake.connections += 1
+
+    def _dispatch(self, method):
+        fake = self.server.fake
+        with fake._lock:
+            fake.in_flight += 1
+            fake.max_in_flight = max(fake.max_in_flight, fake.in_flight)
+        try:
+            self._respond(fake, method)
+        finally:
+            with fake._lock:
+                fake.in_flight -= 1
+
+    def _respond(self, fake, method):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        parts = urlsplit(self.path)
+        query = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+
+        if fake.latency:
+            time.sleep(fake.latency)
+        if fake.error_rate and random.random() < fake.error_rate:
+            status, payload = 503, {"error": "injected failure"}
+        else:
+            status, payload = fake.handle(method, parts.path, query, body)
+
+        data = json.dumps(payload).encode() if payload is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PATCH(self):
+        self._dispatch("PATCH")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+
+class FakeServer:
+    """Threaded HTTP server on 127.0.0.1 with injectable latency and errors."""
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests = 0
+        # Connections accepted, and the most requests served at once
+        self.connections = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def handle(self, method: str, path: str, query: dict, body: bytes):
+        raise NotImplementedError
+
+
+class FakeRouterOS(FakeServer):
+    """
+    RouterOS REST lease endpoints (/rest/ip/dhcp-server/lease).
+    With supports_filter=False it ignores ?address= and .proplist like
+    RouterOS builds without REST query support.
+    """
+
+    def __init__(self, leases: int = 20000, first_ip: str = "100.64.0.1",
+                 supports_filter: bool = True, **kwargs):
+        super().__init__(**kwargs)
+        self.supports_filter = supports_filter
+        self.leases = {}
+        base = int(ipaddress.IPv4Address(first_ip))
+        for i in range(leases):
+            lease_id = f"*{i + 1:X}"
+            self.leases[lease_id] = {
+                ".id": lease_id,
+                "address": str(ipaddress.IPv4Address(base + i)),
+                "mac-address": f"02:00:{(i >> 24) & 255:02X}:{(i >> 16) & 255:02X}:{(i >> 8) & 255:02X}:{i & 255:02X}",
+                "client-id": f"1:02:00:{i:08x}",
+                "server": "dhcp-clients",
+                "status": "bound",
+                "host-name": f"cpe-{i}",
+                "comment": f"CID{10000 + i}",
+                "dynamic": "false",
+                "disabled": "false",
+                "block-access": "no",
+                "last-seen": "2m13s",
+                "expires-after": "23h57m47s",
+            }
+        self.by_address = {l["address"]: l for l in self.leases.values()}
+        self.address_lists: dict[str, dict] = {}
+        self._next_entry = 0
+        self.table_reads = 0
+
+    def handle(self, method, path, query, body):
+        with self._lock:
+            self.requests += 1
+        if path == "/rest/execute" and method == "POST":
+            request = json.loads(body or b"{}")
+            if "as-string" in request:
+                return self._execute(request.get("script", ""))
+            # Like RouterOS: without as-string the script runs as a background job
+            threading.Timer(0.05, self._execute, (request.get("script", ""),)).start()
+            return 200, {"ret": "*1"}
+        if path == "/rest/system/identity" and method == "GET":
+            return 200, {"name": "fake-router"}
+        if path.startswith("/rest/ip/firewall/address-list") and method == "GET":
+            return 200, self.address_list_print(query if self.supports_filter else {})
+        if path == "/rest/ip/firewall/address-list" and method == "PUT":
+            props = json.loads(body or b"{}")
+            error = self.address_list_add(props)
+            if error:
+                return 400, {"error": 400, "message": "Bad Request", "detail": error}
+            return 201, self.address_list_print({"list": props.get("list"), "address": props.get("address")})[0]
+        prefix = "/rest/ip/dhcp-server/lease"
+        if not path.startswith(prefix):
+            return 404, {"error": 404, "message": "Not Found"}
+
+        lease_id = path[len(prefix):].strip("/")
+        if method == "GET" and not lease_id:
+            if "address" not in query:
+                with self._lock:
+                    self.table_reads += 1
+            return 200, self._query(query)
+        if method == "PATCH" and lease_id:
+            lease = self.leases.get(lease_id)
+            if not lease:
+                return 404, {"error": 404, "message": "Not Found", "detail": "no such item"}
+            lease.update(json.loads(body or b"{}"))
+            return 200, lease
+        return 400, {"error": 400, "message": "Bad Request"}
+
+    def _query(self, query):
+        if not self.supports_filter:
+            return list(self.leases.values())
+
+        if "address" in query:
+            lease = self.by_address.get(query["address"])
+            rows = [lease] if lease else []
+        else:
+            rows = list(self.leases.values())
+
+        proplist = query.get(".proplist")
+        if proplist:
+            fields = proplist.split(",")
+            rows = [{k: r[k] for k in fields if k in r} for r in rows]
+        return rows
+
+    # Firewall address-list entries, shared by the REST and API stand-ins
+
+    def address_list_print(self, query: dict) -> list[dict]:
+        filters = {k: v for k, v in query.items() if not k.startswith(".")}
+        with self._lock:
+            rows = [dict(e) for e in self.address_lists.values()
+                    if all(e.get(k) == v for k, v in filters.items())]
+        proplist = query.get(".proplist")
+        if proplist:
+            fields = proplist.split(",")
+            rows = [{k: r[k] for k in fields if k in r} for r in rows]
+        return rows
+
+    def address_list_add(self, props: dict) -> str | None:
+        """Add an entry; returns an error like RouterOS for duplicates and bad addresses."""
+        try:
+            ipaddress.ip_network(props.get("address", ""), strict=False)
+        except ValueError:
+            return "invalid value for argument address"
+        with self._lock:
+            if any(e["list"] == props.get("list") and e["address"] == props.get("address")
+                   for e in self.address_lists.values()):
+                return "failure: already have such entry"
+            self._next_entry += 1
+            entry_id = f"*{self._next_entry:X}"
+            self.address_lists[entry_id] = {".id": entry_id, "dynamic": "false", **props}
+        return None
+
+    def address_list_remove(self, ids: list[str]) -> str | None:
+        with self._lock:
+            if any(i not in self.address_lists for i in ids):
+                return "no such item"
+            for i in ids:
+                del self.address_lists[i]
+        return None
+
+    def _execute(self, script: str):
+        # Understands the script lines MikroTikClient generates
+        for line in script.splitlines():
+            if " address-list add " in line:
+                props = {k: v.replace('\\"', '"') for k, v in _SCRIPT_ARG.findall(line)}
+                error = self.address_list_add(props)
+                if error and not line.startswith(":do "):
+                    return 400, {"error": 400, "message": "Bad Request", "detail": error}
+            elif " address-list remove numbers=" in line:
+                error = self.address_list_remove(line.split("numbers=", 1)[1].strip().split(","))
+                if error:
+                    return 400, {"error": 400, "message": "Bad Request", "detail": error}
+            else:
+                return 400, {"error": 400, "message": "Bad Request", "detail": f"unsupported: {line}"}
+        return 200, {"ret": ""}
+
+
+_SCRIPT_ARG = re.compile(r'([\w-]+)="((?:[^"\\]|\\.)*)"')
+
+
+def client_ip(i: int, first_ip: str = "100.64.0.1") -> str:
+    """Service IP of the i-th fake client, matching FakeRouterOS lease order."""
+    return str(ipaddress.IPv4Address(int(ipaddress.IPv4Address(first_ip)) + i))
+
+
+class FakeUISP(FakeServer):
+    """
+    UISP CRM client and service endpoints. Client i has id first_id + i,
+    an active service on client_ip(i) and a WhatsApp messaging number.
+    """
+
+    def __init__(self, clients: int = 20000, first_id: int = 10000,
+                 first_ip: str = "100.64.0.1", **kwargs):
+        super().__init__(**kwargs)
+        self.clients = {}
+        self.services = []
+        for i in range(clients):
+            client_id = first_id + i
+            self.clients[client_id] = {
+                "id": client_id,
+                "firstName": "Client",
+                "lastName": str(client_id),
+                "accountOutstanding": round(random.uniform(200, 1500), 2),
+                "isArchived": False,
+                "attributes": [
+                    {"key": "notificationService", "value": "whatsapp"},
+                    {"key": "messagingNumber", "value": f"2760{client_id:07d}"},
+                ],
+                "contacts": [{"phone": f"2760{client_id:07d}", "email": f"c{client_id}@example.net"}],
+            }
+            self.services.append({
+                "id": 500000 + i,
+                "clientId": client_id,
+                "status": 1,
+                "attributes": [{"key": "ipAddress", "value": client_ip(i, first_ip)}],
+            })
+
+    def handle(self, method, path, query, body):
+        with self._lock:
+            self.requests += 1
+        prefix = "/crm/api/v1.0/clients"
+        if method == "GET" and path == "/crm/api/v1.0/version":
+            return 200, {"version": "2.4.0"}
+        if method != "GET" or not path.startswith(prefix):
+            return 404, {"code": 404, "message": "Not Found"}
+
+        rest = path[len(prefix):].strip("/")
+        if rest == "services":
+            return 200, self._page(self.services, query)
+        if not rest:
+            return 200, self._page(list(self.clients.values()), query)
+        client = self.clients.get(int(rest)) if rest.isdigit() else None
+        if client is None:
+            return 404, {"code": 404, "message": "Client not found"}
+        return 200, client
+
+    @staticmethod
+    def _page(rows, query):
+        offset = int(query.get("offset", 0))
+        limit = int(query.get("limit", len(rows)))
+        return rows[offset:offset + limit]
+
+
+class FakeTelegram(FakeServer):
+    """Telegram Bot API sendMessage; keeps the texts it received."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.messages = []
+
+    def handle(self, method, path, query, body):
+        with self._lock:
+            self.requests += 1
+        if method != "POST" or not path.endswith("/sendMessage"):
+            return 404, {"ok": False, "error_code": 404, "description": "Not Found"}
+        message = json.loads(body or b"{}")
+        with self._lock:
+            self.messages.append(message.get("text", ""))
+            message_id = len(self.messages)
+        return 200, {"ok": True, "result": {"message_id": message_id}}
+
+
+class FakeWhatsApp(FakeServer):
+    """
+    WhatsApp Cloud API /{version}/{phone_id}/messages. throttle_rate is the
+    share of sends answered 429 like Graph's per-number throughput limit.
+    """
+
+    def __init__(self, throttle_rate: float = 0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.throttle_rate = throttle_rate
+        self.sent = 0
+        self.throttled = 0
+
+    def handle(self, method, path, query, body):
+        if method != "POST" or not path.endswith("/messages"):
+            return 404, {"error": {"message": "Unknown path", "code": 404}}
+        with self._lock:
+            self.requests += 1
+            if self.throttle_rate and random.random() < self.throttle_rate:
+                self.throttled += 1
+                return 429, {"error": {"message": "Rate limit hit", "code": 130429}}
+            self.sent += 1
+            count = self.sent
+        to = json.loads(body or b"{}").get("to")
+        return 200, {
+            "messaging_product": "whatsapp",
+            "contacts": [{"input": to, "wa_id": to}],
+            "messages": [{"id": f"wamid.{count:012d}"}],
+        }
+
+
+class FakeRouterOSAPI:
+    """
+    RouterOS native API stand-in (plain 8728 protocol) serving the lease
+    table of a FakeRouterOS: /login, print with ?queries and .proplist,
+    set, and tagged (pipelined) commands. latency delays each reply from
+    the moment its command arrived, like a network round trip.
+    """
+
+    def __init__(self, router: FakeRouterOS, username: str = "api", password: str = "secret",
+                 latency: float = 0.0):
+        self.router = router
+        self.username = username
+        self.password = password
+        self.latency = latency
+        self.commands = 0
+        self.logins = 0
+        self._lock = threading.Lock()
+        self._server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _ApiHandler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def execute(self, words: list[str], logged_in: bool) -> list[list[str]]:
+        """Reply sentences for one command (without the .tag word)."""
+        command = words[0]
+        attrs, queries = {}, {}
+        for word in words[1:]:
+            if word.startswith("="):
+                key, _, value = word[1:].partition("=")
+                attrs[key] = value
+            elif word.startswith("?"):
+                key, _, value = word[1:].partition("=")
+                queries[key] = value
+
+        if command == "/login":
+            if attrs.get("name") == self.username and attrs.get("password") == self.password:
+                with self._lock:
+                    self.logins += 1
+                return [["!done"]]
+            return [["!trap", "=message=invalid user name or password (6)"], ["!done"]]
+        if not logged_in:
+            return [["!fatal", "not logged in"]]
+
+        with self._lock:
+            self.commands += 1
+            self.router.requests += 1
+        leases = self.router.leases
+        if command == "/system/identity/print":
+            return [["!re", "=name=fake-router"], ["!done"]]
+        if command == "/ip/dhcp-server/lease/print":
+            rows = [
+                l for l in (leases.values() if "address" not in queries
+                            else [self.router.by_address.get(queries["address"])])
+                if l and all(l.get(k) == v for k, v in queries.items())
+            ]
+            fields = attrs.get(".proplist", "").split(",") if attrs.get(".proplist") else None
+            return [["!re", *(f"={k}={v}" for k, v in r.items() if fields is None or k in fields)]
+                    for r in rows] + [["!done"]]
+        if command == "/ip/firewall/address-list/print":
+            query = {**queries, ".proplist": attrs.get(".proplist", "")} if attrs.get(".proplist") else queries
+            return [["!re", *(f"={k}={v}" for k, v in r.items())]
+                    for r in self.router.address_list_print(query)] + [["!done"]]
+        if command == "/ip/firewall/address-list/add":
+            error = self.router.address_list_add(attrs)
+            return ([["!trap", f"=message={error}"]] if error else []) + [["!done"]]
+        if command == "/ip/firewall/address-list/remove":
+            error = self.router.address_list_remove(attrs.get("numbers", "").split(","))
+            return ([["!trap", f"=message={error}"]] if error else []) + [["!done"]]
+        if command == "/ip/dhcp-server/lease/set":
+            lease = leases.get(attrs.pop(".id", None))
+            if lease is None:
+                return [["!trap", "=category=0", "=message=no such item"], ["!done"]]
+            lease.update(attrs)
+            return [["!done"]]
+        return [["!trap", "=category=0", "=message=no such command"], ["!done"]]
+
+
+def _api_length(n: int) -> bytes:
+    if n < 0x80:
+        return bytes([n])
+    if n < 0x4000:
+        return (n | 0x8000).to_bytes(2, "big")
+    if n < 0x200000:
+        return (n | 0xC00000).to_bytes(3, "big")
+    return (n | 0xE0000000).to_bytes(4, "big")
+
+
+class _ApiHandler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def _read_sentence(self) -> list[str] | None:
+        words = []
+        while True:
+            first = self.rfile.read(1)
+            if not first:
+                return None
+            n = first[0]
+            if n >= 0xE0:
+                n = ((n & 0x0F) << 24) | int.from_bytes(self.rfile.read(3), "big")
+            elif n >= 0xC0:
+                n = ((n & 0x1F) << 16) | int.from_bytes(self.rfile.read(2), "big")
+            elif n >= 0x80:
+                n = ((n & 0x3F) << 8) | self.rfile.read(1)[0]
+            if n == 0:
+                return words
+            words.append(self.rfile.read(n).decode())
+
+    def handle(self):
+        fake = self.server.fake
+        replies = queue.Queue()
+        writer = threading.Thread(target=self._write_replies, args=(replies,), daemon=True)
+        writer.start()
+        logged_in = False
+        try:
+            while True:
+                words = self._read_sentence()
+                if words is None:
+                    return
+                if not words:
+                    continue
+                due = time.monotonic() + fake.latency
+                tag = next((w for w in words if w.startswith(".tag=")), None)
+                words = [w for w in words if not w.startswith(".tag=")]
+                sentences = fake.execute(words, logged_in)
+                if words[0] == "/login" and sentences[0][0] == "!done":
+                    logged_in = True
+
+                out = bytearray()
+                for sentence in sentences:
+                    for word in sentence + ([tag] if tag else []):
+                        data = word.encode()
+                        out += _api_length(len(data)) + data
+                    out += b"\x00"
+                replies.put((due, bytes(out)))
+                if sentences[0][0] == "!fatal":
+                    return
+        finally:
+            replies.put(None)
+            writer.join()
+
+    def _write_replies(self, replies: "queue.Queue"):
+        # Replies leave `latency` after their command arrived, so pipelined
+        # commands share one round trip
+        while True:
+            item = replies.get()
+            if item is None:
+                return
+            due, data = item
+            wait = due - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                self.wfile.write(data)
+            except OSError:
+                return
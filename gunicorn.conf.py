@@ -0,0 +1,78 @@
+"""
+Gunicorn settings. Run with: gunicorn -c gunicorn.conf.py app.wsgi:app
+
+For /metrics to cover every worker, export PROMETHEUS_MULTIPROC_DIR (an
+empty, writable directory, cleared before each start).
+
+Each worker finishes its warmup (config, router and UISP connections,
+lease tables) before it accepts connections, so the first webhooks after a
+deploy or a worker recycle are not served cold. WARMUP_TIMEOUT_SECONDS
+bounds the whole warmup, however many routers there are; keep it below
+GUNICORN_TIMEOUT. The app is not preloaded in the master: worker
+threads and sockets must be created after fork.
+
+Worker classes (GUNICORN_WORKER_CLASS):
+- sync (default): one request per process.
+- gthread: GUNICORN_THREADS requests per process. Set HTTP_POOL_MAXSIZE to
+  at least the thread count so requests do not queue for a connection.
+- gevent (pip install gevent): up to GUNICORN_WORKER_CONNECTIONS requests
+  per process on greenlets. Router calls stay capped per router by
+  ROUTER_MAX_CONCURRENCY; HTTP pools keep HTTP_POOL_MAXSIZE connections per
+  host and open short-lived extra ones beyond that. SQLite state
+  calls do not yield, so keep STATE_DIR on local disk.
+With JOB_QUEUE_ENABLED=true webhooks only touch SQLite, so sync workers are
+usually enough; the threaded modes pay off for inline processing and the
+bulk endpoint.
+
+With SHARD_ENABLED=true each router is owned by one worker, which warms it
+and runs all of its queued jobs, so its session and lease cache stay warm
+in one place. A worker that exits hands its routers and running jobs back
+(child_exit). /batch and /reconcile are not sharded: they run where they
+land and reach every router.
+"""
+
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("GUNICORN_WORKERS", "2"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "sync")
+threads = int(os.getenv("GUNICORN_THREADS", "1"))
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "1000"))
+preload_app = False
+
+
+def post_worker_init(worker):
+    # create_app() started the warmup in the background; wait for it here
+    from app.services.warmup import get_warmup
+
+    get_warmup().run()
+
+
+def child_exit(server, worker):
+    from app.core.metrics import mark_process_dead
+
+    mark_process_dead(worker.pid)
+    release_shard_member(worker.pid)
+
+
+def release_shard_member(pid: int):
+    # A crashed worker cannot leave by itself: hand its routers and running
+    # jobs to the others now instead of after the heartbeat and visibility timeouts
+    import socket
+    import logging
+    from app.core.config import get_config
+    from app.services.worker import get_job_queue
+
+    try:
+        cfg = get_config()
+        if not (cfg.shard_enabled and cfg.job_queue_enabled):
+            return
+        member_id = f"{socket.gethostname()}:{pid}"
+        queue = get_job_queue(cfg)
+        queue.leave(member_id)
+        requeued = queue.release_member(member_id)
+        if requeued:
+            logging.warning(f"Requeued {requeued} running job(s) of exited worker {pid}")
+    except Exception as e:
+        logging.error(f"Failed to release shard member {pid}: {e}")